@@ -0,0 +1,109 @@
+"""ASGI-вход приложения для асинхронных серверов.
+
+Запуск, например: ``uvicorn asgi:app --workers 2``. Здесь обработка
+сообщения не держит поток на время ожидания модели, поэтому один event loop
+обслуживает тысячи одновременных диалогов. Flask-приложение из ``main.py``
+остаётся для WSGI-развёртываний.
+"""
+
+import json
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message_async
+from omnidisp.app.knowledge.loader import get_snapshot
+from omnidisp.app.llm.llm_client import close_async_llm_client
+from omnidisp.app.utils.prefork import readiness
+from omnidisp.config.settings import DISP_REQUEST_DEADLINE
+
+MAX_BODY_BYTES = 1024 * 1024
+
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+
+async def app(scope: dict, receive: Receive, send: Send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    route = (scope["method"], scope["path"])
+    if route == ("GET", "/"):
+        await _send_json(send, 200, {"status": "ok"})
+    elif route == ("GET", "/ready"):
+        status = readiness()
+        await _send_json(send, 200 if status["ready"] else 503, status)
+    elif route == ("POST", "/api/disp"):
+        status, data = await api_disp(receive)
+        await _send_json(send, status, data)
+    elif scope["path"] in ("/", "/ready", "/api/disp"):
+        await _send_json(send, 405, {"error": "method not allowed"})
+    else:
+        await _send_json(send, 404, {"error": "not found"})
+
+
+async def api_disp(receive: Receive) -> Tuple[int, Dict[str, object]]:
+    body = await _read_body(receive)
+    if body is None:
+        return 413, {"error": "request too large"}
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+
+    text = data.get("text", "")
+    is_first_message = bool(data.get("is_first_message", False))
+    if not text:
+        return 400, {"error": "empty text"}
+
+    result = await handle_message_async(
+        text=text, is_first_message=is_first_message, deadline=DISP_REQUEST_DEADLINE
+    )
+    return 200, result
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_snapshot()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_llm_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _read_body(receive: Receive) -> Optional[bytes]:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send: Send, status: int, data: Dict[str, object]) -> None:
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,74 @@
+"""Конфигурация gunicorn для продового запуска (см. omnidisp/scripts/run_prod.sh).
+
+Приложение загружается в master-процессе до fork (preload_app): база знаний
+и её индексы строятся один раз, а воркеры получают эти страницы памяти
+copy-on-write. Если проверка готовности в master не прошла, сервер не стартует.
+
+Перезагрузка без простоя: ``kill -HUP <pid master>`` — master перечитывает
+базу знаний, запускает новых воркеров и мягко останавливает старых.
+Воркер перезапускается и сам, обработав SERVER_MAX_REQUESTS запросов.
+"""
+
+import sys
+
+from omnidisp.app.utils import prefork
+from omnidisp.config.settings import (
+    SERVER_BIND,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_MAX_REQUESTS,
+    SERVER_MAX_REQUESTS_JITTER,
+    SERVER_THREADS,
+    SERVER_TIMEOUT,
+    SERVER_WORKER_CLASS,
+    SERVER_WORKERS,
+)
+
+bind = SERVER_BIND
+workers = SERVER_WORKERS
+worker_class = SERVER_WORKER_CLASS
+threads = SERVER_THREADS
+preload_app = True
+max_requests = SERVER_MAX_REQUESTS
+max_requests_jitter = SERVER_MAX_REQUESTS_JITTER
+timeout = SERVER_TIMEOUT
+graceful_timeout = SERVER_GRACEFUL_TIMEOUT
+keepalive = 5
+
+# Лимиты на весь сервер (скорость отправки в Telegram) делятся между воркерами.
+prefork.configure_server(workers)
+
+
+def when_ready(server):  # noqa: ANN001, ANN201
+    """Приложение загружено в master: проверяем готовность и замораживаем память."""
+
+    status = prefork.warm_up()
+    if not status["ready"]:
+        server.log.error(
+            "omnidisp is not ready: %s %s", status["checks"], status.get("error", "")
+        )
+        sys.exit(1)
+    frozen = prefork.freeze_shared_memory()
+    server.log.info(
+        "omnidisp ready: knowledge v%s, %s categories, %s objects shared with workers",
+        status["knowledge_version"],
+        status["categories"],
+        frozen,
+    )
+
+
+def post_fork(server, worker):  # noqa: ANN001, ANN201
+    """В воркере: /admin/knowledge/reload должен перечитывать базу через master."""
+
+    prefork.mark_worker(server.pid)
+
+
+def on_reload(server):  # noqa: ANN001, ANN201
+    """SIGHUP: новая база знаний строится в master до запуска новых воркеров."""
+
+    try:
+        status = prefork.reload_shared_knowledge()
+    except Exception:  # noqa: BLE001
+        # Исключение из хука остановило бы master; новые воркеры получат прежнюю базу.
+        server.log.exception("omnidisp knowledge reload failed, keeping the current one")
+        return
+    server.log.info("omnidisp knowledge reloaded: v%s", status["knowledge_version"])
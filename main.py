@@ -1,13 +1,40 @@
-import requests
-from flask import Flask, jsonify, request
-
-from omnidisp.app.dispatcher.dispatcher_controller import handle_message
-from omnidisp.config.settings import TELEGRAM_BOT_TOKEN
+import hmac
+import json
+
+from flask import Flask, Response, jsonify, request
+
+from omnidisp.app.dispatcher.disp_logic import TRACE_MODES
+from omnidisp.app.dispatcher.dispatcher_controller import (
+    handle_chat_message,
+    handle_message,
+    handle_message_stream,
+    handle_messages,
+)
+from omnidisp.app.knowledge.loader import get_snapshot, reload_knowledge
+from omnidisp.app.telegram.sender import TelegramSender
+from omnidisp.app.utils import metrics
+from omnidisp.app.utils import prefork
+from omnidisp.app.utils.prefork import readiness
+from omnidisp.config.settings import (
+    ADMIN_TOKEN,
+    DISP_BATCH_MAX_MESSAGES,
+    DISP_REQUEST_DEADLINE,
+    LLM_BATCH_CONCURRENCY,
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_SEND_TRACE,
+)
 
 app = Flask(__name__)
+get_snapshot()
 
 TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}" if TELEGRAM_BOT_TOKEN else ""
-seen_chats = set()
+# TELEGRAM_GLOBAL_RATE — лимит бота, а не процесса: под gunicorn делим его между воркерами.
+telegram_sender = (
+    TelegramSender(TELEGRAM_API, global_rate=TELEGRAM_GLOBAL_RATE / prefork.server_workers())
+    if TELEGRAM_API
+    else None
+)
 
 
 @app.route("/", methods=["GET"])
@@ -15,19 +42,97 @@ def home():
     return jsonify({"status": "ok"})
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    status = readiness()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
 @app.route("/api/disp", methods=["POST"])
 def api_disp():
     data = request.get_json(silent=True) or {}
     text = data.get("text", "")
     is_first_message = bool(data.get("is_first_message", False))
+    trace = data.get("trace", "text")
 
     if not text:
         return jsonify({"error": "empty text"}), 400
-
-    result = handle_message(text=text, is_first_message=is_first_message)
+    if trace not in TRACE_MODES:
+        return jsonify({"error": f"trace must be one of {', '.join(TRACE_MODES)}"}), 400
+
+    result = handle_message(
+        text=text,
+        is_first_message=is_first_message,
+        trace=trace,
+        deadline=DISP_REQUEST_DEADLINE,
+    )
     return jsonify(result), 200
 
 
+@app.route("/api/disp/stream", methods=["POST"])
+def api_disp_stream():
+    data = request.get_json(silent=True) or {}
+    text = data.get("text", "")
+    is_first_message = bool(data.get("is_first_message", False))
+
+    if not text:
+        return jsonify({"error": "empty text"}), 400
+
+    internal_trace, answer_parts = handle_message_stream(
+        text=text, is_first_message=is_first_message, deadline=DISP_REQUEST_DEADLINE
+    )
+
+    def events():
+        yield _sse_event("trace", {"internal_trace": internal_trace})
+        parts = []
+        for part in answer_parts:
+            parts.append(part)
+            yield _sse_event("answer", {"delta": part})
+        yield _sse_event("done", {"client_answer": "".join(parts)})
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/api/disp/batch", methods=["POST"])
+def api_disp_batch():
+    data = request.get_json(silent=True) or {}
+    messages = data.get("messages")
+
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "empty messages"}), 400
+    if len(messages) > DISP_BATCH_MAX_MESSAGES:
+        return jsonify({"error": f"too many messages (max {DISP_BATCH_MAX_MESSAGES})"}), 400
+    if not all(isinstance(item, dict) and item.get("text") for item in messages):
+        return jsonify({"error": "every message needs a non-empty text"}), 400
+    trace = data.get("trace", "text")
+    if trace not in TRACE_MODES:
+        return jsonify({"error": f"trace must be one of {', '.join(TRACE_MODES)}"}), 400
+
+    try:
+        concurrency = int(data.get("concurrency") or LLM_BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        return jsonify({"error": "bad concurrency"}), 400
+    concurrency = min(max(concurrency, 1), LLM_BATCH_CONCURRENCY)
+
+    results = handle_messages(
+        messages, max_in_flight=concurrency, trace=trace, deadline=DISP_REQUEST_DEADLINE
+    )
+
+    def lines():
+        for index, result in enumerate(results):
+            yield json.dumps({"index": index, **result}, ensure_ascii=False) + "\n"
+
+    return Response(lines(), mimetype="application/x-ndjson")
+
+
 @app.route("/api/tg", methods=["POST"])
 def api_telegram():
     update = request.get_json(silent=True) or {}
@@ -38,27 +143,62 @@ def api_telegram():
     except Exception:
         return jsonify({"status": "ignored"}), 200
 
-    is_first = chat_id not in seen_chats
-    if is_first:
-        seen_chats.add(chat_id)
+    result = handle_chat_message(
+        chat_id,
+        message,
+        trace="text" if TELEGRAM_SEND_TRACE else "none",
+        deadline=DISP_REQUEST_DEADLINE,
+    )
 
-    result = handle_message(message, is_first_message=is_first)
-
-    trace = result.get("internal_trace", "")
     client_answer = result.get("client_answer", "")
 
-    text_to_send = f"{trace}\n\nCLIENT ANSWER:\n{client_answer}"
+    if TELEGRAM_SEND_TRACE:
+        trace = result.get("internal_trace", "")
+        text_to_send = f"{trace}\n\nCLIENT ANSWER:\n{client_answer}"
+    else:
+        text_to_send = client_answer
 
-    if TELEGRAM_API:
-        send_url = f"{TELEGRAM_API}/sendMessage"
-        payload = {"chat_id": chat_id, "text": text_to_send}
-        try:
-            requests.post(send_url, json=payload, timeout=10)
-        except Exception:
-            pass
+    if telegram_sender is not None and not telegram_sender.send_message(chat_id, text_to_send):
+        return jsonify({"status": "dropped"}), 200
 
     return jsonify({"status": "ok"}), 200
 
 
+@app.route("/api/tg/queue", methods=["GET"])
+def api_telegram_queue():
+    if telegram_sender is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **telegram_sender.metrics()}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/admin/knowledge/reload", methods=["POST"])
+def admin_reload_knowledge():
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return jsonify({"error": "forbidden"}), 403
+
+    previous_version = get_snapshot().version
+    if prefork.request_master_reload():
+        # Воркер не перечитывает базу сам: master перечитает её и заменит всех воркеров.
+        return jsonify({"status": "reloading", "previous_version": previous_version}), 202
+    snapshot = reload_knowledge(force=True)
+    return (
+        jsonify(
+            {
+                "status": "ok",
+                "previous_version": previous_version,
+                "version": snapshot.version,
+                "categories": len(snapshot.data),
+            }
+        ),
+        200,
+    )
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000)
@@ -1,111 +1,235 @@
-from typing import Dict, List
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import re
 
+from omnidisp.app.knowledge import patterns
+from omnidisp.app.knowledge.answer_templates import select_answer
+from omnidisp.app.knowledge.fuzzy_index import apply_corrections
 from omnidisp.app.knowledge.loader import (
-    FORBIDDEN_TASKS,
-    KEYWORD_TO_CATEGORY,
     find_recommend_question,
+    get_answer_templates,
+    get_category_index,
+    get_fuzzy_index,
     get_min_price,
-    load_knowledge,
+    get_phrase_matcher,
+    get_snapshot,
+    get_token_index,
+    pinned_snapshot,
+    schedule_reload_check,
 )
-from omnidisp.app.llm.llm_client import LLMClient
-from omnidisp.app.llm.prompt_builder import build_disp_prompt
+from omnidisp.app.knowledge.token_index import TOKEN_RE
+from omnidisp.app.llm.answer_cache import get_answer_cache, is_cacheable_plan
+from omnidisp.app.llm.deadline import request_deadline
+from omnidisp.app.llm.llm_client import (
+    LLMStreamError,
+    get_async_llm_client,
+    get_llm_client,
+    llm_circuit_state,
+)
+from omnidisp.app.llm.prompt_builder import build_plan_key, compile_disp_prompt
+from omnidisp.app.llm.single_flight import (
+    SingleFlightTimeout,
+    get_async_single_flight,
+    get_single_flight,
+)
+from omnidisp.app.utils import metrics, request_log
 from omnidisp.app.utils.text_normalizer import normalize_text
+from omnidisp.config.settings import (
+    ANSWER_TEMPLATES_ENABLED,
+    KNOWLEDGE_FUZZY_BUDGET_MS,
+    KNOWLEDGE_FUZZY_MAX_DISTANCE,
+    LLM_BATCH_CONCURRENCY,
+)
 
-PRICE_QUESTION_PATTERNS = [
-    "сколько стоит",
-    "какая цена",
-    "по цене",
-    "стоимость",
-]
-
-load_knowledge()
-
+from .message import Message
 
-def process(text: str, is_first_message: bool = False) -> Dict[str, str]:
-    """Базовая точка обработки входящего сообщения в режиме DISP."""
 
-    tasks = split_to_tasks(text)
-    stop_result = check_stop_factors(tasks)
-    categories = detect_categories(text, tasks)
-    step = detect_dialog_step(
-        text=text, is_first_message=is_first_message, categories=categories
+def process(
+    text: str,
+    is_first_message: bool = False,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Dict[str, object]:
+    """Базовая точка обработки входящего сообщения в режиме DISP.
+
+    Все этапы работают с одним снимком базы знаний, даже если во время
+    обработки опубликован новый. ``trace`` — вид INTERNAL TRACE в ответе:
+    "text", "structured" (словарь) или "none" (трасса не собирается).
+    ``deadline`` — бюджет времени в секундах: ожидание модели не выходит
+    за него, а после него вместо ответа модели отдаётся запасной.
+    """
+
+    result, _analysis = process_with_analysis(
+        text=text, is_first_message=is_first_message, trace=trace, deadline=deadline
     )
+    return result
+
 
-    internal_trace = build_trace(
+def process_with_analysis(
+    text: str,
+    is_first_message: bool = False,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Tuple[Dict[str, object], "MessageAnalysis"]:
+    """То же, что process, плюс результат разбора (шаг, категории) для состояния диалога."""
+
+    metrics.inc("omnidisp_messages_total", entry="sync")
+    schedule_reload_check()
+    with request_log.request_record("sync", text, is_first_message), request_deadline(
+        deadline
+    ), metrics.stage_timer("process"), pinned_snapshot():
+        analysis = analyze_message(text=text, is_first_message=is_first_message)
+        draft = draft_client_answer(**analysis.answer_kwargs())
+        internal_trace = trace_output(analysis, trace, draft)
+        client_answer = answer_draft(draft)
+        return _with_trace(internal_trace, client_answer), analysis
+
+
+def process_stream(
+    text: str, is_first_message: bool = False, deadline: Optional[float] = None
+) -> Tuple[str, Iterator[str]]:
+    """Потоковый вариант process: INTERNAL TRACE сразу и ответ по частям.
+
+    Детерминированные этапы выполняются до возврата, поэтому трассу можно
+    отдать клиенту, пока модель ещё генерирует ответ. Бюджет deadline
+    отсчитывается с начала чтения частей ответа.
+    """
+
+    metrics.inc("omnidisp_messages_total", entry="stream")
+    schedule_reload_check()
+    record = request_log.start_record("stream", text, is_first_message)
+    try:
+        with record.active(), pinned_snapshot():
+            analysis = analyze_message(text=text, is_first_message=is_first_message)
+            draft = draft_client_answer(**analysis.answer_kwargs())
+            internal_trace = trace_output(analysis, draft=draft)
+    except BaseException:
+        record.emit()
+        raise
+    return internal_trace, _stream_within(draft, deadline, record)  # type: ignore[return-value]
+
+
+def _stream_within(
+    draft: "ClientAnswerDraft", deadline: Optional[float], record: request_log.PendingRecord
+) -> Iterator[str]:
+    # бюджет и запись журнала ставятся в генераторе: ContextVar должен быть
+    # задан там, где итерируют ответ, а не там, где его создали; запись
+    # уходит в журнал, когда ответ дочитан или поток закрыт
+    try:
+        with record.active(), request_deadline(deadline):
+            yield from stream_client_answer(draft)
+    finally:
+        record.emit()
+
+
+async def process_async(
+    text: str,
+    is_first_message: bool = False,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Dict[str, object]:
+    """Асинхронный вариант process: ожидание модели не блокирует поток."""
+
+    metrics.inc("omnidisp_messages_total", entry="async")
+    schedule_reload_check()
+    with request_log.request_record("async", text, is_first_message), request_deadline(
+        deadline
+    ), metrics.stage_timer("process"), pinned_snapshot():
+        analysis = analyze_message(text=text, is_first_message=is_first_message)
+        draft = draft_client_answer(**analysis.answer_kwargs())
+        internal_trace = trace_output(analysis, trace, draft)
+        client_answer = await answer_draft_async(draft)
+        return _with_trace(internal_trace, client_answer)
+
+
+class MessageAnalysis(NamedTuple):
+    """Результат детерминированных этапов разбора сообщения."""
+
+    text: str
+    is_first_message: bool
+    tasks: List[str]
+    stop_result: Dict[str, object]
+    categories: Dict[str, object]
+    step: str
+    message: Optional[Message] = None
+
+    def trace_kwargs(self) -> Dict[str, object]:
+        return {
+            "text": self.text,
+            "tasks": self.tasks,
+            "step": self.step,
+            "stop_result": self.stop_result,
+            "categories": self.categories,
+        }
+
+    def answer_kwargs(self) -> Dict[str, object]:
+        return {
+            "step": self.step,
+            "stop_result": self.stop_result,
+            "categories": self.categories,
+            "text": self.text,
+            "is_first_message": self.is_first_message,
+            "message": self.message,
+        }
+
+
+def analyze_message(text: str, is_first_message: bool) -> MessageAnalysis:
+    """Задачи, стоп-факторы, категории и шаг диалога — без обращения к модели."""
+
+    with metrics.stage_timer("split_tasks"):
+        message = Message.parse(text)
+    with metrics.stage_timer("stop_factors"):
+        stop_result = check_stop_factors(message)
+    with metrics.stage_timer("categories"):
+        categories = detect_categories(message)
+    with metrics.stage_timer("dialog_step"):
+        step = detect_dialog_step(
+            text=message, is_first_message=is_first_message, categories=categories
+        )
+    request_log.note(tasks_count=len(message.tasks))
+    return MessageAnalysis(
         text=text,
-        tasks=tasks,
-        step=step,
+        is_first_message=is_first_message,
+        tasks=message.tasks,
         stop_result=stop_result,
         categories=categories,
-    )
-
-    client_answer = build_client_answer(
         step=step,
-        stop_result=stop_result,
-        categories=categories,
-        text=text,
-        is_first_message=is_first_message,
+        message=message,
     )
 
-    return {
-        "internal_trace": internal_trace,
-        "client_answer": client_answer,
-    }
-
 
 def split_to_tasks(text: str) -> List[str]:
     """Разбивает исходное сообщение на подзадачи."""
 
-    parts = re.split(r";|\.|\sи\s|,", text)
-    tasks = [part.strip() for part in parts if part and part.strip()]
-    return tasks if tasks else [text]
+    return Message.parse(text).tasks
 
 
-def check_stop_factors(tasks: List[str]) -> Dict[str, object]:
+def check_stop_factors(tasks: Union[Message, List[str]]) -> Dict[str, object]:
     """Проверяет задачи на наличие стоп-факторов."""
 
-    stop_phrases = (
-        FORBIDDEN_TASKS
-        or [
-            "люстра",
-            "люстру",
-            "люстры",
-            "потолочный светильник",
-            "газовая плита",
-            "газовая колонка",
-            "газовый котел",
-            "газ",
-            "газовое",
-            "сварка",
-            "сварочные работы",
-            "стояк",
-            "стояки",
-            "разводка труб",
-            "заменить трубы",
-            "проложить трубы",
-        ]
+    message = tasks if isinstance(tasks, Message) else Message.from_tasks(tasks)
+    matcher = get_phrase_matcher()
+    token_index = get_token_index()
+    stop_kind = (
+        patterns.KIND_STOP
+        if matcher.has_kind(patterns.KIND_STOP)
+        else patterns.KIND_STOP_FALLBACK
     )
 
     forbidden_tasks: List[str] = []
     allowed_tasks: List[str] = []
 
-    greeting_tasks = {
-        "здравствуйте",
-        "привет",
-        "добрый день",
-        "добрый",
-        "доброе утро",
-        "доброе",
-        "добрый вечер",
-    }
-
-    for task in tasks:
-        normalized_task = normalize_text(task)
-        if any(stop_phrase in normalized_task for stop_phrase in stop_phrases):
+    for number, (task, normalized_task) in enumerate(
+        zip(message.tasks, message.normalized_tasks)
+    ):
+        if matcher.contains(normalized_task, stop_kind) or (
+            token_index is not None
+            and token_index.contains(message.task_stems[number], stop_kind)
+        ):
             forbidden_tasks.append(task)
-        elif normalized_task in greeting_tasks:
+        elif normalized_task in patterns.GREETING_TASKS:
             continue
         else:
             allowed_tasks.append(task)
@@ -121,48 +245,88 @@ def check_stop_factors(tasks: List[str]) -> Dict[str, object]:
     }
 
 
-def detect_categories(text: str, tasks: List[str]) -> Dict[str, object]:
-    fallback_keywords = {
-        "холодильник": "fridge",
-        "морозилка": "fridge",
-        "стиралка": "washing_machine",
-        "стиральная машина": "washing_machine",
-        "см ": "washing_machine",
-        "посудомойка": "dishwasher",
-        "пмм": "dishwasher",
-        "посудомоечная машина": "dishwasher",
-        "телевизор": "tv",
-        "тв": "tv",
-        "ноутбук": "laptop",
-        "ноут": "laptop",
-        "моноблок": "laptop",
-        "пк": "pc",
-        "компьютер": "pc",
-        "системный блок": "pc",
-    }
+def detect_categories(
+    text: Union[Message, str], tasks: Optional[List[str]] = None
+) -> Dict[str, object]:
+    if isinstance(text, Message):
+        message = text
+    else:
+        message = Message.from_tasks(tasks or [], text=text)
+
+    result = _match_categories(message)
+    if result["main_category"] == "unknown":
+        # Ничего не нашлось ни точно, ни по основам — пробуем исправить опечатки.
+        corrected = correct_typos(message)
+        if corrected is not None:
+            corrected_result = _match_categories(corrected)
+            if corrected_result["main_category"] != "unknown":
+                result = corrected_result
+
+    if not any(cat != "unknown" for cat in result["task_categories"]):
+        result["task_categories"] = ["unknown" for _ in message.tasks]
+
+    return result
+
+
+def correct_typos(message: Message) -> Optional[Message]:
+    """
+    Сообщение, в котором слова с опечатками заменены ближайшими словами
+    ключевых фраз, или None, если исправлять нечего (или поиск выключен).
+    """
+    fuzzy_index = get_fuzzy_index()
+    if fuzzy_index is None or not len(fuzzy_index):
+        return None
+
+    with metrics.stage_timer("fuzzy"):
+        corrections, completed = fuzzy_index.correct_words(
+            TOKEN_RE.findall(message.normalized),
+            KNOWLEDGE_FUZZY_MAX_DISTANCE,
+            budget=KNOWLEDGE_FUZZY_BUDGET_MS / 1000,
+        )
+    if not completed:
+        metrics.inc("omnidisp_fuzzy_total", result="budget_exceeded")
+    if not corrections:
+        if completed:
+            metrics.inc("omnidisp_fuzzy_total", result="no_match")
+        return None
+    metrics.inc("omnidisp_fuzzy_total", result="corrected")
+
+    return Message(
+        message.text,
+        apply_corrections(message.normalized, corrections),
+        message.spans,
+        message.tasks,
+        [apply_corrections(task, corrections) for task in message.normalized_tasks],
+    )
 
-    def _detect(mapping: Dict[str, str]) -> Dict[str, object]:
-        normalized_text = normalize_text(text)
-        detected_main = "unknown"
-        for keyword, category in mapping.items():
-            if keyword in normalized_text:
-                detected_main = category
-                break
+
+def _match_categories(message: Message) -> Dict[str, object]:
+    matcher = get_phrase_matcher()
+    token_index = get_token_index()
+
+    def _detect(kind: str) -> Dict[str, object]:
+        # Сначала точное вхождение фразы, затем — те же фразы в других словоформах.
+        main_hit = matcher.first(message.normalized, kind)
+        if main_hit is None and token_index is not None:
+            main_hit = token_index.first(message.stems, kind)
+        detected_main = main_hit.value if main_hit else "unknown"
 
         detected_tasks: List[str] = []
-        for task in tasks:
-            normalized_task = normalize_text(task)
-            task_category = "unknown"
-            for keyword, category in mapping.items():
-                if keyword in normalized_task:
-                    task_category = category
-                    if detected_main == "unknown":
-                        detected_main = category
-                    break
+        for number, normalized_task in enumerate(message.normalized_tasks):
+            task_hit = matcher.first(normalized_task, kind)
+            if task_hit is None and token_index is not None:
+                task_hit = token_index.first(message.task_stems[number], kind)
+            task_category = task_hit.value if task_hit else "unknown"
+            if task_hit and detected_main == "unknown":
+                detected_main = task_category
             detected_tasks.append(task_category)
         return {"main_category": detected_main, "task_categories": detected_tasks}
 
-    knowledge_detection = _detect(KEYWORD_TO_CATEGORY) if KEYWORD_TO_CATEGORY else None
+    knowledge_detection = (
+        _detect(patterns.KIND_CATEGORY)
+        if matcher.has_kind(patterns.KIND_CATEGORY)
+        else None
+    )
     has_knowledge_match = knowledge_detection and (
         knowledge_detection["main_category"] != "unknown"
         or any(cat != "unknown" for cat in knowledge_detection["task_categories"])
@@ -171,122 +335,249 @@ def detect_categories(text: str, tasks: List[str]) -> Dict[str, object]:
     if has_knowledge_match:
         result = knowledge_detection  # type: ignore[assignment]
     else:
-        result = _detect(fallback_keywords)
-
-    if not any(cat != "unknown" for cat in result["task_categories"]):
-        result["task_categories"] = ["unknown" for _ in tasks]
-
+        result = _detect(patterns.KIND_CATEGORY_FALLBACK)
     return result
 
 
 def detect_dialog_step(
-    text: str,
+    text: Union[Message, str],
     is_first_message: bool,
     categories: Dict[str, object],
 ) -> str:
     """Определение шага диалога на основе текста и признака первого сообщения."""
 
-    lowered_text = normalize_text(text)
-    if any(pattern in lowered_text for pattern in PRICE_QUESTION_PATTERNS):
+    lowered_text = text.normalized if isinstance(text, Message) else normalize_text(text)
+    found_kinds = {hit.kind for hit in get_phrase_matcher().iter_hits(lowered_text)}
+    if patterns.KIND_PRICE_QUESTION in found_kinds:
         return "price_question"
-    greeting_patterns = ["здрав", "привет", "добрый", "доброе"]
-    address_patterns = ["адрес", "куда подъехать", "куда ехать"]
-    time_patterns = ["когда сможете", "во сколько", "сегодня сможете", "завтра сможете"]
-
-    if is_first_message and any(pattern in lowered_text for pattern in greeting_patterns):
+    if is_first_message and patterns.KIND_GREETING in found_kinds:
         return "first_greeting"
-    if any(pattern in lowered_text for pattern in address_patterns):
+    if patterns.KIND_ADDRESS in found_kinds:
         return "address"
-    if any(pattern in lowered_text for pattern in time_patterns):
+    if patterns.KIND_VISIT_TIME in found_kinds:
         return "visit_time"
     return "clarification"
 
 
-def build_trace(
+TRACE_MODES = ("none", "structured", "text")
+
+
+class DispatchTrace(NamedTuple):
+    """Данные INTERNAL TRACE; в текст превращаются только по запросу (render)."""
+
+    text: str
+    tasks_count: int
+    step: str
+    main_category: str
+    knowledge_active: bool
+    knowledge_version: int
+    plan_type: str
+    forbidden_tasks: List[str]
+    allowed_tasks: List[str]
+    llm_circuit: str = "disabled"
+    prompt_tokens: int = 0
+    system_prompt_tokens: int = 0
+    prompt_truncated: bool = False
+
+    @property
+    def price_question(self) -> bool:
+        return self.step == "price_question"
+
+    def as_dict(self) -> Dict[str, object]:
+        data = self._asdict()
+        data["price_question"] = self.price_question
+        return data
+
+    def render(self) -> str:
+        """Строка INTERNAL TRACE для внутренней отладки режима DISP."""
+
+        forbidden_present = "да" if self.forbidden_tasks else "нет"
+        allowed_present = "да" if self.allowed_tasks else "нет"
+        if self.plan_type == "full_refuse":
+            stop_result_text = "полный отказ"
+            decision_text = "отказ"
+        elif self.plan_type == "partial_refuse":
+            stop_result_text = "частичный отказ"
+            decision_text = "частичный отказ"
+        else:
+            stop_result_text = "разрешено"
+            decision_text = "принимаем"
+
+        plan_line = "План CLIENT ANSWER: "
+        if self.plan_type == "full_refuse":
+            plan_line += "вежливо отказать по всем задачам и объяснить причину."
+        elif self.plan_type == "partial_refuse":
+            plan_line += "отказать по запрещённым задачам и предложить помощь по остальным."
+        else:
+            plan_line += "ответить как мастер, уточнить детали или время визита."
+
+        parts = [
+            "INTERNAL TRACE:",
+            f"Получен текст: {self.text}",
+            f"Определены задачи: {self.tasks_count}",
+            "Задача: базовая обработка входящего сообщения.",
+            "Контекст:",
+            "Тип: фраза.",
+            "Ответ мастера в предыдущем сообщении: нет.",
+            f"Шаг: {self.step}.",
+            "Документы:",
+            f"Категория: {self.main_category}.",
+            f"JSON-ключевые слова активны: {'да' if self.knowledge_active else 'нет'}.",
+            f"Версия базы знаний: {self.knowledge_version}.",
+            f"Предохранитель модели: {self.llm_circuit}.",
+            self._prompt_line(),
+            "Файл: не используется на этом этапе.",
+            "Прайс просмотрен: нет.",
+            "Стоп-факторы:",
+            "Проверены первыми.",
+            f"Запрещённые работы: {forbidden_present}.",
+            f"Разрешённые работы: {allowed_present}.",
+            f"Результат: {stop_result_text}.",
+            "Прайс:",
+            "Услуга найдена: не ищем на этом этапе.",
+            "Комментарий: прайсы и JSON-БЗ будут подключены позже.",
+            "Обязательные вопросы:",
+            "Обязательные вопросы: не заданы на этом этапе.",
+            "Решение:",
+            f"Решение: {decision_text}.",
+            "Цена:",
+            f"Сообщение содержит вопрос о цене: {'да' if self.price_question else 'нет'}.",
+            "Цена: не называем, прайс ещё не подключён.",
+            plan_line,
+            "Самопроверка:",
+            "Стоп-факторы / категория / прайс / шаг / вопрос о цене / формат ответа — проверены на текущем этапе.",
+        ]
+
+        if self.forbidden_tasks:
+            parts.append(f"Запрещённые задачи: {self.forbidden_tasks}")
+        if self.allowed_tasks:
+            parts.append(f"Разрешённые задачи детально: {self.allowed_tasks}")
+
+        return "\n".join(parts)
+
+    def _prompt_line(self) -> str:
+        if not self.prompt_tokens:
+            return "Промпт: не нужен, ответ без модели."
+        line = (
+            f"Промпт: ~{self.prompt_tokens} ток. PLAN"
+            f" + ~{self.system_prompt_tokens} ток. системного сообщения"
+        )
+        return line + (", PLAN сокращён." if self.prompt_truncated else ".")
+
+    def __str__(self) -> str:
+        return self.render()
+
+
+def collect_trace(
     text: str,
     tasks: List[str],
     step: str,
     stop_result: Dict[str, object],
     categories: Dict[str, object],
-) -> str:
-    """Формирует строку INTERNAL TRACE для внутренней отладки режима DISP."""
+    draft: Optional["ClientAnswerDraft"] = None,
+) -> DispatchTrace:
+    """Собирает данные INTERNAL TRACE без форматирования текста.
 
-    forbidden_tasks = stop_result.get("forbidden_tasks", [])
-    allowed_tasks = stop_result.get("allowed_tasks", [])
+    С черновиком ответа (draft) в трассу попадает оценка промпта в токенах.
+    """
 
-    forbidden_present = "да" if forbidden_tasks else "нет"
-    allowed_present = "да" if allowed_tasks else "нет"
     if stop_result.get("full_refuse"):
-        stop_result_text = "полный отказ"
-        decision_text = "отказ"
+        plan_type = "full_refuse"
     elif stop_result.get("partial_refuse"):
-        stop_result_text = "частичный отказ"
-        decision_text = "частичный отказ"
+        plan_type = "partial_refuse"
     else:
-        stop_result_text = "разрешено"
-        decision_text = "принимаем"
+        plan_type = "allowed"
 
-    price_question = step == "price_question"
-    knowledge_active = bool(KEYWORD_TO_CATEGORY)
+    snapshot = get_snapshot()
+    return DispatchTrace(
+        text=text,
+        tasks_count=len(tasks),
+        step=step,
+        main_category=str(categories.get("main_category", "unknown")),
+        knowledge_active=bool(snapshot.keyword_to_category),
+        knowledge_version=snapshot.version,
+        plan_type=plan_type,
+        forbidden_tasks=list(stop_result.get("forbidden_tasks", [])),  # type: ignore[call-overload]
+        allowed_tasks=list(stop_result.get("allowed_tasks", [])),  # type: ignore[call-overload]
+        llm_circuit=llm_circuit_state(),
+        prompt_tokens=draft.prompt_tokens if draft is not None else 0,
+        system_prompt_tokens=draft.system_prompt_tokens if draft is not None else 0,
+        prompt_truncated=draft.prompt_truncated if draft is not None else False,
+    )
 
-    plan_line = "План CLIENT ANSWER: "
-    if stop_result.get("full_refuse"):
-        plan_line += "вежливо отказать по всем задачам и объяснить причину."
-    elif stop_result.get("partial_refuse"):
-        plan_line += "отказать по запрещённым задачам и предложить помощь по остальным."
-    else:
-        plan_line += "ответить как мастер, уточнить детали или время визита."
-
-    parts = [
-        "INTERNAL TRACE:",
-        f"Получен текст: {text}",
-        f"Определены задачи: {len(tasks)}",
-        "Задача: базовая обработка входящего сообщения.",
-        "Контекст:",
-        "Тип: фраза.",
-        "Ответ мастера в предыдущем сообщении: нет.",
-        f"Шаг: {step}.",
-        "Документы:",
-        f"Категория: {categories.get('main_category', 'unknown')}.",
-        f"JSON-ключевые слова активны: {'да' if knowledge_active else 'нет'}.",
-        "Файл: не используется на этом этапе.",
-        "Прайс просмотрен: нет.",
-        "Стоп-факторы:",
-        "Проверены первыми.",
-        f"Запрещённые работы: {forbidden_present}.",
-        f"Разрешённые работы: {allowed_present}.",
-        f"Результат: {stop_result_text}.",
-        "Прайс:",
-        "Услуга найдена: не ищем на этом этапе.",
-        "Комментарий: прайсы и JSON-БЗ будут подключены позже.",
-        "Обязательные вопросы:",
-        "Обязательные вопросы: не заданы на этом этапе.",
-        "Решение:",
-        f"Решение: {decision_text}.",
-        "Цена:",
-        f"Сообщение содержит вопрос о цене: {'да' if price_question else 'нет'}.",
-        "Цена: не называем, прайс ещё не подключён.",
-        plan_line,
-        "Самопроверка:",
-        "Стоп-факторы / категория / прайс / шаг / вопрос о цене / формат ответа — проверены на текущем этапе.",
-    ]
-
-    if forbidden_tasks:
-        parts.append(f"Запрещённые задачи: {forbidden_tasks}")
-    if allowed_tasks:
-        parts.append(f"Разрешённые задачи детально: {allowed_tasks}")
-
-    return "\n".join(parts)
 
+def build_trace(
+    text: str,
+    tasks: List[str],
+    step: str,
+    stop_result: Dict[str, object],
+    categories: Dict[str, object],
+) -> str:
+    """Формирует строку INTERNAL TRACE для внутренней отладки режима DISP."""
+
+    return collect_trace(
+        text=text, tasks=tasks, step=step, stop_result=stop_result, categories=categories
+    ).render()
 
-def build_client_answer(
+
+def trace_output(
+    analysis: "MessageAnalysis",
+    mode: str = "text",
+    draft: Optional["ClientAnswerDraft"] = None,
+) -> Optional[object]:
+    """INTERNAL TRACE в нужном виде: None, словарь или текст."""
+
+    if mode == "none":
+        return None
+    with metrics.stage_timer("trace"):
+        trace = collect_trace(**analysis.trace_kwargs(), draft=draft)
+        return trace.as_dict() if mode == "structured" else trace.render()
+
+
+def _with_trace(
+    internal_trace: Optional[object], client_answer: str
+) -> Dict[str, object]:
+    if internal_trace is None:
+        return {"client_answer": client_answer}
+    return {"internal_trace": internal_trace, "client_answer": client_answer}
+
+
+FALLBACK_MESSAGE = (
+    "Сейчас не получается ответить подробно, попробуйте, пожалуйста, написать ещё раз "
+    "или переформулировать запрос."
+)
+
+
+class ClientAnswerDraft(NamedTuple):
+    """Всё, что нужно для ответа клиенту, кроме вызова модели.
+
+    Если ``answer`` уже задан, модель не нужна; иначе ответ модели на
+    ``prompt`` доводится до клиентского функцией finish_client_answer.
+    ``cache_key`` — канонический план для кэша ответов (None — не кэшировать).
+    ``prompt_tokens`` / ``system_prompt_tokens`` — оценка промпта в токенах.
+    """
+
+    answer: Optional[str]
+    prompt: Optional[str]
+    cache_key: Optional[Tuple[object, ...]]
+    plan_type: str
+    is_first_message: bool
+    price_question: bool
+    min_price: Optional[int]
+    prompt_tokens: int = 0
+    system_prompt_tokens: int = 0
+    prompt_truncated: bool = False
+
+
+def draft_client_answer(
     step: str,
     stop_result: Dict[str, object],
     categories: Dict[str, object],
     text: str,
     is_first_message: bool,
-) -> str:
-    """Формирует ответ мастера для клиента."""
+    message: Optional[Message] = None,
+) -> ClientAnswerDraft:
+    """Готовит ответ мастера до обращения к модели."""
 
     if stop_result.get("full_refuse"):
         plan_type = "full_refuse"
@@ -294,61 +585,433 @@ def build_client_answer(
         plan_type = "partial_refuse"
     else:
         plan_type = "allowed"
+    metrics.inc("omnidisp_decisions_total", plan_type=plan_type)
 
     price_question = step == "price_question"
     main_category = categories.get("main_category", "unknown")
-    recommend_question = find_recommend_question(
-        main_category, stop_result.get("allowed_tasks", [])
+    request_log.note(
+        step=step,
+        main_category=main_category,
+        plan_type=plan_type,
+        knowledge_version=get_snapshot().version,
     )
-
-    fallback_message = (
-        "Сейчас не получается ответить подробно, попробуйте, пожалуйста, написать ещё раз "
-        "или переформулировать запрос."
+    allowed_tasks = stop_result.get("allowed_tasks", [])
+    recommend_question = find_recommend_question(
+        main_category,
+        allowed_tasks,
+        normalized_tasks=(
+            [message.normalize(task) for task in allowed_tasks] if message else None
+        ),
     )
 
     min_price = None
     if price_question and not is_first_message:
         min_price = get_min_price(main_category)
         if min_price is not None:
-            return (
-                f"По опыту, такие работы обычно стоят от {min_price} рублей. "
-                "Точную стоимость смогу сказать после диагностики на месте. "
-                "Когда вам удобно, чтобы мастер подъехал?"
+            request_log.note(answer="price")
+            return ClientAnswerDraft(
+                answer=(
+                    f"По опыту, такие работы обычно стоят от {min_price} рублей. "
+                    "Точную стоимость смогу сказать после диагностики на месте. "
+                    "Когда вам удобно, чтобы мастер подъехал?"
+                ),
+                prompt=None,
+                cache_key=None,
+                plan_type=plan_type,
+                is_first_message=is_first_message,
+                price_question=price_question,
+                min_price=min_price,
             )
 
-    prompt = build_disp_prompt(
-        user_text=text,
-        step=step,
+    template_answer = (
+        template_client_answer(plan_type, step, main_category, stop_result, recommend_question)
+        if ANSWER_TEMPLATES_ENABLED
+        else None
+    )
+    if template_answer is not None:
+        metrics.inc("omnidisp_template_answers_total", plan_type=plan_type, step=step)
+        request_log.note(answer="template")
+        return ClientAnswerDraft(
+            answer=_with_greeting(template_answer, is_first_message),
+            prompt=None,
+            cache_key=None,
+            plan_type=plan_type,
+            is_first_message=is_first_message,
+            price_question=price_question,
+            min_price=min_price,
+        )
+
+    plan = {
+        "step": step,
+        "plan_type": plan_type,
+        "forbidden_tasks": stop_result.get("forbidden_tasks", []),
+        "allowed_tasks": stop_result.get("allowed_tasks", []),
+        "main_category": main_category,
+        "is_price_question": price_question,
+        "is_first_message": is_first_message,
+        "recommend_question": recommend_question,
+    }
+    cache_key = None
+    if get_answer_cache() is not None and is_cacheable_plan(plan_type):
+        cache_key = build_plan_key(**plan)
+
+    with metrics.stage_timer("prompt_build"):
+        prompt = compile_disp_prompt(user_text=text, **plan)
+    metrics.inc("omnidisp_prompt_tokens_total", prompt.tokens, part="plan")
+    metrics.inc("omnidisp_prompt_tokens_total", prompt.system_tokens, part="system")
+    if prompt.truncated:
+        metrics.inc("omnidisp_prompt_truncated_total")
+
+    return ClientAnswerDraft(
+        answer=None,
+        prompt=prompt.text,
+        cache_key=cache_key,
         plan_type=plan_type,
-        forbidden_tasks=stop_result.get("forbidden_tasks", []),
-        allowed_tasks=stop_result.get("allowed_tasks", []),
-        main_category=main_category,
-        is_price_question=price_question,
         is_first_message=is_first_message,
-        recommend_question=recommend_question,
+        price_question=price_question,
+        min_price=min_price,
+        prompt_tokens=prompt.tokens,
+        system_prompt_tokens=prompt.system_tokens,
+        prompt_truncated=prompt.truncated,
     )
-    client = LLMClient()
-    core_answer = client.ask(prompt)
 
-    if not core_answer:
-        return fallback_message
 
-    error_prefixes = (
-        "Сейчас не получается обратиться к модели",
-        "Сейчас возникла техническая ошибка",
-    )
-    if any(core_answer.startswith(prefix) for prefix in error_prefixes):
-        return fallback_message
+def template_client_answer(
+    plan_type: str,
+    step: str,
+    main_category: str,
+    stop_result: Dict[str, object],
+    recommend_question: Optional[str],
+) -> Optional[str]:
+    """Готовый ответ из шаблонов базы знаний или None, если нужна модель."""
+
+    index = get_category_index(main_category)
+    min_price = index.min_price if index is not None else None
+    values = {
+        "title": index.title if index is not None else None,
+        "recommend_question": recommend_question,
+        "min_price": str(min_price) if min_price is not None else None,
+        "forbidden_tasks": _join_tasks(stop_result.get("forbidden_tasks", [])),
+        "allowed_tasks": _join_tasks(stop_result.get("allowed_tasks", [])),
+    }
+    return select_answer(get_answer_templates(main_category), plan_type, step, values)
+
+
+def _join_tasks(tasks: object) -> Optional[str]:
+    parts = [str(task).strip().rstrip(" .?!") for task in tasks or []]  # type: ignore[attr-defined]
+    return ", ".join(part for part in parts if part) or None
 
-    answer = core_answer
 
+def _with_greeting(answer: str, is_first_message: bool) -> str:
     if is_first_message and not answer.lower().startswith("здрав"):
-        answer = f"Здравствуйте. {answer}" if answer else fallback_message
+        return f"Здравствуйте. {answer}"
+    return answer
+
+
+def finish_client_answer(draft: ClientAnswerDraft, core_answer: Optional[str]) -> str:
+    """Доводит ответ модели до ответа клиенту (приветствие, цены, ошибки)."""
 
-    if price_question and (min_price is None) and re.search(r"\d", answer or ""):
+    if draft.answer is not None:
+        return draft.answer
+
+    if not _is_model_answer(core_answer):
+        request_log.note(answer="fallback")
+        return FALLBACK_MESSAGE
+
+    request_log.note(answer="model")
+    answer = _with_greeting(core_answer, draft.is_first_message)
+
+    if draft.price_question and (draft.min_price is None) and re.search(r"\d", answer or ""):
         answer = (
             "Точную стоимость смогу сказать только после диагностики на месте. "
             "Могу подъехать и после осмотра назвать сумму. Когда вам удобно?"
         )
 
-    return answer or fallback_message
+    return answer or FALLBACK_MESSAGE
+
+
+MODEL_ERROR_PREFIXES = (
+    "Сейчас не получается обратиться к модели",
+    "Сейчас возникла техническая ошибка",
+)
+
+
+def _is_model_answer(core_answer: Optional[str]) -> bool:
+    """Ответ модели, а не пустота или сообщение клиента о технической ошибке."""
+
+    if not core_answer:
+        return False
+    return not any(core_answer.startswith(prefix) for prefix in MODEL_ERROR_PREFIXES)
+
+
+def _cached_answer(draft: ClientAnswerDraft) -> Optional[str]:
+    cache = get_answer_cache()
+    if cache is None or draft.cache_key is None:
+        return None
+    core_answer = cache.get(draft.cache_key)
+    result = "miss" if core_answer is None else "hit"
+    metrics.inc("omnidisp_answer_cache_total", result=result)
+    request_log.note(cache=result)
+    return core_answer
+
+
+def _remember_answer(draft: ClientAnswerDraft, core_answer: Optional[str]) -> None:
+    cache = get_answer_cache()
+    if cache is not None and draft.cache_key is not None and _is_model_answer(core_answer):
+        cache.put(draft.cache_key, core_answer)  # type: ignore[arg-type]
+
+
+def ask_model(draft: ClientAnswerDraft) -> Optional[str]:
+    """Ответ модели на черновик: из кэша или запросом к модели."""
+
+    core_answer = _cached_answer(draft)
+    if core_answer is not None:
+        return core_answer
+
+    single_flight = get_single_flight()
+    try:
+        with metrics.stage_timer("llm"):
+            if single_flight is None:
+                core_answer = get_llm_client().ask(draft.prompt)
+            else:
+                core_answer = single_flight.do(
+                    draft.prompt, lambda: get_llm_client().ask(draft.prompt)
+                )
+    except SingleFlightTimeout:
+        metrics.inc("omnidisp_llm_errors_total", kind="single_flight_timeout")
+        request_log.note(llm_status="single_flight_timeout")
+        return None
+    request_log.note(llm_status="ok" if _is_model_answer(core_answer) else "error")
+    _remember_answer(draft, core_answer)
+    return core_answer
+
+
+async def ask_model_async(draft: ClientAnswerDraft) -> Optional[str]:
+    """Асинхронный вариант ask_model."""
+
+    core_answer = _cached_answer(draft)
+    if core_answer is not None:
+        return core_answer
+
+    single_flight = get_async_single_flight()
+    try:
+        with metrics.stage_timer("llm"):
+            if single_flight is None:
+                core_answer = await get_async_llm_client().ask(draft.prompt)
+            else:
+                core_answer = await single_flight.do(
+                    draft.prompt, lambda: get_async_llm_client().ask(draft.prompt)
+                )
+    except SingleFlightTimeout:
+        metrics.inc("omnidisp_llm_errors_total", kind="single_flight_timeout")
+        request_log.note(llm_status="single_flight_timeout")
+        return None
+    request_log.note(llm_status="ok" if _is_model_answer(core_answer) else "error")
+    _remember_answer(draft, core_answer)
+    return core_answer
+
+
+def _is_safe_stream_head(head: str) -> bool:
+    """По началу ответа уже можно решить про приветствие и ошибку модели."""
+
+    if len(head) < len("здрав"):
+        return False
+    return not any(prefix.startswith(head) for prefix in MODEL_ERROR_PREFIXES)
+
+
+def stream_client_answer(draft: ClientAnswerDraft) -> Iterator[str]:
+    """Ответ клиенту по частям по мере генерации моделью.
+
+    Постобработка finish_client_answer применяется на безопасной границе:
+    начало ответа копится, пока по нему нельзя решить про приветствие и
+    сообщение об ошибке, а вопрос о цене без известного прайса копится
+    целиком — цифру модель может написать в самом конце.
+    """
+
+    if draft.answer is not None:
+        yield draft.answer
+        return
+
+    cached = _cached_answer(draft)
+    if cached is not None:
+        yield finish_client_answer(draft, cached)
+        return
+
+    buffer_all = draft.price_question and draft.min_price is None
+    parts: List[str] = []
+    released = False
+    # этап llm — от запроса до последней части, как у ask_model
+    with metrics.stage_timer("llm"):
+        try:
+            for delta in get_llm_client().ask_stream(draft.prompt):
+                parts.append(delta)
+                if released:
+                    yield delta
+                    continue
+                head = "".join(parts)
+                if buffer_all or not _is_safe_stream_head(head):
+                    continue
+                if not _is_model_answer(head):
+                    request_log.note(llm_status="error")
+                    yield FALLBACK_MESSAGE
+                    return
+                released = True
+                yield finish_client_answer(draft, head)
+        except LLMStreamError:
+            request_log.note(llm_status="error")
+            if not released:
+                yield FALLBACK_MESSAGE
+            return
+
+    core_answer = "".join(parts)
+    request_log.note(llm_status="ok" if _is_model_answer(core_answer) else "error")
+    if not released:
+        yield finish_client_answer(draft, core_answer)
+    _remember_answer(draft, core_answer)
+
+
+def build_client_answer(
+    step: str,
+    stop_result: Dict[str, object],
+    categories: Dict[str, object],
+    text: str,
+    is_first_message: bool,
+    message: Optional[Message] = None,
+) -> str:
+    """Формирует ответ мастера для клиента."""
+
+    draft = draft_client_answer(
+        step=step,
+        stop_result=stop_result,
+        categories=categories,
+        text=text,
+        is_first_message=is_first_message,
+        message=message,
+    )
+    return answer_draft(draft)
+
+
+def answer_draft(draft: ClientAnswerDraft) -> str:
+    """Ответ клиенту по готовому черновику: без модели, если ответ уже есть."""
+
+    if draft.answer is not None:
+        return draft.answer
+    return finish_client_answer(draft, ask_model(draft))
+
+
+async def build_client_answer_async(
+    step: str,
+    stop_result: Dict[str, object],
+    categories: Dict[str, object],
+    text: str,
+    is_first_message: bool,
+    message: Optional[Message] = None,
+) -> str:
+    """Асинхронный вариант build_client_answer."""
+
+    draft = draft_client_answer(
+        step=step,
+        stop_result=stop_result,
+        categories=categories,
+        text=text,
+        is_first_message=is_first_message,
+        message=message,
+    )
+    return await answer_draft_async(draft)
+
+
+async def answer_draft_async(draft: ClientAnswerDraft) -> str:
+    """Асинхронный вариант answer_draft."""
+
+    if draft.answer is not None:
+        return draft.answer
+    return finish_client_answer(draft, await ask_model_async(draft))
+
+
+# (трасса, черновик, запись журнала): в analyses — заметки разбора, общие
+# для повторов текста, в плане — запись каждого входного сообщения
+_PlannedAnswer = Tuple[Optional[object], ClientAnswerDraft, request_log.PendingRecord]
+
+
+def process_batch(
+    messages: Iterable[Tuple[str, bool]],
+    max_in_flight: Optional[int] = None,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Iterator[Dict[str, object]]:
+    """Пакетная обработка: результаты в порядке входа по мере готовности.
+
+    Детерминированные этапы проходят по всему пакету сразу на одном снимке
+    базы знаний (повторы текста разбираются один раз). К модели идёт один
+    запрос на каждый уникальный промпт, одновременно — не больше
+    ``max_in_flight`` (по умолчанию LLM_BATCH_CONCURRENCY). ``deadline`` —
+    бюджет времени в секундах на каждый запрос к модели, как у process.
+    """
+
+    schedule_reload_check()
+    with pinned_snapshot():
+        analyses: Dict[Tuple[str, bool], _PlannedAnswer] = {}
+        planned: List[_PlannedAnswer] = []
+        for text, is_first_message in messages:
+            metrics.inc("omnidisp_messages_total", entry="batch")
+            key = (text, is_first_message)
+            record = request_log.start_record("batch", text, is_first_message)
+            if key not in analyses:
+                notes = record.part()
+                with notes.active():
+                    analysis = analyze_message(text=text, is_first_message=is_first_message)
+                    draft = draft_client_answer(**analysis.answer_kwargs())
+                analyses[key] = (trace_output(analysis, trace, draft), draft, notes)
+            internal_trace, draft, notes = analyses[key]
+            record.merge(notes)
+            planned.append((internal_trace, draft, record))
+    return _answer_batch(planned, max_in_flight or LLM_BATCH_CONCURRENCY, deadline)
+
+
+def _ask_model_within(
+    draft: ClientAnswerDraft, deadline: Optional[float], notes: request_log.PendingRecord
+) -> Optional[str]:
+    with notes.active(), request_deadline(deadline):
+        return ask_model(draft)
+
+
+def _answer_batch(
+    planned: List[_PlannedAnswer],
+    max_in_flight: int,
+    deadline: Optional[float] = None,
+) -> Iterator[Dict[str, object]]:
+    executor = ThreadPoolExecutor(max_workers=max(max_in_flight, 1))
+    answered = 0
+    try:
+        calls: Dict[str, Tuple["Future[Optional[str]]", request_log.PendingRecord]] = {}
+        for _trace, draft, record in planned:
+            if draft.answer is None and draft.prompt not in calls:
+                # Потоки пула не видят контекст вызывающего (бюджет времени): своя копия
+                # на каждый вызов — один Context нельзя выполнять в двух потоках сразу.
+                # Заметки вызова копятся отдельно и достаются каждому сообщению с этим промптом.
+                context = contextvars.copy_context()
+                notes = record.part()
+                calls[draft.prompt] = (
+                    executor.submit(context.run, _ask_model_within, draft, deadline, notes),
+                    notes,
+                )
+
+        for internal_trace, draft, record in planned:
+            core_answer = None
+            if draft.answer is None:
+                call, notes = calls[draft.prompt]
+                core_answer = call.result()
+                record.merge(notes)
+            with record.active():
+                client_answer = finish_client_answer(draft, core_answer)
+            record.emit()
+            answered += 1
+            yield _with_trace(internal_trace, client_answer)
+    except BaseException as exc:
+        # сообщения без ответа (ошибка или закрытый итератор) тоже попадают в журнал
+        for _trace, _draft, record in planned[answered:]:
+            record.fields.setdefault("error", type(exc).__name__)
+            record.emit()
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
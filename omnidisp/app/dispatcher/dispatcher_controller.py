@@ -1,12 +1,104 @@
-from typing import Dict
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Tuple, Union
 
-from .disp_logic import process
+from omnidisp.app.state.conversation_store import ConversationStore, get_conversation_store
 
+from .disp_logic import (
+    process,
+    process_async,
+    process_batch,
+    process_stream,
+    process_with_analysis,
+)
 
-def handle_message(text: str, is_first_message: bool = False) -> Dict[str, str]:
+
+def handle_message(
+    text: str,
+    is_first_message: bool = False,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Dict[str, object]:
     """
     Входная точка режима DISP.
     Принимает текст одного сообщения (или переписку),
     возвращает словарь с INTERNAL TRACE и CLIENT ANSWER.
+    trace: "text" — трасса строкой, "structured" — словарём, "none" — без трассы.
+    deadline: бюджет времени на запрос в секундах (None — без ограничения).
+    """
+    return process(
+        text=text, is_first_message=is_first_message, trace=trace, deadline=deadline
+    )
+
+
+def handle_chat_message(
+    chat_id: object,
+    text: str,
+    store: Optional[ConversationStore] = None,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Dict[str, object]:
+    """
+    Входная точка для мессенджеров: признак первого сообщения берётся
+    из хранилища состояния диалогов, туда же записываются шаг и категория.
+    """
+    if store is None:
+        store = get_conversation_store()
+    is_first_message = store.mark_seen(chat_id)
+    result, analysis = process_with_analysis(
+        text=text, is_first_message=is_first_message, trace=trace, deadline=deadline
+    )
+    store.record(
+        chat_id,
+        step=analysis.step,
+        category=str(analysis.categories.get("main_category", "unknown")),
+    )
+    return result
+
+
+async def handle_message_async(
+    text: str,
+    is_first_message: bool = False,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Dict[str, object]:
+    """
+    Асинхронная входная точка режима DISP.
+    То же, что handle_message, но ожидание модели не занимает поток,
+    поэтому один event loop обслуживает много диалогов одновременно.
+    """
+    return await process_async(
+        text=text, is_first_message=is_first_message, trace=trace, deadline=deadline
+    )
+
+
+def handle_message_stream(
+    text: str, is_first_message: bool = False, deadline: Optional[float] = None
+) -> Tuple[str, Iterator[str]]:
+    """
+    Потоковая входная точка режима DISP.
+    Возвращает INTERNAL TRACE сразу и итератор частей CLIENT ANSWER.
+    deadline — бюджет времени (секунд) на ответ модели.
+    """
+    return process_stream(text=text, is_first_message=is_first_message, deadline=deadline)
+
+
+def handle_messages(
+    batch: Iterable[Union[str, Mapping[str, object]]],
+    max_in_flight: Optional[int] = None,
+    trace: str = "text",
+    deadline: Optional[float] = None,
+) -> Iterator[Dict[str, object]]:
+    """
+    Пакетная входная точка режима DISP.
+    Принимает строки или словари {"text": ..., "is_first_message": ...},
+    отдаёт результаты в порядке входа по мере готовности.
+    deadline — бюджет времени (секунд) на ответ модели для каждого сообщения.
     """
-    return process(text=text, is_first_message=is_first_message)
+    messages = []
+    for item in batch:
+        if isinstance(item, str):
+            messages.append((item, False))
+        else:
+            messages.append(
+                (str(item.get("text", "")), bool(item.get("is_first_message", False)))
+            )
+    return process_batch(messages, max_in_flight=max_in_flight, trace=trace, deadline=deadline)
@@ -0,0 +1,127 @@
+"""Разобранное входящее сообщение, общее для всех этапов обработки."""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import re
+
+from omnidisp.app.knowledge.token_index import stem_tokens
+from omnidisp.app.utils.text_normalizer import normalize_text
+
+TASK_SEPARATOR_RE = re.compile(r";|\.|\sи\s|,")
+
+
+class Message:
+    """
+    Текст сообщения, нормализованный один раз, и его разбиение на задачи.
+
+    - text / normalized: исходный и нормализованный текст;
+    - spans: границы задач (начало, конец) в этих строках;
+    - tasks / normalized_tasks: задачи в исходном и нормализованном виде.
+
+    Основы слов (stems, task_stems) для морфологического поиска считаются
+    при первом обращении. Списки общие для всех этапов и не должны меняться.
+    """
+
+    __slots__ = (
+        "text",
+        "normalized",
+        "spans",
+        "tasks",
+        "normalized_tasks",
+        "_by_task",
+        "_stems",
+        "_task_stems",
+    )
+
+    def __init__(
+        self,
+        text: str,
+        normalized: str,
+        spans: Sequence[Tuple[int, int]],
+        tasks: List[str],
+        normalized_tasks: List[str],
+    ) -> None:
+        self.text = text
+        self.normalized = normalized
+        self.spans = spans
+        self.tasks = tasks
+        self.normalized_tasks = normalized_tasks
+        self._by_task: Optional[Dict[str, str]] = None
+        self._stems: Optional[Tuple[str, ...]] = None
+        self._task_stems: Optional[List[Tuple[str, ...]]] = None
+
+    @classmethod
+    def parse(cls, text: str) -> "Message":
+        """Нормализует текст и делит его на задачи за один проход."""
+
+        normalized = normalize_text(text)
+        # Нормализация русского текста сохраняет длину, и тогда границы задач
+        # годятся для обеих строк; иначе задачи нормализуются по отдельности.
+        same_offsets = len(normalized) == len(text)
+
+        spans: List[Tuple[int, int]] = []
+        start = 0
+        for separator in TASK_SEPARATOR_RE.finditer(text):
+            _add_span(spans, text, start, separator.start())
+            start = separator.end()
+        _add_span(spans, text, start, len(text))
+
+        if not spans:
+            return cls(text, normalized, ((0, len(text)),), [text], [normalized])
+
+        tasks = [text[begin:end] for begin, end in spans]
+        if same_offsets:
+            normalized_tasks = [normalized[begin:end] for begin, end in spans]
+        else:
+            normalized_tasks = [normalize_text(task) for task in tasks]
+        return cls(text, normalized, tuple(spans), tasks, normalized_tasks)
+
+    @classmethod
+    def from_tasks(cls, tasks: Sequence[str], text: Optional[str] = None) -> "Message":
+        """Сообщение из уже выделенных задач (для вызовов этапов по отдельности)."""
+
+        if text is None:
+            text = " ".join(tasks)
+        return cls(
+            text,
+            normalize_text(text),
+            (),
+            list(tasks),
+            [normalize_text(task) for task in tasks],
+        )
+
+    def normalize(self, task: str) -> str:
+        """Нормализованный вид задачи этого сообщения (или любого текста)."""
+
+        if self._by_task is None:
+            self._by_task = dict(zip(self.tasks, self.normalized_tasks))
+        normalized = self._by_task.get(task)
+        return normalized if normalized is not None else normalize_text(task)
+
+    @property
+    def stems(self) -> Tuple[str, ...]:
+        """Основы слов всего сообщения."""
+
+        if self._stems is None:
+            self._stems = stem_tokens(self.normalized)
+        return self._stems
+
+    @property
+    def task_stems(self) -> List[Tuple[str, ...]]:
+        """Основы слов каждой задачи."""
+
+        if self._task_stems is None:
+            self._task_stems = [stem_tokens(task) for task in self.normalized_tasks]
+        return self._task_stems
+
+    def __repr__(self) -> str:
+        return f"Message({self.text!r}, tasks={self.tasks!r})"
+
+
+def _add_span(spans: List[Tuple[int, int]], text: str, begin: int, end: int) -> None:
+    while begin < end and text[begin].isspace():
+        begin += 1
+    while end > begin and text[end - 1].isspace():
+        end -= 1
+    if begin < end:
+        spans.append((begin, end))
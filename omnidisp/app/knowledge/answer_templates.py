@@ -0,0 +1,142 @@
+"""Client answers written in the knowledge base instead of asked from the model.
+
+A category file may list ``answer_templates``; each entry says for which
+``plan_type`` (``full_refuse``, ``partial_refuse``, ``allowed``) and dialog
+``step`` it applies — a missing key matches any value — and gives the answer
+``text``. The text may use these placeholders (``str.format`` syntax, plain
+names only — no format specs or conversions, values are always strings):
+
+- ``{title}``: category title;
+- ``{recommend_question}``: clarifying question picked for the message;
+- ``{min_price}``: minimal labour price of the category;
+- ``{forbidden_tasks}`` / ``{allowed_tasks}``: the tasks, comma-separated,
+  without trailing punctuation.
+
+A template is used only if every placeholder it mentions has a value, so
+"Здравствуйте. {recommend_question}" silently falls through to the model
+for categories without clarifying questions. Category templates are tried
+in file order before :data:`DEFAULT_TEMPLATES`; the first usable one wins.
+"""
+
+from __future__ import annotations
+
+from string import Formatter
+from typing import Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+TEMPLATE_FIELDS = frozenset(
+    {"title", "recommend_question", "min_price", "forbidden_tasks", "allowed_tasks"}
+)
+
+PLAN_TYPES = frozenset({"full_refuse", "partial_refuse", "allowed"})
+STEPS = frozenset({"price_question", "first_greeting", "address", "visit_time", "clarification"})
+
+
+class AnswerTemplate(NamedTuple):
+    """Compiled template; ``None`` in ``plan_type``/``step`` matches anything."""
+
+    plan_type: Optional[str]
+    step: Optional[str]
+    text: str
+    fields: FrozenSet[str]
+
+    def matches(self, plan_type: str, step: str) -> bool:
+        return (self.plan_type is None or self.plan_type == plan_type) and (
+            self.step is None or self.step == step
+        )
+
+    def render(self, values: Mapping[str, Optional[str]]) -> Optional[str]:
+        """The answer, or ``None`` if a placeholder has no value."""
+
+        if any(not values.get(field) for field in self.fields):
+            return None
+        return self.text.format_map(values)
+
+
+DEFAULT_TEMPLATES: List[Dict[str, str]] = [
+    {
+        "plan_type": "full_refuse",
+        "text": (
+            "К сожалению, такими работами я не занимаюсь. "
+            "Если понадобится помощь с чем-то другим, напишите — подскажу."
+        ),
+    },
+]
+"""Used for every category (and for ``unknown``) after the category's own templates."""
+
+
+def template_errors(entry: object) -> List[str]:
+    """Problems of one raw template entry (empty if it can be compiled)."""
+
+    if not isinstance(entry, dict):
+        return ["expected object"]
+    errors: List[str] = []
+    plan_type = entry.get("plan_type")
+    if plan_type is not None and plan_type not in PLAN_TYPES:
+        errors.append(f"unknown plan_type {plan_type!r}")
+    step = entry.get("step")
+    if step is not None and step not in STEPS:
+        errors.append(f"unknown step {step!r}")
+    text = entry.get("text")
+    if not isinstance(text, str) or not text.strip():
+        errors.append("text is required")
+        return errors
+    try:
+        fields = _placeholders(text)
+    except ValueError as exc:
+        errors.append(f"bad text: {exc}")
+        return errors
+    for field in sorted(fields - TEMPLATE_FIELDS):
+        errors.append(f"unknown placeholder {{{field}}}")
+    return errors
+
+
+def compile_templates(entries: Iterable[object]) -> Tuple[AnswerTemplate, ...]:
+    """Compile raw entries, skipping the ones :func:`template_errors` rejects."""
+
+    templates: List[AnswerTemplate] = []
+    for entry in entries:
+        if template_errors(entry):
+            continue
+        text = entry["text"]  # type: ignore[index]
+        templates.append(
+            AnswerTemplate(
+                plan_type=entry.get("plan_type"),  # type: ignore[union-attr]
+                step=entry.get("step"),  # type: ignore[union-attr]
+                text=text,
+                fields=frozenset(_placeholders(text)),
+            )
+        )
+    return tuple(templates)
+
+
+def select_answer(
+    templates: Iterable[AnswerTemplate],
+    plan_type: str,
+    step: str,
+    values: Mapping[str, Optional[str]],
+) -> Optional[str]:
+    """Text of the first template that matches and has all its values."""
+
+    for template in templates:
+        if template.matches(plan_type, step):
+            answer = template.render(values)
+            if answer is not None:
+                return answer
+    return None
+
+
+def _placeholders(text: str) -> FrozenSet[str]:
+    fields = set()
+    for _literal, field, spec, conversion in Formatter().parse(text):
+        if field is None:
+            continue
+        if not field.isidentifier():
+            raise ValueError(f"placeholder {{{field}}} must be a plain name")
+        if spec or conversion:
+            # values are strings: "{min_price:d}" would fail on every matching message
+            raise ValueError(f"placeholder {{{field}}} must not have a format spec or conversion")
+        fields.add(field)
+    return frozenset(fields)
+
+
+DEFAULT_ANSWER_TEMPLATES: Tuple[AnswerTemplate, ...] = compile_templates(DEFAULT_TEMPLATES)
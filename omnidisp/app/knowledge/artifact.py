@@ -0,0 +1,136 @@
+"""On-disk cache of the compiled knowledge base.
+
+Parsing every ``categories/*.json``, normalizing keywords and building the
+matchers is done once by the compile step; workers then unpickle the result.
+An artifact is keyed by a hash of the category file contents, of
+:data:`ARTIFACT_FORMAT_VERSION` and of the source of :data:`CODE_MODULES`
+(the code that builds and defines the pickled objects), so any edit of the
+JSON, of the artifact layout or of that code makes the old artifact unusable
+and the loader falls back to the JSON files.
+
+Artifacts are plain pickles written by this process or the compile CLI into
+a directory the service owns; never point ``KNOWLEDGE_ARTIFACT_DIR`` at a
+location writable by untrusted users.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import os
+import pickle
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+ARTIFACT_FORMAT_VERSION = 4
+"""Bump when the artifact changes in a way :data:`CODE_MODULES` does not cover."""
+
+CODE_MODULES: Tuple[str, ...] = (
+    "omnidisp.app.knowledge.loader",
+    "omnidisp.app.knowledge.patterns",
+    "omnidisp.app.knowledge.matcher",
+    "omnidisp.app.knowledge.stemmer",
+    "omnidisp.app.knowledge.token_index",
+    "omnidisp.app.knowledge.fuzzy_index",
+    "omnidisp.app.knowledge.answer_templates",
+    "omnidisp.app.utils.text_normalizer",
+)
+"""Modules whose source is part of the artifact key."""
+
+_MAGIC = "omnidisp-knowledge"
+_PREFIX = "knowledge-"
+_SUFFIX = ".pkl"
+
+
+def content_hash(categories_dir: Path) -> str:
+    """SHA-256 over the names and bytes of every category JSON file."""
+
+    digest = hashlib.sha256(f"{_MAGIC}:{ARTIFACT_FORMAT_VERSION}".encode("utf-8"))
+    digest.update(code_hash().encode("ascii"))
+    if categories_dir.exists():
+        for path in sorted(categories_dir.glob("*.json")):
+            digest.update(b"\0" + path.name.encode("utf-8") + b"\0")
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def code_hash() -> str:
+    """SHA-256 over the source of :data:`CODE_MODULES` (computed once per process)."""
+
+    digest = hashlib.sha256()
+    for name in CODE_MODULES:
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.origin is None:
+            raise ImportError(f"cannot find source of {name}")
+        digest.update(b"\0" + name.encode("utf-8") + b"\0")
+        digest.update(Path(spec.origin).read_bytes())
+    return digest.hexdigest()
+
+
+def _source_key(categories_dir: Path) -> str:
+    source = str(categories_dir.resolve()).encode("utf-8")
+    return hashlib.sha256(source).hexdigest()[:12]
+
+
+def artifact_path(artifact_dir: Path, categories_dir: Path, knowledge_hash: str) -> Path:
+    """Artifact file for a categories directory and its content hash."""
+
+    return artifact_dir / (
+        f"{_PREFIX}{_source_key(categories_dir)}-{knowledge_hash[:32]}{_SUFFIX}"
+    )
+
+
+def read_artifact(
+    artifact_dir: Path, categories_dir: Path, knowledge_hash: str
+) -> Optional[Any]:
+    """Return the payload stored for ``knowledge_hash`` or ``None``.
+
+    Missing, stale and unreadable artifacts are all treated as a miss.
+    """
+
+    path = artifact_path(artifact_dir, categories_dir, knowledge_hash)
+    try:
+        with path.open("rb") as f:
+            header = pickle.load(f)
+            if header != (_MAGIC, ARTIFACT_FORMAT_VERSION, knowledge_hash):
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+def write_artifact(
+    artifact_dir: Path, categories_dir: Path, knowledge_hash: str, payload: Any
+) -> Path:
+    """Atomically write ``payload`` and drop older artifacts of the same source."""
+
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+    path = artifact_path(artifact_dir, categories_dir, knowledge_hash)
+
+    fd, tmp_name = tempfile.mkstemp(dir=artifact_dir, prefix=".tmp-", suffix=_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(
+                (_MAGIC, ARTIFACT_FORMAT_VERSION, knowledge_hash),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+    for old in artifact_dir.glob(f"{_PREFIX}{_source_key(categories_dir)}-*{_SUFFIX}"):
+        if old != path:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+    return path
@@ -0,0 +1,160 @@
+"""Typo-tolerant lookup of knowledge keyword words.
+
+Messages like "халадильник не марозит" miss both the exact automaton and
+the stem index. This index holds every distinct word of the category
+keywords and maps a misspelled message word to the closest of them within
+a bounded edit distance, so the message can be matched again with the
+corrected words.
+
+Words are indexed by their character trigrams (``^`` and ``$`` mark the
+word boundaries) together with the word length. A lookup only visits words
+of a compatible length that share enough trigrams with the query — one
+edit destroys at most three trigrams — and verifies those few candidates
+with a Levenshtein distance that stops as soon as the bound is exceeded.
+The cost depends on the message, not on the number of keywords.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from omnidisp.app.knowledge.token_index import TOKEN_RE
+
+MIN_WORD_LENGTH = 5
+"""Shorter words are never corrected: one edit turns them into other words."""
+
+
+def allowed_distance(length: int, max_distance: int) -> int:
+    """Edit distance tolerated for a word of ``length`` characters."""
+
+    if length < MIN_WORD_LENGTH:
+        return 0
+    if length < 8:
+        return min(1, max_distance)
+    return max_distance
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"^{word}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_distance(left: str, right: str, limit: int) -> int:
+    """Levenshtein distance, or ``limit + 1`` once it is known to exceed ``limit``."""
+
+    if abs(len(left) - len(right)) > limit:
+        return limit + 1
+    previous = list(range(len(right) + 1))
+    for i, left_char in enumerate(left, 1):
+        current = [i]
+        row_min = i
+        for j, right_char in enumerate(right, 1):
+            value = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (left_char != right_char),
+            )
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class FuzzyIndex:
+    """Distinct keyword words searchable by approximate spelling."""
+
+    def __init__(self) -> None:
+        self._words: List[str] = []
+        self._known: Set[str] = set()
+        self._postings: Dict[Tuple[str, int], List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, phrase: str) -> None:
+        """Register the words of a normalized ``phrase``; earlier words win ties."""
+
+        for word in TOKEN_RE.findall(phrase):
+            if len(word) < MIN_WORD_LENGTH or word in self._known:
+                continue
+            self._known.add(word)
+            word_id = len(self._words)
+            self._words.append(word)
+            for gram in trigrams(word):
+                self._postings.setdefault((gram, len(word)), []).append(word_id)
+
+    def add_many(self, phrases: Iterable[str]) -> None:
+        for phrase in phrases:
+            self.add(phrase)
+
+    def lookup(self, word: str, max_distance: int) -> Optional[Tuple[str, int]]:
+        """Closest indexed word ``(word, distance)`` within the allowed distance.
+
+        Words that are indexed themselves, and words too short to correct,
+        return ``None``.
+        """
+
+        limit = allowed_distance(len(word), max_distance)
+        if limit == 0 or word in self._known:
+            return None
+
+        grams = trigrams(word)
+        shared: Dict[int, int] = {}
+        for length in range(len(word) - limit, len(word) + limit + 1):
+            for gram in grams:
+                for word_id in self._postings.get((gram, length), ()):
+                    shared[word_id] = shared.get(word_id, 0) + 1
+        threshold = max(1, len(grams) - 3 * limit)
+
+        best: Optional[Tuple[int, int, int]] = None
+        for word_id, count in shared.items():
+            if count < threshold:
+                continue
+            distance = bounded_distance(word, self._words[word_id], limit)
+            if distance > limit:
+                continue
+            key = (distance, -count, word_id)
+            if best is None or key < best:
+                best = key
+        if best is None:
+            return None
+        return self._words[best[2]], best[0]
+
+    def correct_words(
+        self,
+        words: Iterable[str],
+        max_distance: int,
+        budget: Optional[float] = None,
+    ) -> Tuple[Dict[str, str], bool]:
+        """Replacements ``{misspelled: indexed word}`` for ``words``.
+
+        ``budget`` limits the time (in seconds) spent on lookups. The second
+        value is ``False`` if the budget ran out before every word was
+        checked; the replacements found until then are still returned.
+        """
+
+        deadline = None if budget is None else time.perf_counter() + budget
+        corrections: Dict[str, str] = {}
+        checked: Set[str] = set()
+        for word in words:
+            if word in checked:
+                continue
+            if deadline is not None and time.perf_counter() > deadline:
+                return corrections, False
+            checked.add(word)
+            found = self.lookup(word, max_distance)
+            if found is not None:
+                corrections[word] = found[0]
+        return corrections, True
+
+
+def apply_corrections(text: str, corrections: Dict[str, str]) -> str:
+    """``text`` with every corrected word replaced."""
+
+    if not corrections:
+        return text
+    return TOKEN_RE.sub(lambda match: corrections.get(match.group(0), match.group(0)), text)
@@ -8,11 +8,46 @@ without code changes.
 
 from __future__ import annotations
 
+import itertools
 import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Dict, List, Optional, TypedDict
-
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypedDict,
+    get_args,
+    get_origin,
+    get_type_hints,
+    is_typeddict,
+)
+
+from omnidisp.app.knowledge import artifact, patterns
+from omnidisp.app.knowledge.answer_templates import (
+    DEFAULT_ANSWER_TEMPLATES,
+    AnswerTemplate,
+    compile_templates,
+    template_errors,
+)
+from omnidisp.app.knowledge.fuzzy_index import FuzzyIndex
+from omnidisp.app.knowledge.matcher import PhraseMatcher
+from omnidisp.app.knowledge.token_index import TokenIndex
+from omnidisp.app.utils.metrics import get_metrics
 from omnidisp.app.utils.text_normalizer import normalize_text
+from omnidisp.config.settings import (
+    KNOWLEDGE_ARTIFACT_DIR,
+    KNOWLEDGE_FUZZY,
+    KNOWLEDGE_MORPHOLOGY,
+    KNOWLEDGE_RELOAD_INTERVAL,
+)
 
 
 class JobInfo(TypedDict, total=False):
@@ -43,6 +78,18 @@ class SymptomInfo(TypedDict, total=False):
     clarify_question: str
 
 
+class AnswerTemplateInfo(TypedDict, total=False):
+    """Ready client answer for some plans (see :mod:`.answer_templates`).
+
+    - ``plan_type`` / ``step``: when the template applies (absent — always).
+    - ``text``: the answer with optional ``{placeholders}``.
+    """
+
+    plan_type: str
+    step: str
+    text: str
+
+
 class CategoryData(TypedDict, total=False):
     """Full category payload expected from JSON.
 
@@ -53,6 +100,8 @@ class CategoryData(TypedDict, total=False):
     - ``symptoms`` / ``common_issues``: lists of :class:`SymptomInfo`.
     - ``clarifying_questions``: fallback list of questions.
     - ``jobs``: list of :class:`JobInfo` with price ranges.
+    - ``answer_templates``: list of :class:`AnswerTemplateInfo` answered
+      without the model.
     """
 
     category: str
@@ -63,7 +112,74 @@ class CategoryData(TypedDict, total=False):
     common_issues: List[SymptomInfo]
     clarifying_questions: List[str]
     jobs: List[JobInfo]
+    answer_templates: List[AnswerTemplateInfo]
+
+
+@dataclass(frozen=True)
+class CategoryIndex:
+    """Lookup structures precomputed for one category at load time.
+
+    - ``min_price``: minimal parsed ``price_work_from`` over all jobs.
+    - ``example_matcher``: normalized example phrases of symptoms compiled
+      for a single scan; hit ``value`` is the clarify question, ``order``
+      the symptom/example order (the earliest hit wins).
+    - ``fallback_question``: first of ``clarifying_questions``.
+    - ``title``: human-friendly category name.
+    - ``answer_templates``: compiled ``answer_templates`` in file order.
+    """
+
+    min_price: Optional[int]
+    example_matcher: PhraseMatcher
+    fallback_question: Optional[str]
+    title: Optional[str] = None
+    answer_templates: Tuple[AnswerTemplate, ...] = ()
+
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """Consistent, read-only view of the whole knowledge base.
+
+    A snapshot is built completely before it is published, and a reload
+    replaces the published reference in one assignment. Requests pin the
+    snapshot they started with (see :func:`pinned_snapshot`), so they never
+    observe a half-loaded knowledge base. Nothing inside a snapshot may be
+    mutated after it is built.
+
+    - ``version``: increases by one with every published snapshot.
+    - ``fingerprint``: ``(file name, mtime_ns, size)`` of every category file.
+    - ``content_hash``: hash of the category files (see :mod:`.artifact`).
+    - ``token_index``: the same phrases as ``matcher``, over word stems.
+    - ``fuzzy_index``: the words of the category keywords, for typo correction.
+    - ``problems``: files that did not parse or match the schema (see
+      :func:`validate_category_data`); a reload refuses such a snapshot.
+    """
+
+    version: int
+    categories_dir: Path
+    fingerprint: Tuple[Tuple[str, int, int], ...]
+    content_hash: str
+    loaded_at: float
+    data: Dict[str, CategoryData]
+    keyword_to_category: Dict[str, str]
+    forbidden_tasks: Tuple[str, ...]
+    category_index: Dict[str, CategoryIndex]
+    matcher: PhraseMatcher
+    token_index: TokenIndex
+    fuzzy_index: FuzzyIndex
+    problems: Tuple[str, ...] = ()
+
 
+class KnowledgeError(ValueError):
+    """A rebuilt knowledge base is broken and must not replace the current one."""
+
+
+_EXAMPLE_KIND = "example"
+
+DEFAULT_CATEGORIES_DIR = Path(__file__).resolve().parent / "categories"
+
+# The names below alias the parts of the published snapshot and are rebound
+# (never mutated) on every reload. Prefer :func:`get_snapshot` in new code:
+# reading several aliases is not atomic across a reload.
 
 KNOWLEDGE_DATA: Dict[str, CategoryData] = {}
 """Category code -> full category dict."""
@@ -71,112 +187,490 @@ KNOWLEDGE_DATA: Dict[str, CategoryData] = {}
 KEYWORD_TO_CATEGORY: Dict[str, str] = {}
 """Normalized keyword -> category code."""
 
-FORBIDDEN_TASKS: List[str] = []
+FORBIDDEN_TASKS: Tuple[str, ...] = ()
 """Global stop-phrases loaded from the knowledge base."""
 
-_LOADED = False
+CATEGORY_INDEX: Dict[str, CategoryIndex] = {}
+"""Category code -> precomputed :class:`CategoryIndex`."""
+
+PHRASE_MATCHER: PhraseMatcher = PhraseMatcher().build()
+"""Automaton with keywords, stop-phrases and dialog-step patterns."""
+
+_SNAPSHOT: Optional[KnowledgeSnapshot] = None
+_PINNED_SNAPSHOT: ContextVar[Optional[KnowledgeSnapshot]] = ContextVar(
+    "omnidisp_knowledge_snapshot", default=None
+)
+_VERSIONS = itertools.count(1)
+_RELOAD_LOCK = threading.Lock()
+_last_reload_check = 0.0
+_rejected_fingerprint: Optional[Tuple[Tuple[str, int, int], ...]] = None
+
 
+def _load_category_file(path: Path, problems: Optional[List[str]] = None) -> CategoryData:
+    """Parsed category file; unreadable content becomes ``{}`` and a problem."""
 
-def _load_category_file(path: Path) -> CategoryData:
     try:
         with path.open("r", encoding="utf-8") as f:
             raw_data = json.load(f)
-    except json.JSONDecodeError:
-        raw_data = {}
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        if problems is not None:
+            problems.append(f"{path.name}: cannot read JSON ({exc})")
+        return {}
 
     if not isinstance(raw_data, dict):
+        if problems is not None:
+            problems.append(f"{path.name}: top-level JSON must be an object")
         return {}
 
     # Ensure we always work with a dict and leave absent fields empty.
     return raw_data  # type: ignore[return-value]
 
 
-def load_knowledge(categories_dir: Optional[Path] = None) -> None:
-    """Load category JSON files into in-memory structures.
+def _fingerprint(base_dir: Path) -> Tuple[Tuple[str, int, int], ...]:
+    if not base_dir.exists():
+        return ()
+    entries = []
+    for path in sorted(base_dir.glob("*.json")):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
 
-    The loader tolerates empty ``{}`` files and missing fields so that the
-    dispatcher can operate even before the knowledge base is filled.
+
+def validate_category_data(data: object) -> List[str]:
+    """Check a parsed category file against the :class:`CategoryData` schema.
+
+    Returns human-readable problems (empty when the file is valid). The
+    loader itself stays tolerant; validation is reported by the compile
+    step so that broken files are noticed before they reach production.
     """
 
-    global _LOADED
-    KNOWLEDGE_DATA.clear()
-    KEYWORD_TO_CATEGORY.clear()
-    FORBIDDEN_TASKS.clear()
+    errors: List[str] = []
+    _validate_value(data, CategoryData, "$", errors)
+    if isinstance(data, dict) and isinstance(data.get("answer_templates"), list):
+        for position, entry in enumerate(data["answer_templates"]):
+            for problem in template_errors(entry):
+                error = f"$.answer_templates[{position}]: {problem}"
+                if error not in errors:
+                    errors.append(error)
+    return errors
+
+
+def _validate_value(value: object, hint: object, path: str, errors: List[str]) -> None:
+    if is_typeddict(hint):
+        if not isinstance(value, dict):
+            errors.append(f"{path}: expected object")
+            return
+        field_hints = get_type_hints(hint)
+        for key, item in value.items():
+            if key not in field_hints:
+                errors.append(f"{path}.{key}: unknown field")
+                continue
+            _validate_value(item, field_hints[key], f"{path}.{key}", errors)
+        return
 
-    base_dir = categories_dir or Path(__file__).resolve().parent / "categories"
-    if not base_dir.exists():
-        _LOADED = True
+    if get_origin(hint) is list:
+        if not isinstance(value, list):
+            errors.append(f"{path}: expected list")
+            return
+        (item_hint,) = get_args(hint)
+        for position, item in enumerate(value):
+            _validate_value(item, item_hint, f"{path}[{position}]", errors)
         return
 
-    for path in sorted(base_dir.glob("*.json")):
+    if hint is int and (not isinstance(value, int) or isinstance(value, bool)):
+        errors.append(f"{path}: expected integer")
+    elif hint is str and not isinstance(value, str):
+        errors.append(f"{path}: expected string")
+
+
+def _compile_snapshot(
+    base_dir: Path, fingerprint: Tuple[Tuple[str, int, int], ...], knowledge_hash: str
+) -> KnowledgeSnapshot:
+    data: Dict[str, CategoryData] = {}
+    keyword_to_category: Dict[str, str] = {}
+    forbidden_tasks: List[str] = []
+    category_index: Dict[str, CategoryIndex] = {}
+    problems: List[str] = []
+
+    for name, _mtime, _size in fingerprint:
+        path = base_dir / name
         category_code = path.stem
-        category_data = _load_category_file(path)
-        KNOWLEDGE_DATA[category_code] = category_data
+        category_data = _load_category_file(path, problems)
+        for error in validate_category_data(category_data):
+            problems.append(f"{name}: {error}")
+        data[category_code] = category_data
+        category_index[category_code] = build_category_index(category_data)
 
         keywords = category_data.get("keywords") or []
         for keyword in keywords:
             if isinstance(keyword, str) and keyword.strip():
-                KEYWORD_TO_CATEGORY[normalize_text(keyword)] = category_code
+                keyword_to_category[normalize_text(keyword)] = category_code
 
         stop_phrases = category_data.get("stop_phrases") or []
         for phrase in stop_phrases:
             if isinstance(phrase, str) and phrase.strip():
-                FORBIDDEN_TASKS.append(normalize_text(phrase))
+                forbidden_tasks.append(normalize_text(phrase))
+
+    return KnowledgeSnapshot(
+        version=0,
+        categories_dir=base_dir,
+        fingerprint=fingerprint,
+        content_hash=knowledge_hash,
+        loaded_at=time.time(),
+        data=data,
+        keyword_to_category=keyword_to_category,
+        forbidden_tasks=tuple(forbidden_tasks),
+        category_index=category_index,
+        matcher=build_phrase_matcher(keyword_to_category, forbidden_tasks),
+        token_index=build_token_index(keyword_to_category, forbidden_tasks),
+        fuzzy_index=build_fuzzy_index(keyword_to_category),
+        problems=tuple(problems),
+    )
+
+
+def build_snapshot(
+    categories_dir: Optional[Path] = None,
+    artifact_dir: Optional[Path] = None,
+    strict: bool = False,
+) -> KnowledgeSnapshot:
+    """Build a new snapshot without publishing it.
+
+    The compiled artifact for the current file contents is used when it
+    exists in ``artifact_dir`` (``KNOWLEDGE_ARTIFACT_DIR`` for the bundled
+    categories); otherwise the JSON files are parsed and a fresh artifact
+    is written.
+    The loader tolerates empty ``{}`` files and missing fields so that the
+    dispatcher can operate even before the knowledge base is filled.
+    Files that do not parse or match the schema are only reported, unless
+    ``strict``: then :class:`KnowledgeError` is raised instead. A category
+    file that disappears while it is read always raises :class:`KnowledgeError`.
+    """
+
+    base_dir = categories_dir or DEFAULT_CATEGORIES_DIR
+    use_default_artifacts = base_dir == DEFAULT_CATEGORIES_DIR and KNOWLEDGE_ARTIFACT_DIR
+    if artifact_dir is None and use_default_artifacts:
+        artifact_dir = Path(KNOWLEDGE_ARTIFACT_DIR)
+    fingerprint = _fingerprint(base_dir)
+    try:
+        knowledge_hash = artifact.content_hash(base_dir)
+    except OSError as exc:
+        # a file was removed or renamed between glob and read
+        raise KnowledgeError(f"cannot read categories: {exc}") from exc
+
+    snapshot: Optional[KnowledgeSnapshot] = None
+    if artifact_dir is not None:
+        cached = artifact.read_artifact(artifact_dir, base_dir, knowledge_hash)
+        if isinstance(cached, KnowledgeSnapshot):
+            snapshot = replace(
+                cached,
+                categories_dir=base_dir,
+                fingerprint=fingerprint,
+                loaded_at=time.time(),
+            )
+
+    if snapshot is None:
+        snapshot = _compile_snapshot(base_dir, fingerprint, knowledge_hash)
+        for problem in snapshot.problems:
+            print(f"Knowledge schema warning: {problem}")
+        if artifact_dir is not None:
+            try:
+                artifact.write_artifact(artifact_dir, base_dir, knowledge_hash, snapshot)
+            except OSError as exc:
+                print(f"Knowledge artifact write error: {exc}")
+
+    if strict and snapshot.problems:
+        raise KnowledgeError("; ".join(snapshot.problems))
+    return snapshot
+
+
+def _publish(snapshot: KnowledgeSnapshot) -> KnowledgeSnapshot:
+    global _SNAPSHOT, KNOWLEDGE_DATA, KEYWORD_TO_CATEGORY, FORBIDDEN_TASKS
+    global CATEGORY_INDEX, PHRASE_MATCHER
+
+    snapshot = replace(snapshot, version=next(_VERSIONS))
+    KNOWLEDGE_DATA = snapshot.data
+    KEYWORD_TO_CATEGORY = snapshot.keyword_to_category
+    FORBIDDEN_TASKS = snapshot.forbidden_tasks
+    CATEGORY_INDEX = snapshot.category_index
+    PHRASE_MATCHER = snapshot.matcher
+    _SNAPSHOT = snapshot
+    get_metrics().set_gauge("omnidisp_knowledge_version", snapshot.version)
+    return snapshot
+
+
+def load_knowledge(categories_dir: Optional[Path] = None) -> KnowledgeSnapshot:
+    """Build a snapshot from ``categories_dir`` and publish it.
+
+    ``categories_dir`` also becomes the directory watched by
+    :func:`reload_knowledge`.
+    """
 
-    _LOADED = True
+    with _RELOAD_LOCK:
+        return _publish(build_snapshot(categories_dir))
 
 
-def _ensure_loaded() -> None:
-    if not _LOADED:
-        load_knowledge()
+def reload_knowledge(force: bool = False) -> KnowledgeSnapshot:
+    """Rebuild the knowledge base if its files changed (or if ``force``).
 
+    The new snapshot is built while the previous one keeps serving
+    requests. Returns the snapshot published after the call.
 
-def find_recommend_question(category_code: str, tasks: List[str]) -> Optional[str]:
-    """Pick a clarifying question for the detected category.
+    A rebuild with a file that does not parse or match the schema (say,
+    one caught in the middle of a write) is rejected: the current snapshot
+    stays published and ``omnidisp_knowledge_reload_failures_total`` grows.
+    The same files are not retried until they change again or ``force``.
+    """
 
-    The function first tries to match example phrases of symptoms/common
-    issues against the provided tasks. If nothing matches, it falls back to
-    the general ``clarifying_questions`` list.
+    global _last_reload_check, _rejected_fingerprint
+
+    current = get_snapshot()
+    with _RELOAD_LOCK:
+        _last_reload_check = time.monotonic()
+        latest = _SNAPSHOT or current
+        fingerprint = _fingerprint(latest.categories_dir)
+        if not force and fingerprint in (latest.fingerprint, _rejected_fingerprint):
+            return latest
+        try:
+            snapshot = build_snapshot(latest.categories_dir, strict=True)
+        except KnowledgeError as exc:
+            _rejected_fingerprint = fingerprint
+            get_metrics().inc("omnidisp_knowledge_reload_failures_total")
+            print(f"Knowledge reload rejected, keeping v{latest.version}: {exc}")
+            return latest
+        _rejected_fingerprint = None
+        return _publish(snapshot)
+
+
+def _reload_in_background() -> None:
+    try:
+        reload_knowledge()
+    except Exception as exc:  # noqa: BLE001
+        print(f"Knowledge reload error: {exc}")
+
+
+def schedule_reload_check() -> None:
+    """Start a background reload if the check interval has passed.
+
+    Called on the request path: it only compares a monotonic timestamp and,
+    at most once per ``KNOWLEDGE_RELOAD_INTERVAL`` seconds, hands the
+    mtime check and the rebuild to a daemon thread.
+    """
+
+    global _last_reload_check
+
+    if KNOWLEDGE_RELOAD_INTERVAL <= 0 or _SNAPSHOT is None:
+        return
+    now = time.monotonic()
+    if now - _last_reload_check < KNOWLEDGE_RELOAD_INTERVAL:
+        return
+    if not _RELOAD_LOCK.acquire(blocking=False):
+        return
+    try:
+        if now - _last_reload_check < KNOWLEDGE_RELOAD_INTERVAL:
+            return
+        _last_reload_check = now
+    finally:
+        _RELOAD_LOCK.release()
+    threading.Thread(
+        target=_reload_in_background, name="knowledge-reload", daemon=True
+    ).start()
+
+
+def get_snapshot() -> KnowledgeSnapshot:
+    """Return the snapshot pinned for this request or the published one."""
+
+    pinned = _PINNED_SNAPSHOT.get()
+    if pinned is not None:
+        return pinned
+    snapshot = _SNAPSHOT
+    if snapshot is None:
+        with _RELOAD_LOCK:
+            snapshot = _SNAPSHOT or _publish(build_snapshot())
+    return snapshot
+
+
+@contextmanager
+def pinned_snapshot(
+    snapshot: Optional[KnowledgeSnapshot] = None,
+) -> Iterator[KnowledgeSnapshot]:
+    """Make every lookup inside the block use the same snapshot."""
+
+    snapshot = snapshot or get_snapshot()
+    token = _PINNED_SNAPSHOT.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _PINNED_SNAPSHOT.reset(token)
+
+
+def build_phrase_matcher(
+    keyword_to_category: Dict[str, str], forbidden_tasks: Sequence[str]
+) -> PhraseMatcher:
+    """Compile knowledge phrases and built-in patterns into one automaton.
+
+    Phrases are added in the same order the dispatcher used to iterate
+    them, so the lowest ``order`` of a kind is the former first match.
     """
 
-    _ensure_loaded()
-    category = KNOWLEDGE_DATA.get(category_code) or {}
+    matcher = PhraseMatcher()
+    for keyword, category_code in keyword_to_category.items():
+        matcher.add(keyword, patterns.KIND_CATEGORY, category_code)
+    for keyword, category_code in patterns.FALLBACK_KEYWORDS.items():
+        matcher.add(keyword, patterns.KIND_CATEGORY_FALLBACK, category_code)
+    matcher.add_many(forbidden_tasks, patterns.KIND_STOP)
+    matcher.add_many(patterns.FALLBACK_STOP_PHRASES, patterns.KIND_STOP_FALLBACK)
+    matcher.add_many(patterns.PRICE_QUESTION_PATTERNS, patterns.KIND_PRICE_QUESTION)
+    matcher.add_many(patterns.GREETING_PATTERNS, patterns.KIND_GREETING)
+    matcher.add_many(patterns.ADDRESS_PATTERNS, patterns.KIND_ADDRESS)
+    matcher.add_many(patterns.VISIT_TIME_PATTERNS, patterns.KIND_VISIT_TIME)
+    return matcher.build()
+
+
+def get_phrase_matcher() -> PhraseMatcher:
+    """Return the automaton of the current snapshot."""
+
+    return get_snapshot().matcher
+
+
+def build_token_index(
+    keyword_to_category: Dict[str, str], forbidden_tasks: Sequence[str]
+) -> TokenIndex:
+    """Index keywords and stop-phrases by word stems.
+
+    Only the kinds that name things (categories and stop-phrases) are
+    indexed; dialog-step patterns stay exact substrings. The insertion order
+    matches :func:`build_phrase_matcher`, so hit orders agree between both.
+    """
+
+    index = TokenIndex()
+    for keyword, category_code in keyword_to_category.items():
+        index.add(keyword, patterns.KIND_CATEGORY, category_code)
+    for keyword, category_code in patterns.FALLBACK_KEYWORDS.items():
+        index.add(keyword, patterns.KIND_CATEGORY_FALLBACK, category_code)
+    index.add_many(forbidden_tasks, patterns.KIND_STOP)
+    index.add_many(patterns.FALLBACK_STOP_PHRASES, patterns.KIND_STOP_FALLBACK)
+    return index
+
+
+def get_token_index() -> Optional[TokenIndex]:
+    """Stem index of the current snapshot, or ``None`` if morphology is off."""
+
+    if not KNOWLEDGE_MORPHOLOGY:
+        return None
+    return get_snapshot().token_index
+
+
+def build_fuzzy_index(keyword_to_category: Dict[str, str]) -> FuzzyIndex:
+    """Index the words of the category keywords (knowledge first, then fallback)."""
+
+    index = FuzzyIndex()
+    index.add_many(keyword_to_category)
+    index.add_many(patterns.FALLBACK_KEYWORDS)
+    return index
+
+
+def get_fuzzy_index() -> Optional[FuzzyIndex]:
+    """Typo index of the current snapshot, or ``None`` if fuzzy lookup is off."""
+
+    if not KNOWLEDGE_FUZZY:
+        return None
+    return get_snapshot().fuzzy_index
+
 
-    normalized_tasks = [normalize_text(task) for task in tasks]
+def _parse_price(value: object) -> Optional[int]:
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def build_category_index(category: CategoryData) -> CategoryIndex:
+    """Precompute prices and clarifying-question lookups for a category."""
+
+    work_prices = [
+        price
+        for price in (
+            _parse_price(job.get("price_work_from"))
+            for job in category.get("jobs") or []
+            if isinstance(job, dict)
+        )
+        if price is not None
+    ]
+
+    example_matcher = PhraseMatcher()
     symptom_entries = category.get("symptoms") or category.get("common_issues") or []
     for symptom in symptom_entries:
-        examples = symptom.get("example_phrases") or []
+        if not isinstance(symptom, dict):
+            continue
         question = symptom.get("clarify_question")
         if not question:
             continue
-        for example in examples:
-            normalized_example = normalize_text(example)
-            if any(normalized_example in task for task in normalized_tasks):
-                return question
+        for example in symptom.get("example_phrases") or []:
+            if not isinstance(example, str):
+                continue
+            example_matcher.add(normalize_text(example), _EXAMPLE_KIND, question)
 
     questions = category.get("clarifying_questions") or []
-    if questions:
-        return questions[0]
-    return None
+    return CategoryIndex(
+        min_price=min(work_prices) if work_prices else None,
+        example_matcher=example_matcher.build(),
+        fallback_question=questions[0] if questions else None,
+        title=category.get("title") or None,
+        answer_templates=compile_templates(category.get("answer_templates") or []),
+    )
 
 
-def get_min_price(category_code: str) -> Optional[int]:
-    """Return minimal labour price for the category if provided."""
+def get_category_index(category_code: str) -> Optional[CategoryIndex]:
+    """Return the precomputed index of a category, if it was loaded."""
 
-    _ensure_loaded()
-    category = KNOWLEDGE_DATA.get(category_code) or {}
-    jobs = category.get("jobs") or []
-    prices: List[int] = []
-    for job in jobs:
-        if "price_work_from" not in job:
-            continue
+    return get_snapshot().category_index.get(category_code)
+
+
+def find_recommend_question(
+    category_code: str,
+    tasks: List[str],
+    normalized_tasks: Optional[Sequence[str]] = None,
+) -> Optional[str]:
+    """Pick a clarifying question for the detected category.
 
-        price_value = job.get("price_work_from")
-        if isinstance(price_value, (int, float)):
-            prices.append(int(price_value))
-        elif isinstance(price_value, str) and price_value.strip().isdigit():
-            prices.append(int(price_value.strip()))
+    The function first tries to match example phrases of symptoms/common
+    issues against the provided tasks. If nothing matches, it falls back to
+    the general ``clarifying_questions`` list. Callers that already hold
+    the normalized tasks pass them as ``normalized_tasks``.
+    """
 
-    if not prices:
+    index = get_category_index(category_code)
+    if index is None:
         return None
-    return min(prices)
+
+    if normalized_tasks is None:
+        normalized_tasks = [normalize_text(task) for task in tasks]
+
+    best_hit = None
+    for normalized_task in normalized_tasks:
+        hit = index.example_matcher.first(normalized_task, _EXAMPLE_KIND)
+        if hit is not None and (best_hit is None or hit.order < best_hit.order):
+            best_hit = hit
+    if best_hit is not None:
+        return best_hit.value
+    return index.fallback_question
+
+
+def get_answer_templates(category_code: str) -> Tuple[AnswerTemplate, ...]:
+    """Templates to try for the category: its own first, then the defaults."""
+
+    index = get_category_index(category_code)
+    if index is None or not index.answer_templates:
+        return DEFAULT_ANSWER_TEMPLATES
+    return index.answer_templates + DEFAULT_ANSWER_TEMPLATES
+
+
+def get_min_price(category_code: str) -> Optional[int]:
+    """Return minimal labour price for the category if provided."""
+
+    index = get_category_index(category_code)
+    return index.min_price if index is not None else None
@@ -0,0 +1,156 @@
+"""Aho-Corasick automaton for multi-phrase substring lookups.
+
+The dispatcher checks every message against keywords, stop-phrases and
+dialog-step patterns. Instead of running ``phrase in text`` for every
+phrase, all of them are compiled into one automaton, and a single pass over
+the text reports every occurrence together with its offset and kind.
+
+Each phrase carries a ``kind`` (what the phrase is used for), an ``order``
+(its position inside that kind) and an optional ``value`` (e.g. the
+category code of a keyword). ``order`` preserves the priority of the old
+``for phrase in phrases`` loops: the first phrase in list order wins, not
+the leftmost one in the text.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+
+class PhraseHit(NamedTuple):
+    """Single occurrence of a phrase in the scanned text."""
+
+    start: int
+    end: int
+    kind: str
+    order: int
+    phrase: str
+    value: str
+
+
+_Output = Tuple[str, int, str, str]
+"""(kind, order, phrase, value) stored on the terminal node of a phrase."""
+
+
+class PhraseMatcher:
+    """Compiled set of phrases with a linear-time ``scan``.
+
+    Phrases are added with :meth:`add` and become searchable after
+    :meth:`build`. Empty phrases are ignored.
+    """
+
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[_Output]] = [[]]
+        self._output_link: List[int] = [0]
+        self._counts: Dict[str, int] = {}
+        self._built = False
+
+    def add(self, phrase: str, kind: str, value: str = "") -> None:
+        """Register ``phrase`` under ``kind``; order follows call order."""
+
+        if not phrase:
+            return
+        if self._built:
+            raise RuntimeError("PhraseMatcher is already built")
+
+        order = self._counts.get(kind, 0)
+        self._counts[kind] = order + 1
+
+        node = 0
+        for char in phrase:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._output_link.append(0)
+            node = next_node
+        self._outputs[node].append((kind, order, phrase, value))
+
+    def add_many(self, phrases: Iterable[str], kind: str) -> None:
+        for phrase in phrases:
+            self.add(phrase, kind)
+
+    def build(self) -> "PhraseMatcher":
+        """Compute failure and output links (breadth-first)."""
+
+        queue: deque = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._output_link[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(char, 0)
+                self._fail[child] = link
+                self._output_link[child] = (
+                    link if self._outputs[link] else self._output_link[link]
+                )
+
+        self._built = True
+        return self
+
+    def has_kind(self, kind: str) -> bool:
+        """Whether at least one phrase of ``kind`` was registered."""
+
+        return self._counts.get(kind, 0) > 0
+
+    def iter_hits(self, text: str) -> Iterator[PhraseHit]:
+        """Yield every phrase occurrence in ``text`` in order of end offset."""
+
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        output_link = self._output_link
+
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            match_node = node if outputs[node] else output_link[node]
+            while match_node:
+                for kind, order, phrase, value in outputs[match_node]:
+                    end = index + 1
+                    yield PhraseHit(end - len(phrase), end, kind, order, phrase, value)
+                match_node = output_link[match_node]
+
+    def scan(self, text: str) -> List[PhraseHit]:
+        return list(self.iter_hits(text))
+
+    def first_by_kind(
+        self, text: str, kinds: Optional[Iterable[str]] = None
+    ) -> Dict[str, PhraseHit]:
+        """Return the highest-priority (lowest ``order``) hit per kind."""
+
+        wanted: Optional[Set[str]] = set(kinds) if kinds is not None else None
+        best: Dict[str, PhraseHit] = {}
+        for hit in self.iter_hits(text):
+            if wanted is not None and hit.kind not in wanted:
+                continue
+            current = best.get(hit.kind)
+            if current is None or hit.order < current.order:
+                best[hit.kind] = hit
+        return best
+
+    def first(self, text: str, kind: str) -> Optional[PhraseHit]:
+        """Highest-priority hit of ``kind`` in ``text`` or ``None``."""
+
+        return self.first_by_kind(text, (kind,)).get(kind)
+
+    def contains(self, text: str, kind: str) -> bool:
+        """Whether ``text`` contains any phrase of ``kind``."""
+
+        return any(hit.kind == kind for hit in self.iter_hits(text))
@@ -0,0 +1,92 @@
+"""Built-in phrase lists used by the dispatcher.
+
+These lists back the knowledge base: fallback stop-phrases and keywords are
+only consulted while the JSON files do not provide their own, and the
+dialog-step patterns are always active. They are kept here so that
+:func:`omnidisp.app.knowledge.loader.load_knowledge` can compile them into
+the same automaton as the knowledge keywords.
+
+All phrases are expected to be normalized already (lowercase, ``е``
+instead of ``ё``).
+"""
+
+from typing import Dict, List
+
+# Hit kinds produced by the phrase matcher.
+KIND_STOP = "stop"
+KIND_STOP_FALLBACK = "stop_fallback"
+KIND_CATEGORY = "category"
+KIND_CATEGORY_FALLBACK = "category_fallback"
+KIND_PRICE_QUESTION = "price_question"
+KIND_GREETING = "greeting"
+KIND_ADDRESS = "address"
+KIND_VISIT_TIME = "visit_time"
+
+FALLBACK_STOP_PHRASES: List[str] = [
+    "люстра",
+    "люстру",
+    "люстры",
+    "потолочный светильник",
+    "газовая плита",
+    "газовая колонка",
+    "газовый котел",
+    "газ",
+    "газовое",
+    "сварка",
+    "сварочные работы",
+    "стояк",
+    "стояки",
+    "разводка труб",
+    "заменить трубы",
+    "проложить трубы",
+]
+
+FALLBACK_KEYWORDS: Dict[str, str] = {
+    "холодильник": "fridge",
+    "морозилка": "fridge",
+    "стиралка": "washing_machine",
+    "стиральная машина": "washing_machine",
+    "см ": "washing_machine",
+    "посудомойка": "dishwasher",
+    "пмм": "dishwasher",
+    "посудомоечная машина": "dishwasher",
+    "телевизор": "tv",
+    "тв": "tv",
+    "ноутбук": "laptop",
+    "ноут": "laptop",
+    "моноблок": "laptop",
+    "пк": "pc",
+    "компьютер": "pc",
+    "системный блок": "pc",
+}
+
+GREETING_TASKS = frozenset(
+    {
+        "здравствуйте",
+        "привет",
+        "добрый день",
+        "добрый",
+        "доброе утро",
+        "доброе",
+        "добрый вечер",
+    }
+)
+"""Tasks that consist of a greeting only and are skipped by stop-factors."""
+
+PRICE_QUESTION_PATTERNS: List[str] = [
+    "сколько стоит",
+    "какая цена",
+    "по цене",
+    "стоимость",
+]
+
+GREETING_PATTERNS: List[str] = ["здрав", "привет", "добрый", "доброе"]
+
+ADDRESS_PATTERNS: List[str] = ["адрес", "куда подъехать", "куда ехать"]
+
+VISIT_TIME_PATTERNS: List[str] = [
+    "когда сможете",
+    "во сколько",
+    "сегодня сможете",
+    "завтра сможете",
+]
@@ -0,0 +1,135 @@
+"""Russian Snowball stemmer, bundled so the service needs no NLP packages.
+
+A plain-Python port of the Snowball "russian" algorithm
+(https://snowballstem.org/algorithms/russian/stemmer.html). It expects
+normalized input (lowercase, ``е`` instead of ``ё``) and strips inflection
+so that "люстра", "люстру" and "люстры" all become "люстр".
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+_VOWELS = frozenset("аеиоуыэюя")
+
+
+def _by_length(*endings: str) -> Tuple[str, ...]:
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+_PERFECTIVE_GERUND_1 = ("в", "вши", "вшись")
+_PERFECTIVE_GERUND_2 = ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись")
+_ADJECTIVE = _by_length(
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым",
+    "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)  # fmt: skip
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_REFLEXIVE = ("ся", "сь")
+_VERB_1 = (
+    "ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют",
+    "ны", "ть", "ешь", "нно",
+)  # fmt: skip
+_VERB_2 = (
+    "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил",
+    "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт",
+    "ены", "ить", "ыть", "ишь", "ую", "ю",
+)  # fmt: skip
+_NOUN = _by_length(
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией",
+    "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах",
+    "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я",
+)  # fmt: skip
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+_GROUPED = {
+    "perfective_gerund": _by_length(*_PERFECTIVE_GERUND_1, *_PERFECTIVE_GERUND_2),
+    "participle": _by_length(*_PARTICIPLE_1, *_PARTICIPLE_2),
+    "verb": _by_length(*_VERB_1, *_VERB_2),
+}
+_NEEDS_A_OR_YA = frozenset(_PERFECTIVE_GERUND_1 + _PARTICIPLE_1 + _VERB_1)
+
+
+def _regions(word: str) -> Tuple[int, int]:
+    """Start offsets of RV and R2."""
+
+    rv = len(word)
+    for index, char in enumerate(word):
+        if char in _VOWELS:
+            rv = index + 1
+            break
+
+    def after_vowel_consonant(start: int) -> int:
+        for index in range(start + 1, len(word)):
+            if word[index - 1] in _VOWELS and word[index] not in _VOWELS:
+                return index + 1
+        return len(word)
+
+    r1 = after_vowel_consonant(0)
+    r2 = after_vowel_consonant(r1) if r1 < len(word) else len(word)
+    return rv, r2
+
+
+def _strip(word: str, rv: int, endings: Sequence[str], grouped: bool = False) -> Optional[str]:
+    """``word`` without the longest ending from ``endings`` inside RV, or ``None``.
+
+    For the "group 1" endings of the grouped classes the ending must follow
+    "а" or "я", which stays in place; if the longest match fails that check
+    nothing is removed, as in Snowball.
+    """
+
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            cut = len(word) - len(ending)
+            if grouped and ending in _NEEDS_A_OR_YA:
+                if cut - 1 < rv or word[cut - 1] not in "ая":
+                    return None
+            return word[:cut]
+    return None
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Stem of a single normalized word."""
+
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Step 1
+    stripped = _strip(word, rv, _GROUPED["perfective_gerund"], grouped=True)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        stripped = _strip(word, rv, _ADJECTIVE)
+        if stripped is not None:
+            word = _strip(stripped, rv, _GROUPED["participle"], grouped=True) or stripped
+        else:
+            stripped = _strip(word, rv, _GROUPED["verb"], grouped=True)
+            if stripped is None:
+                stripped = _strip(word, rv, _NOUN)
+            if stripped is not None:
+                word = stripped
+
+    # Step 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Step 3
+    for ending in _DERIVATIONAL:
+        if word.endswith(ending) and len(word) - len(ending) >= max(r2, rv):
+            word = word[: -len(ending)]
+            break
+
+    # Step 4
+    stripped = _strip(word, rv, _SUPERLATIVE)
+    if stripped is not None:
+        word = stripped
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif stripped is None and word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
@@ -0,0 +1,109 @@
+"""Inverted index of knowledge phrases over stemmed tokens.
+
+The substring automaton in :mod:`.matcher` only finds phrases written
+exactly as in the knowledge base. This index finds their inflected forms:
+phrases and messages are split into words, every word is reduced by the
+bundled :func:`~omnidisp.app.knowledge.stemmer.stem`, and a phrase matches
+when its stems occur consecutively in the message.
+
+Phrases are indexed by their first stem, so a lookup costs one dictionary
+probe per message word plus a comparison per candidate phrase — it depends
+on the message length, not on the size of the knowledge base. ``order``
+follows the same rules as in :class:`~omnidisp.app.knowledge.matcher.PhraseMatcher`.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from omnidisp.app.knowledge.stemmer import stem
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def stem_tokens(text: str) -> Tuple[str, ...]:
+    """Stems of the words of a normalized ``text``."""
+
+    return tuple(stem(token) for token in TOKEN_RE.findall(text))
+
+
+class TokenHit(NamedTuple):
+    """Phrase found at token offsets ``start:end`` of the stemmed text."""
+
+    start: int
+    end: int
+    kind: str
+    order: int
+    phrase: str
+    value: str
+
+
+_Entry = Tuple[Tuple[str, ...], str, int, str, str]
+"""(stems, kind, order, phrase, value)"""
+
+
+class TokenIndex:
+    """Stemmed phrases of several kinds, looked up by their first stem."""
+
+    def __init__(self) -> None:
+        self._by_first: Dict[str, List[_Entry]] = {}
+        self._counts: Dict[str, int] = {}
+
+    def add(self, phrase: str, kind: str, value: str = "") -> None:
+        """Register a normalized ``phrase``; order follows call order."""
+
+        if not phrase:
+            return
+        order = self._counts.get(kind, 0)
+        self._counts[kind] = order + 1
+        stems = stem_tokens(phrase)
+        if stems:
+            self._by_first.setdefault(stems[0], []).append((stems, kind, order, phrase, value))
+
+    def add_many(self, phrases: Iterable[str], kind: str) -> None:
+        for phrase in phrases:
+            self.add(phrase, kind)
+
+    def has_kind(self, kind: str) -> bool:
+        return self._counts.get(kind, 0) > 0
+
+    def iter_hits(self, stems: Sequence[str], kind: Optional[str] = None) -> Iterator[TokenHit]:
+        """Every phrase (of ``kind``, if given) found in the stemmed text."""
+
+        by_first = self._by_first
+        for start, first in enumerate(stems):
+            for phrase_stems, phrase_kind, order, phrase, value in by_first.get(first, ()):
+                if kind is not None and phrase_kind != kind:
+                    continue
+                end = start + len(phrase_stems)
+                if end <= len(stems) and tuple(stems[start:end]) == phrase_stems:
+                    yield TokenHit(start, end, phrase_kind, order, phrase, value)
+
+    def first(self, stems: Sequence[str], kind: str) -> Optional[TokenHit]:
+        """Highest-priority (lowest ``order``) hit of ``kind`` or ``None``."""
+
+        best = None
+        for hit in self.iter_hits(stems, kind):
+            if best is None or hit.order < best.order:
+                best = hit
+        return best
+
+    def contains(self, stems: Sequence[str], kind: str) -> bool:
+        return next(self.iter_hits(stems, kind), None) is not None
+
+
+def redundant_phrases(phrases: Iterable[str]) -> List[Tuple[str, str]]:
+    """Pairs ``(phrase, earlier phrase)`` that differ only by inflection."""
+
+    seen: Dict[Tuple[str, ...], str] = {}
+    duplicates: List[Tuple[str, str]] = []
+    for phrase in phrases:
+        stems = stem_tokens(phrase)
+        if not stems:
+            continue
+        if stems in seen:
+            duplicates.append((phrase, seen[stems]))
+        else:
+            seen[stems] = phrase
+    return duplicates
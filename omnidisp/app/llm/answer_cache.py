@@ -0,0 +1,91 @@
+"""LRU + TTL cache of model answers.
+
+Answers are keyed by the canonical dispatch plan (see
+:func:`omnidisp.app.llm.prompt_builder.build_plan_key`), not by the raw
+prompt, so near-identical customer messages share one model call. The cache
+is off by default and configured in ``config.settings``.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from omnidisp.config.settings import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_SIZE,
+    LLM_CACHE_SKIP_PLAN_TYPES,
+    LLM_CACHE_TTL,
+)
+
+
+class AnswerCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 600.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+_answer_cache: Optional[AnswerCache] = (
+    AnswerCache(max_size=LLM_CACHE_MAX_SIZE, ttl=LLM_CACHE_TTL) if LLM_CACHE_ENABLED else None
+)
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide cache, or ``None`` when caching is disabled."""
+
+    return _answer_cache
+
+
+def is_cacheable_plan(plan_type: str) -> bool:
+    return plan_type not in LLM_CACHE_SKIP_PLAN_TYPES
@@ -0,0 +1,290 @@
+"""Pool of OpenAI-compatible model backends with rate-limit-aware routing.
+
+A backend is one (URL, API key, model) combination: several keys of one
+provider, several models or several providers can stand side by side. Each
+backend keeps two views of how much it may still be asked:
+
+- a local token bucket refilled at the configured ``rpm`` (requests per
+  minute, ``0`` — no local limit);
+- the provider's own counters from the last response:
+  ``x-ratelimit-remaining-{requests,tokens}`` against
+  ``x-ratelimit-limit-{requests,tokens}``, valid until
+  ``x-ratelimit-reset-{requests,tokens}`` (Groq and OpenAI send these).
+
+:meth:`BackendPool.acquire` hands out the available backend with the most
+headroom — the smallest of those fractions. A backend answering 429 is put
+aside for ``retry-after`` seconds (or until its reset time) and the caller
+tries the next one. Every backend has its own circuit breaker, named after
+the backend.
+
+``LLM_BACKENDS`` configures the pool as a JSON list, for example::
+
+    [{"name": "groq-a", "api_key_env": "GROQ_KEY_A", "rpm": 30},
+     {"name": "groq-b", "api_key_env": "GROQ_KEY_B", "model": "llama-3.3-70b-versatile"},
+     {"name": "local", "url": "http://10.0.0.5:8000/v1/chat/completions", "api_key": "-"}]
+
+Missing ``url`` and ``model`` default to the ``GROQ_*`` settings; entries
+without a key are skipped. An empty ``LLM_BACKENDS`` gives a single backend
+from ``GROQ_API_URL`` / ``GROQ_API_KEY`` / ``GROQ_MODEL``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Collection, Dict, List, Mapping, Optional, Tuple
+
+from omnidisp.app.llm.circuit_breaker import CircuitBreaker, get_circuit_breaker
+from omnidisp.app.utils.metrics import get_metrics
+
+HEADROOM_GAUGE = "omnidisp_llm_backend_headroom"
+
+# Pause after a 429 that says neither retry-after nor reset time.
+DEFAULT_COOLDOWN = 5.0
+
+_LIMIT_KINDS = ("requests", "tokens")
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds from ``"7.66s"``, ``"2m59.56s"``, ``"120ms"`` or ``"3"``; ``None`` if unreadable."""
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class TokenBucket:
+    """``capacity`` tokens refilled at ``rate`` per second. Not thread-safe by itself."""
+
+    def __init__(
+        self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def fraction(self) -> float:
+        self._refill()
+        return self._tokens / self.capacity
+
+    def available(self) -> bool:
+        self._refill()
+        return self._tokens >= 1.0
+
+    def try_take(self) -> bool:
+        if not self.available():
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class Backend:
+    """One model endpoint with its key, model and rate-limit state."""
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        api_key: str,
+        model: str,
+        rpm: float = 0.0,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.bucket = (
+            TokenBucket(rpm / 60.0, rpm if burst is None else burst, clock) if rpm > 0 else None
+        )
+        self.breaker: Optional[CircuitBreaker] = get_circuit_breaker(name)
+        self.cooldown_until = 0.0
+        # kind -> (remaining / limit, when the provider resets the counter)
+        self.server_limits: Dict[str, Tuple[float, float]] = {}
+
+    def headroom(self, now: float) -> float:
+        """Share of the allowed rate still available: 0 — none, 1 — untouched."""
+
+        if now < self.cooldown_until:
+            return 0.0
+        fractions = [1.0]
+        if self.bucket is not None:
+            fractions.append(self.bucket.fraction())
+        for fraction, reset_at in self.server_limits.values():
+            if now < reset_at:
+                fractions.append(fraction)
+        return min(fractions)
+
+    def update_limits(self, headers: Mapping[str, str], now: float) -> None:
+        for kind in _LIMIT_KINDS:
+            remaining = _header_number(headers, f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            limit = _header_number(headers, f"x-ratelimit-limit-{kind}")
+            if limit:
+                fraction = min(remaining / limit, 1.0)
+            else:
+                fraction = 1.0 if remaining > 0 else 0.0
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            self.server_limits[kind] = (fraction, now + (reset if reset is not None else 60.0))
+
+    def retry_delay(self, headers: Optional[Mapping[str, str]]) -> float:
+        """How long to leave the backend alone after a 429."""
+
+        if headers is not None:
+            delay = parse_duration(headers.get("retry-after"))
+            if delay is None:
+                resets = [
+                    parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                    for kind in _LIMIT_KINDS
+                ]
+                delay = max((reset for reset in resets if reset is not None), default=None)
+            if delay is not None:
+                return delay
+        return DEFAULT_COOLDOWN
+
+
+class BackendPool:
+    """Thread-safe router over configured backends."""
+
+    def __init__(
+        self, backends: List[Backend], clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.backends = list(backends)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude: Collection[Backend] = ()) -> Tuple[Optional[Backend], str]:
+        """The backend to call now, or ``(None, reason)``.
+
+        Backends are tried by headroom, best first; one whose local bucket
+        or provider counters are exhausted, or which is cooling down after
+        a 429, is skipped (reason ``no_capacity``), one whose breaker
+        refuses the call too (reason ``circuit_open``).
+        """
+
+        with self._lock:
+            now = self._clock()
+            candidates = [backend for backend in self.backends if backend not in exclude]
+            # sorted() is stable: on equal headroom the earlier configured backend wins.
+            ranked = sorted(candidates, key=lambda backend: -backend.headroom(now))
+            reason = "no_backend"
+            for backend in ranked:
+                if backend.headroom(now) <= 0.0 or (
+                    backend.bucket is not None and not backend.bucket.available()
+                ):
+                    reason = "no_capacity"
+                    continue
+                if backend.breaker is not None and not backend.breaker.allow():
+                    reason = "circuit_open"
+                    continue
+                if backend.bucket is not None:
+                    backend.bucket.try_take()
+                self._publish(backend, now)
+                return backend, ""
+            return None, reason
+
+    def record(
+        self, backend: Backend, status: str, headers: Optional[Mapping[str, str]] = None
+    ) -> None:
+        """Report how a call to ``backend`` ended: ``"ok"`` or the error kind."""
+
+        with self._lock:
+            now = self._clock()
+            if headers is not None:
+                backend.update_limits(headers, now)
+            if status == "rate_limited":
+                backend.cooldown_until = max(
+                    backend.cooldown_until, now + backend.retry_delay(headers)
+                )
+            self._publish(backend, now)
+        get_metrics().inc(
+            "omnidisp_llm_backend_requests_total", backend=backend.name, status=status
+        )
+
+    def stats(self) -> List[Dict[str, object]]:
+        with self._lock:
+            now = self._clock()
+            return [
+                {
+                    "name": backend.name,
+                    "model": backend.model,
+                    "headroom": round(backend.headroom(now), 3),
+                    "cooling_down": now < backend.cooldown_until,
+                    "circuit": "disabled" if backend.breaker is None else backend.breaker.state,
+                }
+                for backend in self.backends
+            ]
+
+    def _publish(self, backend: Backend, now: float) -> None:
+        get_metrics().set_gauge(HEADROOM_GAUGE, backend.headroom(now), backend=backend.name)
+
+
+def load_backends(
+    config: str, default_url: str, default_key: str, default_model: str, default_rpm: float = 0.0
+) -> List[Backend]:
+    """Backends from the ``LLM_BACKENDS`` JSON; ``ValueError`` on malformed config."""
+
+    if not config.strip():
+        entries: object = [{"name": default_url, "api_key": default_key, "rpm": default_rpm}]
+    else:
+        entries = json.loads(config)
+    if not isinstance(entries, list):
+        raise ValueError("LLM_BACKENDS must be a JSON list")
+
+    backends: List[Backend] = []
+    names = set()
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"LLM_BACKENDS[{position}] must be an object")
+        api_key = entry.get("api_key") or os.environ.get(entry.get("api_key_env") or "", "")
+        if not api_key:
+            continue
+        url = entry.get("url") or default_url
+        model = entry.get("model") or default_model
+        name = str(entry.get("name") or f"{url}#{model}#{position}")
+        if name in names:
+            raise ValueError(f"LLM_BACKENDS: duplicate backend name {name!r}")
+        names.add(name)
+        backends.append(
+            Backend(
+                name,
+                url,
+                api_key,
+                model,
+                rpm=float(entry.get("rpm") or 0),
+                burst=None if entry.get("burst") is None else float(entry["burst"]),
+            )
+        )
+    return backends
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
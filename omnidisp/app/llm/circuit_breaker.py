@@ -0,0 +1,165 @@
+"""Circuit breaker in front of the model provider.
+
+After ``failure_threshold`` consecutive failures (timeouts, connection
+errors, 5xx and 429 answers) the breaker *opens*: calls are refused at once
+instead of each waiting for the provider's timeout. After ``reset_timeout``
+seconds it becomes *half-open* and lets ``half_open_probes`` calls through;
+a successful probe closes the breaker, a failed one opens it again. A probe
+that ends without saying anything about the provider (a 4xx answer, a
+cancelled call) must be given back with :meth:`CircuitBreaker.release`,
+otherwise its slot stays taken and the breaker never leaves half-open.
+
+There is one breaker per provider endpoint (see :func:`get_circuit_breaker`).
+Its state is exported as the gauge ``omnidisp_llm_circuit_state``
+(0 — closed, 1 — half-open, 2 — open), transitions are counted in
+``omnidisp_llm_circuit_transitions_total``; both are labelled with the
+endpoint.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from omnidisp.app.utils.metrics import get_metrics
+from omnidisp.config.settings import (
+    LLM_CIRCUIT_ENABLED,
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_HALF_OPEN_PROBES,
+    LLM_CIRCUIT_RESET_TIMEOUT,
+)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+STATE_GAUGE = "omnidisp_llm_circuit_state"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure breaker."""
+
+    def __init__(
+        self,
+        endpoint: str = "",
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.endpoint = endpoint
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = max(half_open_probes, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._rejected = 0
+        get_metrics().set_gauge(STATE_GAUGE, _STATE_VALUES[CLOSED], endpoint=endpoint)
+
+    @property
+    def state(self) -> str:
+        """Current state; an open breaker past ``reset_timeout`` reports half-open."""
+
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """May a call go to the provider now?
+
+        Every allowed call must end in :meth:`record_success`,
+        :meth:`record_failure` or :meth:`release`.
+        """
+
+        with self._lock:
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout:
+                    self._rejected += 1
+                    return False
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self._rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def release(self) -> None:
+        """An allowed call ended without a verdict on the provider; frees its probe slot."""
+
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = self._clock()
+                self._transition(OPEN)
+
+    def stats(self) -> Dict[str, object]:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "rejected": self._rejected,
+            }
+
+    def _transition(self, state: str) -> None:
+        self._state = state
+        self._probes = 0
+        if state == CLOSED:
+            self._failures = 0
+        registry = get_metrics()
+        registry.set_gauge(STATE_GAUGE, _STATE_VALUES[state], endpoint=self.endpoint)
+        registry.inc(
+            "omnidisp_llm_circuit_transitions_total", endpoint=self.endpoint, state=state
+        )
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str) -> Optional[CircuitBreaker]:
+    """Process-wide breaker for ``endpoint``, or ``None`` when breakers are disabled."""
+
+    if not LLM_CIRCUIT_ENABLED:
+        return None
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(endpoint)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    endpoint,
+                    LLM_CIRCUIT_FAILURE_THRESHOLD,
+                    LLM_CIRCUIT_RESET_TIMEOUT,
+                    LLM_CIRCUIT_HALF_OPEN_PROBES,
+                )
+                _breakers[endpoint] = breaker
+    return breaker
+
+
+def circuit_state(endpoint: str) -> str:
+    """State of the breaker for ``endpoint``, ``"disabled"`` when breakers are off."""
+
+    breaker = get_circuit_breaker(endpoint)
+    return "disabled" if breaker is None else breaker.state
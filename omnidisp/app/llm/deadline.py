@@ -0,0 +1,57 @@
+"""Per-request time budget for model calls.
+
+HTTP handlers open :func:`request_deadline` around the processing of one
+request; everything below — :class:`~omnidisp.app.llm.llm_client.LLMClient`,
+the single-flight waiters — reads the remaining time from a context
+variable, so no signature between the handler and the HTTP call changes.
+Nested deadlines can only shorten the budget.
+
+Context variables follow asyncio tasks automatically; code that hands work
+to a thread pool has to run it in a copy of the caller's context
+(``contextvars.copy_context().run``) for the deadline to apply there.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("omnidisp_llm_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """Limit the code inside to ``seconds`` from now (``None`` or ``<= 0``: no new limit)."""
+
+    current = _DEADLINE.get()
+    if seconds is None or seconds <= 0:
+        yield current
+        return
+    deadline = time.monotonic() + seconds
+    if current is not None and current < deadline:
+        deadline = current
+    token = _DEADLINE.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or ``None`` without a deadline."""
+
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def clamp(timeout: float) -> float:
+    """``timeout`` shortened to the remaining budget (never negative)."""
+
+    left = remaining()
+    if left is None:
+        return timeout
+    return max(min(timeout, left), 0.0)
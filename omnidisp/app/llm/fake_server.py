@@ -0,0 +1,248 @@
+"""Local stand-in for an OpenAI-compatible chat completions API.
+
+Used by tests and load tools instead of the real provider. The server
+answers ``POST /v1/chat/completions`` with a canned reply (word by word
+as SSE when the request sets ``"stream": true``) after a configurable
+latency and fails a configurable share of requests. With ``rate_limit``
+set it also behaves like a rate-limited provider: every answer carries
+``x-ratelimit-*`` headers and requests over the limit get 429 with
+``retry-after``.
+
+Run standalone::
+
+    python -m omnidisp.app.llm.fake_server --port 8100 --latency-ms 300 --error-rate 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class FakeLLMServer:
+    """OpenAI-compatible fake running in a background thread.
+
+    - ``answer``: reply text; ``None`` echoes the last user message.
+    - ``latency_ms`` / ``jitter_ms``: delay before answering, uniformly
+      distributed in ``latency_ms ± jitter_ms``.
+    - ``error_rate``: share of requests answered with ``error_status``.
+    - ``rate_limit``: requests allowed per ``rate_window`` seconds (0 — no limit).
+    """
+
+    def __init__(
+        self,
+        answer: Optional[str] = "Здравствуйте. Опишите, пожалуйста, проблему подробнее.",
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: Optional[int] = None,
+        rate_limit: int = 0,
+        rate_window: float = 60.0,
+    ) -> None:
+        self.answer = answer
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.rate_limited_count = 0
+        self._window_started = time.monotonic()
+        self._window_used = 0
+        self.prompts: List[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    @property
+    def request_count(self) -> int:
+        with self._lock:
+            return len(self.prompts)
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-llm", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread until interrupted."""
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def _plan_response(self, prompt: str) -> tuple:
+        with self._lock:
+            limit_headers = self._take_rate_limit()
+            if limit_headers.get("retry-after"):
+                self.rate_limited_count += 1
+                return 0.0, 429, limit_headers
+            self.prompts.append(prompt)
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            failed = self._random.random() < self.error_rate
+        return max(delay, 0.0) / 1000, self.error_status if failed else None, limit_headers
+
+    def _take_rate_limit(self) -> Dict[str, str]:
+        if not self.rate_limit:
+            return {}
+        now = time.monotonic()
+        if now - self._window_started >= self.rate_window:
+            self._window_started = now
+            self._window_used = 0
+        reset = max(self.rate_window - (now - self._window_started), 0.0)
+        headers = {
+            "x-ratelimit-limit-requests": str(self.rate_limit),
+            "x-ratelimit-reset-requests": f"{reset:.2f}s",
+        }
+        if self._window_used >= self.rate_limit:
+            headers["x-ratelimit-remaining-requests"] = "0"
+            headers["retry-after"] = str(max(int(reset + 0.999), 1))
+            return headers
+        self._window_used += 1
+        headers["x-ratelimit-remaining-requests"] = str(self.rate_limit - self._window_used)
+        return headers
+
+    def _make_handler(self) -> type:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers.get("Content-Length", "0"))
+                try:
+                    request_data = json.loads(self.rfile.read(length) or b"{}")
+                    prompt = request_data["messages"][-1]["content"]
+                except (ValueError, KeyError, IndexError, TypeError):
+                    self._send_json(400, {"error": {"message": "bad request"}})
+                    return
+
+                delay, error_status, limit_headers = fake._plan_response(prompt)
+                if delay:
+                    time.sleep(delay)
+                if error_status == 429:
+                    message = "rate limit reached" if limit_headers else "fake failure"
+                    self._send_json(429, {"error": {"message": message}}, limit_headers)
+                    return
+                if error_status:
+                    self._send_json(error_status, {"error": {"message": "fake failure"}})
+                    return
+
+                content = prompt if fake.answer is None else fake.answer
+                if request_data.get("stream"):
+                    self._send_stream(content, limit_headers)
+                    return
+                self._send_json(
+                    200,
+                    {
+                        "object": "chat.completion",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                    },
+                    limit_headers,
+                )
+
+            def _send_stream(self, content: str, headers: Dict[str, str]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Connection", "close")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+                pieces = [f"{word} " for word in content.split(" ")]
+                pieces[-1] = pieces[-1][:-1]
+                for piece in pieces:
+                    chunk = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    event = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    self.wfile.write(event.encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def _send_json(
+                self, status: int, data: dict, headers: Optional[Dict[str, str]] = None
+            ) -> None:
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+                pass
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--answer", default=None, help="fixed reply (default: echo)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per window")
+    parser.add_argument("--rate-window", type=float, default=60.0, help="seconds")
+    args = parser.parse_args(argv)
+
+    server = FakeLLMServer(
+        answer=args.answer,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"fake LLM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,582 @@
-from typing import Optional
+import asyncio
+import json
+import logging
+import threading
+import weakref
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
 
 try:  # noqa: SIM105
     import requests
+    from requests.adapters import HTTPAdapter
 except ModuleNotFoundError:  # pragma: no cover - fallback when dependency missing
     requests = None  # type: ignore[assignment]
+    HTTPAdapter = None  # type: ignore[assignment,misc]
 
-from omnidisp.config.settings import GROQ_API_KEY, GROQ_API_URL, GROQ_MODEL, GROQ_TIMEOUT
+try:  # noqa: SIM105
+    import httpx
+except ModuleNotFoundError:  # pragma: no cover - fallback when dependency missing
+    httpx = None  # type: ignore[assignment]
+
+from omnidisp.app.llm import deadline
+from omnidisp.app.llm.backend_pool import Backend, BackendPool, load_backends
+from omnidisp.app.llm.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    circuit_state,
+)
+from omnidisp.app.llm.prompt_builder import SYSTEM_PROMPT
+from omnidisp.app.utils import metrics, request_log
+from omnidisp.config.settings import (
+    GROQ_API_KEY,
+    GROQ_API_URL,
+    GROQ_CONNECT_TIMEOUT,
+    GROQ_MODEL,
+    GROQ_POOL_SIZE,
+    GROQ_READ_TIMEOUT,
+    GROQ_RPM,
+    LLM_BACKENDS,
+)
+
+logger = logging.getLogger(__name__)
+
+NO_KEY_MESSAGE = "Сейчас не получается обратиться к модели, ключ не настроен."
+TECHNICAL_ERROR_MESSAGE = (
+    "Сейчас возникла техническая ошибка при обращении к модели, попробуйте ещё раз."
+)
+
+
+# Ошибки, которые говорят о недоступности провайдера и считаются предохранителем.
+BREAKER_ERROR_KINDS = frozenset({"timeout", "connection", "http_5xx", "rate_limited"})
+
+# Ошибки, после которых запрос сразу повторяется на другом бэкенде пула. Таймаут сюда
+# не входит: повтор съел бы ещё столько же времени из бюджета запроса.
+FAILOVER_ERROR_KINDS = frozenset({"connection", "http_5xx", "rate_limited"})
+
+# Меньше этого таймаут не ставим: нулевой requests и httpx не принимают.
+MIN_TIMEOUT = 0.001
+
+
+class LLMStreamError(RuntimeError):
+    """Потоковый ответ модели не удалось получить или дочитать."""
 
 
 class LLMClient:
     """
     Клиент для обращения к модели Groq (Llama 3.x) через HTTP API.
-    Ключ и модель берутся из config.settings.
+    Ключи, модели и адреса берутся из пула бэкендов — см. get_backend_pool().
+
+    Клиент держит одну requests.Session с пулом keep-alive соединений,
+    поэтому повторные запросы не платят за TCP/TLS-рукопожатие. Экземпляр
+    потокобезопасен; в приложении используется общий — см. get_llm_client().
+    Перед промптом отправляется постоянное системное сообщение system_prompt
+    (по умолчанию инструкции режима диспетчера; пустое — не отправляется).
     """
 
-    def ask(self, prompt: str) -> str:
-        if not GROQ_API_KEY:
-            return "Сейчас не получается обратиться к модели, ключ не настроен."
+    def __init__(
+        self,
+        pool_size: int = GROQ_POOL_SIZE,
+        connect_timeout: float = GROQ_CONNECT_TIMEOUT,
+        read_timeout: float = GROQ_READ_TIMEOUT,
+        system_prompt: str = SYSTEM_PROMPT,
+    ) -> None:
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.system_prompt = system_prompt
+        self._session = None
+        self._adapter = None
+        self._session_lock = threading.Lock()
 
-        if requests is None:
-            return "Сейчас возникла техническая ошибка при обращении к модели, попробуйте ещё раз."
+    def _get_session(self):  # noqa: ANN202
+        session = self._session
+        if session is not None:
+            return session
+        with self._session_lock:
+            if self._session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=max(len(get_backend_pool().backends), 1),
+                    pool_maxsize=self.pool_size,
+                    max_retries=0,
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._adapter = adapter
+                self._session = session
+            return self._session
 
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": GROQ_MODEL,
-            "messages": [
-                {"role": "user", "content": prompt},
-            ],
-            "temperature": 0.2,
+    def connection_stats(self) -> Dict[str, int]:
+        """Сколько запросов отправлено и сколько соединений для этого открыто."""
+
+        requests_sent = 0
+        connections_opened = 0
+        adapter = self._adapter
+        if adapter is not None:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "connections_reused": max(requests_sent - connections_opened, 0),
         }
 
+    def close(self) -> None:
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._adapter = None
+
+    def _send(self, pool: BackendPool, payload: dict, mode: str):  # noqa: ANN202
+        """POST запроса бэкенду пула: (ответ, бэкенд, "") или (None, None, ошибка).
+
+        Бэкенд выбирает пул — с наибольшим запасом по лимитам. При 429, 5xx
+        или ошибке соединения запрос повторяется на следующем бэкенде, пока
+        они не кончатся или не выйдет бюджет времени запроса.
+        """
+
+        stream = bool(payload.get("stream"))
+        tried: List[Backend] = []
+        error = ""
+        while True:
+            backend, refusal = _admit_call(pool, tried, mode)
+            if backend is None:
+                return None, None, error or refusal
+            tried.append(backend)
+            timeout = _deadline_timeout(*self.timeout)
+            try:
+                response = self._get_session().post(
+                    backend.url,
+                    headers=_request_headers(backend.api_key),
+                    json=dict(payload, model=backend.model),
+                    timeout=timeout,
+                    stream=stream,
+                )
+                response.raise_for_status()
+            except Exception as exc:  # noqa: BLE001
+                failed = getattr(exc, "response", None)
+                if failed is not None:
+                    failed.close()
+                error = str(exc)
+                if _call_failed(pool, backend, exc, cut_by_deadline=timeout != self.timeout):
+                    continue
+                return None, None, error
+            except BaseException:
+                _call_abandoned(backend)
+                raise
+            _call_succeeded(pool, backend, response.headers)
+            return response, backend, ""
+
+    def ask(self, prompt: str) -> str:
+        pool = get_backend_pool()
+        if not pool.backends:
+            _count_error("no_key")
+            return NO_KEY_MESSAGE
+
+        if requests is None:
+            _count_error("missing_dependency")
+            return TECHNICAL_ERROR_MESSAGE
+
+        response, _backend, _error = self._send(
+            pool, _request_payload(prompt, self.system_prompt), "sync"
+        )
+        if response is None:
+            return TECHNICAL_ERROR_MESSAGE
         try:
-            response = requests.post(
-                GROQ_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=GROQ_TIMEOUT,
-            )
-            response.raise_for_status()
             data: Optional[dict] = response.json()
         except Exception as exc:  # noqa: BLE001
-            print(f"Groq request error: {exc}")
-            return "Сейчас возникла техническая ошибка при обращении к модели, попробуйте ещё раз."
+            logger.warning("Groq request error: %s", exc)
+            _count_error(_error_kind(exc))
+            return TECHNICAL_ERROR_MESSAGE
 
-        if not isinstance(data, dict) or "choices" not in data:
-            print(f"Groq unexpected response format: {data}")
-            return "Сейчас возникла техническая ошибка при обращении к модели, попробуйте ещё раз."
+        return _extract_answer(data)
 
-        if "error" in data:
-            print(f"Groq API returned error: {data.get('error')}")
-            return "Сейчас возникла техническая ошибка при обращении к модели, попробуйте ещё раз."
+    def ask_stream(self, prompt: str) -> Iterator[str]:
+        """Ответ модели по частям (streaming chat completions, SSE).
+
+        В отличие от ask, при ошибке бросает LLMStreamError: часть ответа
+        к этому моменту могла уже уйти клиенту.
+        """
+
+        pool = get_backend_pool()
+        if not pool.backends:
+            _count_error("no_key")
+            raise LLMStreamError(NO_KEY_MESSAGE)
+        if requests is None:
+            _count_error("missing_dependency")
+            raise LLMStreamError("requests is not installed")
 
+        payload = _request_payload(prompt, self.system_prompt)
+        payload["stream"] = True
+        response, backend, error = self._send(pool, payload, "stream")
+        if response is None:
+            raise LLMStreamError(error)
+
+        response.encoding = "utf-8"  # SSE is always UTF-8
         try:
-            raw_text = data["choices"][0]["message"]["content"]
+            for line in response.iter_lines(decode_unicode=True):
+                delta = _parse_stream_line(line)
+                if delta is None:
+                    break
+                if delta:
+                    yield delta
+        except LLMStreamError:
+            _count_error("bad_response")
+            raise
         except Exception as exc:  # noqa: BLE001
-            print(f"Groq parsing error: {exc}; data={data}")
-            return "Сейчас возникла техническая ошибка при обращении к модели, попробуйте ещё раз."
+            logger.warning("Groq stream read error: %s", exc)
+            # _send уже засчитал вызов успешным (предохранитель и пул),
+            # поэтому обрыв чтения идёт только в счётчик ошибок
+            _count_error(_error_kind(exc))
+            raise LLMStreamError(str(exc)) from exc
+        finally:
+            response.close()
+
+
+class AsyncLLMClient:
+    """
+    Асинхронный вариант LLMClient на httpx.AsyncClient.
+
+    Пул соединений httpx привязан к event loop, поэтому общий экземпляр
+    заводится на каждый loop — см. get_async_llm_client().
+    """
+
+    def __init__(
+        self,
+        pool_size: int = GROQ_POOL_SIZE,
+        connect_timeout: float = GROQ_CONNECT_TIMEOUT,
+        read_timeout: float = GROQ_READ_TIMEOUT,
+        system_prompt: str = SYSTEM_PROMPT,
+    ) -> None:
+        self.pool_size = pool_size
+        self.system_prompt = system_prompt
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._client = None
+
+    def _get_client(self):  # noqa: ANN202
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def ask(self, prompt: str) -> str:
+        pool = get_backend_pool()
+        if not pool.backends:
+            _count_error("no_key")
+            return NO_KEY_MESSAGE
+
+        if httpx is None:
+            _count_error("missing_dependency")
+            return TECHNICAL_ERROR_MESSAGE
+
+        payload = _request_payload(prompt, self.system_prompt)
+        tried: List[Backend] = []
+        while True:
+            backend, _refusal = _admit_call(pool, tried, "async")
+            if backend is None:
+                return TECHNICAL_ERROR_MESSAGE
+            tried.append(backend)
+            connect_timeout, read_timeout = _deadline_timeout(
+                self.connect_timeout, self.read_timeout
+            )
+            try:
+                response = await self._get_client().post(
+                    backend.url,
+                    headers=_request_headers(backend.api_key),
+                    json=dict(payload, model=backend.model),
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                )
+                response.raise_for_status()
+            except Exception as exc:  # noqa: BLE001
+                cut_by_deadline = (connect_timeout, read_timeout) != (
+                    self.connect_timeout,
+                    self.read_timeout,
+                )
+                if _call_failed(pool, backend, exc, cut_by_deadline):
+                    continue
+                return TECHNICAL_ERROR_MESSAGE
+            except BaseException:
+                # asyncio.CancelledError: клиент ушёл, о провайдере ничего не известно
+                _call_abandoned(backend)
+                raise
+            _call_succeeded(pool, backend, response.headers)
+            break
+
+        try:
+            data: Optional[dict] = response.json()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Groq request error: %s", exc)
+            _count_error(_error_kind(exc))
+            return TECHNICAL_ERROR_MESSAGE
+        return _extract_answer(data)
+
+
+def _error_kind(exc: BaseException) -> str:
+    """Класс ошибки запроса для метрик: одинаково для requests и httpx."""
+
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status is not None:
+        return "http_5xx" if status >= 500 else "http_4xx"
+    if "Timeout" in type(exc).__name__:
+        return "timeout"
+    if isinstance(exc, ValueError):
+        return "bad_response"
+    return "connection"
+
+
+def _count_error(kind: str, breaker: Optional[CircuitBreaker] = None) -> None:
+    """Считает ошибку; предохранителю сообщает провал или, для прочих ошибок, освобождает слот."""
+
+    metrics.inc("omnidisp_llm_errors_total", kind=kind)
+    request_log.note(llm_error=kind)
+    if breaker is None:
+        return
+    if kind in BREAKER_ERROR_KINDS:
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
+def _admit_call(
+    pool: BackendPool, tried: List[Backend], mode: str
+) -> Tuple[Optional[Backend], str]:
+    """Кому из пула отправить запрос: (бэкенд, "") или (None, причина отказа).
+
+    Запрос не отправляется, если бюджет времени запроса уже исчерпан или
+    у всех ещё не опробованных бэкендов нет запаса по лимитам либо
+    разомкнут предохранитель. Отказ считается ошибкой, только если запрос
+    не ушёл ни одному бэкенду: иначе ошибка уже посчитана.
+    """
+
+    left = deadline.remaining()
+    if left is not None and left <= 0:
+        backend, refusal = None, "deadline_exceeded"
+    else:
+        backend, refusal = pool.acquire(tried)
+    if backend is None:
+        if not tried:
+            _count_error(refusal)
+    elif tried:
+        metrics.inc("omnidisp_llm_failovers_total")
+    else:
+        metrics.inc("omnidisp_llm_requests_total", mode=mode)
+    return backend, refusal
+
+
+def _call_failed(
+    pool: BackendPool, backend: Backend, exc: BaseException, cut_by_deadline: bool = False
+) -> bool:
+    """Учитывает неудачный запрос к бэкенду; True — стоит попробовать другой.
+
+    ``cut_by_deadline`` — таймауты запроса были обрезаны бюджетом времени
+    запроса: такой таймаут — исчерпанный бюджет (deadline_exceeded), а не
+    отказ провайдера, и предохранитель его не считает.
+    """
+
+    kind = _error_kind(exc)
+    if kind == "timeout" and cut_by_deadline:
+        kind = "deadline_exceeded"
+    logger.warning("Groq request error (%s): %s", backend.name, exc)
+    _count_error(kind, backend.breaker)
+    response = getattr(exc, "response", None)
+    pool.record(backend, kind, getattr(response, "headers", None))
+    return kind in FAILOVER_ERROR_KINDS
+
+
+def _call_abandoned(backend: Backend) -> None:
+    """Запрос прерван (отмена, KeyboardInterrupt): исход неизвестен, пробный слот свободен."""
+
+    if backend.breaker is not None:
+        backend.breaker.release()
+
+
+def _call_succeeded(pool: BackendPool, backend: Backend, headers: Mapping[str, str]) -> None:
+    if backend.breaker is not None:
+        backend.breaker.record_success()
+    pool.record(backend, "ok", headers)
+    request_log.note(llm_backend=backend.name)
+
+
+def _deadline_timeout(connect_timeout: float, read_timeout: float) -> Tuple[float, float]:
+    """Таймауты соединения и чтения, обрезанные до оставшегося бюджета запроса."""
+
+    return (
+        max(deadline.clamp(connect_timeout), MIN_TIMEOUT),
+        max(deadline.clamp(read_timeout), MIN_TIMEOUT),
+    )
+
+
+_pool: Optional[BackendPool] = None
+_pool_config: Optional[tuple] = None
+_pool_error: Optional[str] = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool() -> BackendPool:
+    """Общий пул бэкендов модели; пересобирается, если поменялись настройки.
+
+    Если LLM_BACKENDS не разбирается, пул пустой (модель недоступна, ответы
+    без модели работают), а ошибку показывает backend_pool_error() —
+    по ней не проходит проверка готовности.
+    """
+
+    global _pool, _pool_config, _pool_error
+    config = (LLM_BACKENDS, GROQ_API_URL, GROQ_API_KEY, GROQ_MODEL, GROQ_RPM)
+    pool = _pool
+    if pool is not None and _pool_config == config:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool_config != config:
+            try:
+                backends = load_backends(*config)
+                _pool_error = None
+            except (TypeError, ValueError) as exc:
+                _pool_error = f"LLM_BACKENDS is malformed: {exc}"
+                logger.error(_pool_error)
+                backends = []
+            _pool = BackendPool(backends)
+            _pool_config = config
+        return _pool
+
+
+def backend_pool_error() -> Optional[str]:
+    """Почему не удалось собрать пул из настроек, или None, если всё в порядке."""
+
+    get_backend_pool()
+    return _pool_error
+
+
+# От лучшего состояния предохранителя к худшему.
+_CIRCUIT_ORDER = ("disabled", CLOSED, HALF_OPEN, OPEN)
+
+
+def llm_circuit_state() -> str:
+    """Лучшее состояние предохранителей бэкендов пула (для трассы)."""
+
+    states = [
+        "disabled" if backend.breaker is None else backend.breaker.state
+        for backend in get_backend_pool().backends
+    ]
+    if not states:
+        return circuit_state(GROQ_API_URL)
+    return min(states, key=_CIRCUIT_ORDER.index)
+
+
+def _request_headers(api_key: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+
+
+def _request_payload(prompt: str, system_prompt: str = "") -> dict:
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+    return {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "temperature": 0.2,
+    }
+
+
+def _parse_stream_line(line: Optional[str]) -> Optional[str]:
+    """Текст из одной строки SSE; None — поток закончился."""
+
+    if not line or not line.startswith("data:"):
+        return ""
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    try:
+        chunk = json.loads(data)
+    except ValueError as exc:
+        raise LLMStreamError(f"bad stream chunk: {data[:200]}") from exc
+    if "error" in chunk:
+        raise LLMStreamError(f"Groq API returned error: {chunk.get('error')}")
+    try:
+        return chunk["choices"][0].get("delta", {}).get("content") or ""
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+
+def _extract_answer(data: Optional[dict]) -> str:
+    if not isinstance(data, dict) or "choices" not in data:
+        logger.warning("Groq unexpected response format: %s", data)
+        _count_error("bad_response")
+        return TECHNICAL_ERROR_MESSAGE
+
+    if "error" in data:
+        logger.warning("Groq API returned error: %s", data.get("error"))
+        _count_error("api_error")
+        return TECHNICAL_ERROR_MESSAGE
+
+    try:
+        raw_text = data["choices"][0]["message"]["content"]
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Groq parsing error: %s; data=%s", exc, data)
+        _count_error("bad_response")
+        return TECHNICAL_ERROR_MESSAGE
+
+    return raw_text
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Общий для процесса экземпляр LLMClient (создаётся при первом вызове)."""
+
+    global _client
+    client = _client
+    if client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+            client = _client
+    return client
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncLLMClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """Общий AsyncLLMClient для текущего event loop."""
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncLLMClient()
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_llm_client() -> None:
+    """Закрывает AsyncLLMClient текущего event loop (при остановке приложения)."""
 
-        return raw_text
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
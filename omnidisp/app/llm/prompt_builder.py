@@ -1,8 +1,29 @@
-from typing import List, Optional
+"""Промпт режима диспетчера: постоянное системное сообщение и компактный PLAN.
 
+Инструкции не меняются от запроса к запросу, поэтому собраны один раз в
+SYSTEM_PROMPT и отправляются отдельным системным сообщением (провайдер
+может кэшировать этот префикс). В сообщении пользователя остаётся только
+PLAN: поля "ключ: значение", списки задач через "; ", пустые поля опущены.
 
-def build_disp_prompt(
-    user_text: str,
+Размер PLAN оценивается приближённо, без токенизатора (estimate_tokens),
+и ограничивается бюджетом LLM_PROMPT_MAX_TOKENS: длинные задачи и текст
+клиента обрезаются, лишние задачи заменяются счётчиком.
+"""
+
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from omnidisp.app.utils.text_normalizer import normalize_text
+from omnidisp.config.settings import LLM_PROMPT_MAX_TOKENS
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def _canonical_phrase(text: str) -> str:
+    return " ".join(_NON_WORD_RE.sub(" ", normalize_text(text)).split())
+
+
+def build_plan_key(
     step: str,
     plan_type: str,
     forbidden_tasks: List[str],
@@ -11,49 +32,208 @@ def build_disp_prompt(
     is_price_question: bool,
     is_first_message: bool,
     recommend_question: Optional[str] = None,
-    price_context: Optional[dict] = None,
-) -> str:
-    """Собирает промпт для режима диспетчера.
+) -> Tuple[object, ...]:
+    """Канонический ключ плана ответа для кэша ответов модели.
 
-    "price_context" зарезервирован для будущих сценариев с прайсом из JSON,
-    сейчас передаётся как служебный параметр для совместимости.
+    Задачи приводятся к нижнему регистру без пунктуации и лишних пробелов,
+    поэтому сообщения, отличающиеся только оформлением, дают один ключ.
+    Исходный текст в ключ не входит: его содержимое уже разложено на задачи.
     """
 
-    plan_lines = [
-        "PLAN:",
-        f"- user_text: {user_text}",
-        f"- step: {step}",
-        f"- type: {plan_type}",
-        f"- is_first_message: {'yes' if is_first_message else 'no'}",
-        f"- forbidden_tasks: {forbidden_tasks}",
-        f"- allowed_tasks: {allowed_tasks}",
-        f"- main_category: {main_category}",
-        f"- price_question: {'yes' if is_price_question else 'no'}",
-        f"- recommend_question: {recommend_question or 'нет'}",
-    ]
+    return (
+        step,
+        plan_type,
+        main_category,
+        tuple(_canonical_phrase(task) for task in forbidden_tasks),
+        tuple(_canonical_phrase(task) for task in allowed_tasks),
+        is_price_question,
+        is_first_message,
+        recommend_question or "",
+    )
+
 
-    instructions = [
-        "Ты — частный выездной мастер по ремонту бытовой техники с большим опытом.",
+SYSTEM_PROMPT = "\n".join(
+    [
+        "Ты — частный выездной мастер по ремонту бытовой техники и мелких работ с большим опытом.",
         "Отвечай от первого лица, как живой мастер, кратко: 1–3 коротких предложения.",
         "Тон спокойный, уверенный и вежливый, без шуток, смайлов и панибратства.",
         "Не упоминай планы, регламенты, категории, базы знаний, прайсы, файлы и внутренние правила.",
         "Не упоминай ботов, ИИ, нейросети и модели. Не используй латиницу.",
         "Не давай инструкций по самостоятельному ремонту и не проси везти технику — только выезд мастера.",
+        "В сообщении пользователя — PLAN ответа: поля 'ключ: значение', задачи через ';'. Отсутствующее поле — пустое.",
         "PLAN.type == 'full_refuse': вежливо и кратко откажись от всех задач, поясни, что такими работами не занимаюсь.",
-        "PLAN.type == 'partial_refuse': коротко откажи по запрещённым задачам, предложи помощь по разрешённым и задай один уточняющий вопрос по разрешённой части.",
+        "PLAN.type == 'partial_refuse': коротко откажи по запрещённым задачам (forbidden_tasks), предложи помощь по разрешённым (allowed_tasks) и задай один уточняющий вопрос по разрешённой части.",
         "PLAN.type == 'allowed': веди себя как опытный мастер, уточняй проблему или условия работы и предложи выезд, если уместно.",
         "Если is_first_message == yes: начни ответ с короткого приветствия 'Здравствуйте.' или 'Добрый день.'.",
         "Если recommend_question указан: обязательно задай клиенту именно этот уточняющий вопрос.",
         "Если price_question == yes: не называй суммы и не используй цифры, объясни, что точную цену сможешь назвать после осмотра на месте и предложи выезд.",
         "Ответ должен содержать один дружелюбный вопрос клиенту, чтобы продвинуть диалог к выезду.",
+        "Сформулируй один естественный короткий ответ мастера, строго следуя PLAN и инструкциям.",
     ]
+)
 
-    prompt_parts = [
-        "Ты — мастер по ремонту бытовой техники и мелких работ.",
-        "Структурированный план ответа:",
-        *plan_lines,
-        "Инструкции:",
-        *instructions,
-        "Сформулируй один естественный короткий ответ мастера, строго следуя PLAN и инструкциям.",
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+# Не меньше стольких токенов текста клиента остаётся в PLAN при любом бюджете.
+MIN_USER_TEXT_TOKENS = 16
+# Длиннее стольких токенов задача в PLAN обрезается, когда бюджет превышен.
+MAX_TASK_TOKENS = 24
+
+
+def estimate_tokens(text: str) -> int:
+    """Приближённое число токенов текста без токенизатора модели.
+
+    Слово латиницей считается за токен на каждые 4 символа, кириллицей —
+    на каждые 3, знак препинания — за токен. Для Llama 3 оценка обычно
+    чуть выше настоящей, поэтому бюджет выдерживается с запасом.
+    """
+
+    total = 0
+    for piece in _TOKEN_PIECE_RE.findall(text):
+        total += -(-len(piece) // (4 if piece.isascii() else 3))
+    return total
+
+
+SYSTEM_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+
+class CompiledPrompt(NamedTuple):
+    """PLAN для сообщения пользователя и его оценка в токенах."""
+
+    text: str
+    tokens: int
+    system_tokens: int
+    truncated: bool
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Начало текста не длиннее max_tokens (по estimate_tokens), с многоточием."""
+
+    total = 0
+    for match in _TOKEN_PIECE_RE.finditer(text):
+        piece = match.group(0)
+        total += -(-len(piece) // (4 if piece.isascii() else 3))
+        if total > max_tokens:
+            return text[: match.start()].rstrip() + "…"
+    return text
+
+
+def compile_disp_prompt(
+    user_text: str,
+    step: str,
+    plan_type: str,
+    forbidden_tasks: List[str],
+    allowed_tasks: List[str],
+    main_category: str,
+    is_price_question: bool,
+    is_first_message: bool,
+    recommend_question: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+) -> CompiledPrompt:
+    """Собирает PLAN запроса и укладывает его в бюджет токенов.
+
+    max_tokens по умолчанию — LLM_PROMPT_MAX_TOKENS (0 — без ограничения).
+    Бюджет соблюдается по возможности: сначала обрезаются длинные задачи,
+    затем отбрасываются последние задачи длинного списка, текст клиента
+    получает остаток, но не меньше MIN_USER_TEXT_TOKENS.
+    """
+
+    if max_tokens is None:
+        max_tokens = LLM_PROMPT_MAX_TOKENS
+    fixed = (step, plan_type, main_category, is_price_question, is_first_message, recommend_question)
+
+    text = _render_plan(user_text, forbidden_tasks, allowed_tasks, *fixed)
+    tokens = estimate_tokens(text)
+    if not max_tokens or tokens <= max_tokens:
+        return CompiledPrompt(text, tokens, SYSTEM_PROMPT_TOKENS, False)
+
+    forbidden = [truncate_to_tokens(task, MAX_TASK_TOKENS) for task in forbidden_tasks]
+    allowed = [truncate_to_tokens(task, MAX_TASK_TOKENS) for task in allowed_tasks]
+    lists = [(forbidden, [0]), (allowed, [0])]
+
+    def rest_tokens() -> int:
+        return estimate_tokens(
+            _render_plan("", _with_dropped(*lists[0]), _with_dropped(*lists[1]), *fixed)
+        )
+
+    rest = rest_tokens()
+    while rest + MIN_USER_TEXT_TOKENS > max_tokens:
+        tasks, dropped = max(lists, key=lambda item: len(item[0]))
+        if len(tasks) <= 1:
+            break
+        tasks.pop()
+        dropped[0] += 1
+        rest = rest_tokens()
+
+    short_text = truncate_to_tokens(user_text, max(max_tokens - rest, MIN_USER_TEXT_TOKENS))
+    text = _render_plan(
+        short_text, _with_dropped(*lists[0]), _with_dropped(*lists[1]), *fixed
+    )
+    return CompiledPrompt(text, estimate_tokens(text), SYSTEM_PROMPT_TOKENS, True)
+
+
+def build_disp_prompt(
+    user_text: str,
+    step: str,
+    plan_type: str,
+    forbidden_tasks: List[str],
+    allowed_tasks: List[str],
+    main_category: str,
+    is_price_question: bool,
+    is_first_message: bool,
+    recommend_question: Optional[str] = None,
+    price_context: Optional[dict] = None,
+) -> str:
+    """Собирает сообщение пользователя (PLAN) для режима диспетчера.
+
+    Инструкции модели — в SYSTEM_PROMPT, его отправляет LLMClient.
+    "price_context" зарезервирован для будущих сценариев с прайсом из JSON,
+    сейчас передаётся как служебный параметр для совместимости.
+    """
+
+    return compile_disp_prompt(
+        user_text=user_text,
+        step=step,
+        plan_type=plan_type,
+        forbidden_tasks=forbidden_tasks,
+        allowed_tasks=allowed_tasks,
+        main_category=main_category,
+        is_price_question=is_price_question,
+        is_first_message=is_first_message,
+        recommend_question=recommend_question,
+    ).text
+
+
+def _with_dropped(tasks: List[str], dropped: List[int]) -> List[str]:
+    if not dropped[0]:
+        return tasks
+    return [*tasks, f"… и ещё {dropped[0]}"]
+
+
+def _render_plan(
+    user_text: str,
+    forbidden_tasks: List[str],
+    allowed_tasks: List[str],
+    step: str,
+    plan_type: str,
+    main_category: str,
+    is_price_question: bool,
+    is_first_message: bool,
+    recommend_question: Optional[str],
+) -> str:
+    lines = [
+        "PLAN:",
+        f"user_text: {user_text}",
+        f"step: {step}",
+        f"type: {plan_type}",
+        f"is_first_message: {'yes' if is_first_message else 'no'}",
     ]
-    return "\n".join(prompt_parts)
+    if forbidden_tasks:
+        lines.append(f"forbidden_tasks: {'; '.join(forbidden_tasks)}")
+    if allowed_tasks:
+        lines.append(f"allowed_tasks: {'; '.join(allowed_tasks)}")
+    lines.append(f"main_category: {main_category}")
+    lines.append(f"price_question: {'yes' if is_price_question else 'no'}")
+    if recommend_question:
+        lines.append(f"recommend_question: {recommend_question}")
+    return "\n".join(lines)
@@ -0,0 +1,189 @@
+"""Coalescing of identical concurrent model calls ("single flight").
+
+While a call for a key is in flight, further callers with the same key do
+not start their own call: they wait for the first one and receive its
+result (or exception). Each flight accepts at most ``max_waiters`` extra
+callers; callers beyond that run the call themselves rather than queue
+behind a possibly stuck request. Waiting is bounded by ``timeout`` and
+raises :class:`SingleFlightTimeout`, and never outlasts the caller's request
+deadline (see :mod:`.deadline`).
+
+:class:`SingleFlight` serves threads, :class:`AsyncSingleFlight` serves
+coroutines; flights never cross event loops.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from omnidisp.app.llm import deadline
+from omnidisp.config.settings import (
+    LLM_SINGLE_FLIGHT_ENABLED,
+    LLM_SINGLE_FLIGHT_MAX_WAITERS,
+    LLM_SINGLE_FLIGHT_TIMEOUT,
+)
+
+T = TypeVar("T")
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Waiting for the shared call took longer than the configured timeout."""
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.leaders = 0
+        self.coalesced = 0
+        self.overflow = 0
+        self.timeouts = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "overflow": self.overflow,
+            "timeouts": self.timeouts,
+        }
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Thread-level single flight."""
+
+    def __init__(self, max_waiters: int = 100, timeout: float = 30.0) -> None:
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats.leaders += 1
+                leader = True
+            elif flight.waiters >= self.max_waiters:
+                self._stats.overflow += 1
+                leader = None
+            else:
+                flight.waiters += 1
+                self._stats.coalesced += 1
+                leader = False
+
+        if leader is None:
+            return fn()
+
+        if leader:
+            try:
+                flight.result = fn()
+            except BaseException as exc:  # noqa: BLE001 - re-raised to every caller
+                flight.error = exc
+                raise
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.event.set()
+            return flight.result
+
+        timeout = deadline.clamp(self.timeout)
+        if not flight.event.wait(timeout):
+            with self._lock:
+                self._stats.timeouts += 1
+            raise SingleFlightTimeout(f"shared call did not finish in {timeout} s")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            data = self._stats.as_dict()
+            data["in_flight"] = len(self._flights)
+        return data
+
+
+class AsyncSingleFlight:
+    """Single flight for coroutines.
+
+    The shared call runs as its own task, so a cancelled or timed-out
+    caller never cancels the request other callers are waiting for.
+    """
+
+    def __init__(self, max_waiters: int = 100, timeout: float = 30.0) -> None:
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        self._flights: Dict[Tuple[int, Hashable], Tuple["asyncio.Task[Any]", list]] = {}
+        self._stats = _Stats()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        flight = self._flights.get(flight_key)
+
+        if flight is None:
+            task = loop.create_task(fn())
+            waiters = [0]
+            self._flights[flight_key] = (task, waiters)
+            task.add_done_callback(lambda done: self._forget(flight_key, done))
+            self._stats.leaders += 1
+        else:
+            task, waiters = flight
+            if waiters[0] >= self.max_waiters:
+                self._stats.overflow += 1
+                return await fn()
+            waiters[0] += 1
+            self._stats.coalesced += 1
+
+        timeout = deadline.clamp(self.timeout)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self._stats.timeouts += 1
+            raise SingleFlightTimeout(f"shared call did not finish in {timeout} s") from None
+
+    def _forget(self, flight_key: Tuple[int, Hashable], task: "asyncio.Task[Any]") -> None:
+        self._flights.pop(flight_key, None)
+        if not task.cancelled():
+            task.exception()  # mark as retrieved even if every caller timed out
+
+    def stats(self) -> Dict[str, int]:
+        data = self._stats.as_dict()
+        data["in_flight"] = len(self._flights)
+        return data
+
+
+_single_flight: Optional[SingleFlight] = (
+    SingleFlight(LLM_SINGLE_FLIGHT_MAX_WAITERS, LLM_SINGLE_FLIGHT_TIMEOUT)
+    if LLM_SINGLE_FLIGHT_ENABLED
+    else None
+)
+_async_single_flight: Optional[AsyncSingleFlight] = (
+    AsyncSingleFlight(LLM_SINGLE_FLIGHT_MAX_WAITERS, LLM_SINGLE_FLIGHT_TIMEOUT)
+    if LLM_SINGLE_FLIGHT_ENABLED
+    else None
+)
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Process-wide coalescer for threads, or ``None`` when disabled."""
+
+    return _single_flight
+
+
+def get_async_single_flight() -> Optional[AsyncSingleFlight]:
+    """Process-wide coalescer for coroutines, or ``None`` when disabled."""
+
+    return _async_single_flight
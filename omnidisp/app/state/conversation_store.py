@@ -0,0 +1,343 @@
+"""Per-chat conversation state shared by the webhook handlers.
+
+A store answers one question atomically — "is this the first message of
+the chat?" — and remembers when the chat was first seen, the last dialog
+step and the detected category.
+
+- :class:`MemoryConversationStore` keeps chats in an LRU of bounded size;
+  it is per-process and suits a single worker and tests.
+- :class:`SQLiteConversationStore` keeps them in a WAL-mode SQLite file
+  that every worker process on the host opens. First-seen is written
+  immediately (``INSERT OR IGNORE`` decides the winner between workers);
+  step/category updates are buffered and written in one transaction per
+  ``flush_interval``.
+
+A chat silent for longer than ``ttl`` seconds counts as a new conversation
+and is forgotten, so neither backend grows without bound.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from omnidisp.config.settings import (
+    CONVERSATION_DB_PATH,
+    CONVERSATION_FLUSH_INTERVAL,
+    CONVERSATION_MAX_CHATS,
+    CONVERSATION_STORE,
+    CONVERSATION_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationState(NamedTuple):
+    chat_id: str
+    first_seen: float
+    last_seen: float
+    last_step: str
+    category: str
+
+
+class ConversationStore(ABC):
+    """Interface of a conversation state backend."""
+
+    @abstractmethod
+    def mark_seen(self, chat_id: object) -> bool:
+        """Register a message of the chat; ``True`` if it starts a conversation."""
+
+    @abstractmethod
+    def record(self, chat_id: object, step: str, category: str) -> None:
+        """Remember the outcome of the latest message of the chat."""
+
+    @abstractmethod
+    def get(self, chat_id: object) -> Optional[ConversationState]:
+        """State of the chat, or ``None`` for an unknown or expired one."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Counters of the backend (size, evictions, ...)."""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryConversationStore(ConversationStore):
+    """In-process LRU of at most ``max_chats`` conversations."""
+
+    def __init__(self, max_chats: int = 100_000, ttl: float = 7 * 24 * 3600) -> None:
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self._chats: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted = 0
+        self._expired = 0
+
+    def mark_seen(self, chat_id: object) -> bool:
+        key = str(chat_id)
+        now = time.time()
+        with self._lock:
+            state = self._chats.get(key)
+            if state is not None and now - state.last_seen <= self.ttl:
+                self._chats[key] = state._replace(last_seen=now)
+                self._chats.move_to_end(key)
+                return False
+            if state is not None:
+                self._expired += 1
+            self._chats[key] = ConversationState(key, now, now, "", "")
+            self._chats.move_to_end(key)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+                self._evicted += 1
+            return True
+
+    def record(self, chat_id: object, step: str, category: str) -> None:
+        key = str(chat_id)
+        with self._lock:
+            state = self._chats.get(key)
+            if state is not None:
+                self._chats[key] = state._replace(last_step=step, category=category)
+
+    def get(self, chat_id: object) -> Optional[ConversationState]:
+        with self._lock:
+            state = self._chats.get(str(chat_id))
+        if state is None or time.time() - state.last_seen > self.ttl:
+            return None
+        return state
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "chats": len(self._chats),
+                "evicted": self._evicted,
+                "expired": self._expired,
+            }
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    chat_id    TEXT PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen  REAL NOT NULL,
+    last_step  TEXT NOT NULL DEFAULT '',
+    category   TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS conversations_last_seen ON conversations (last_seen);
+"""
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversation state in a SQLite file shared by worker processes."""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 7 * 24 * 3600,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending: Dict[str, Tuple[float, str, str]] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self._closed = False
+        self._counters = {"first_seen": 0, "flushes": 0, "rows_flushed": 0, "pruned": 0}
+
+        connection = self._connect()
+        connection.executescript(_SCHEMA)
+
+    # public API -----------------------------------------------------------
+
+    def mark_seen(self, chat_id: object) -> bool:
+        key = str(chat_id)
+        now = time.time()
+        connection = self._connection()
+        inserted = connection.execute(
+            "INSERT OR IGNORE INTO conversations (chat_id, first_seen, last_seen)"
+            " VALUES (?, ?, ?)",
+            (key, now, now),
+        ).rowcount
+        if not inserted:
+            # A conversation idle for longer than ttl starts over; the WHERE
+            # lets exactly one worker win the restart.
+            inserted = connection.execute(
+                "UPDATE conversations SET first_seen = ?, last_seen = ?,"
+                " last_step = '', category = '' WHERE chat_id = ? AND last_seen < ?",
+                (now, now, key, now - self.ttl),
+            ).rowcount
+        self._buffer(key, now, None, None)
+        if inserted:
+            with self._lock:
+                self._counters["first_seen"] += 1
+        return bool(inserted)
+
+    def record(self, chat_id: object, step: str, category: str) -> None:
+        self._buffer(str(chat_id), time.time(), step, category)
+
+    def get(self, chat_id: object) -> Optional[ConversationState]:
+        key = str(chat_id)
+        row = self._connection().execute(
+            "SELECT chat_id, first_seen, last_seen, last_step, category"
+            " FROM conversations WHERE chat_id = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        state = ConversationState(*row)
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            last_seen, step, category = pending
+            state = state._replace(last_seen=max(state.last_seen, last_seen))
+            if step is not None:
+                state = state._replace(last_step=step, category=category)
+        if time.time() - state.last_seen > self.ttl:
+            return None
+        return state
+
+    def flush(self) -> None:
+        """Write buffered updates and forget conversations older than ttl."""
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            for key, (last_seen, step, category) in pending.items():
+                if step is None:
+                    connection.execute(
+                        "UPDATE conversations SET last_seen = MAX(last_seen, ?)"
+                        " WHERE chat_id = ?",
+                        (last_seen, key),
+                    )
+                else:
+                    connection.execute(
+                        "UPDATE conversations SET last_seen = MAX(last_seen, ?),"
+                        " last_step = ?, category = ? WHERE chat_id = ?",
+                        (last_seen, step, category, key),
+                    )
+            pruned = connection.execute(
+                "DELETE FROM conversations WHERE last_seen < ?", (now - self.ttl,)
+            ).rowcount
+        with self._lock:
+            self._counters["flushes"] += 1
+            self._counters["rows_flushed"] += len(pending)
+            self._counters["pruned"] += max(pruned, 0)
+
+    def stats(self) -> Dict[str, int]:
+        (chats,) = self._connection().execute("SELECT COUNT(*) FROM conversations").fetchone()
+        with self._lock:
+            data = dict(self._counters)
+            data["pending"] = len(self._pending)
+        data["chats"] = chats
+        return data
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(max(self.flush_interval, 1.0) * 2)
+            self._flusher = None
+        self.flush()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    # internals ------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._connect()
+        return connection
+
+    def _buffer(
+        self, key: str, last_seen: float, step: Optional[str], category: Optional[str]
+    ) -> None:
+        with self._lock:
+            previous = self._pending.get(key)
+            if step is None and previous is not None:
+                step, category = previous[1], previous[2]
+            self._pending[key] = (last_seen, step, category)  # type: ignore[assignment]
+            overflow = len(self._pending) >= self.max_pending
+        self._ensure_flusher()
+        if overflow:
+            self._wakeup.set()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked after the parent started its thread: it is not ours
+                self._pid = os.getpid()
+                self._flusher = None
+            if self._flusher is None and not self._closed:
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="conversation-flush", daemon=True
+                )
+                self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as exc:
+                logger.warning("Conversation store flush error: %s", exc)
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def create_conversation_store(backend: str = CONVERSATION_STORE) -> ConversationStore:
+    """Store configured in ``config.settings`` (``memory`` or ``sqlite``)."""
+
+    if backend == "sqlite":
+        return SQLiteConversationStore(
+            CONVERSATION_DB_PATH, ttl=CONVERSATION_TTL, flush_interval=CONVERSATION_FLUSH_INTERVAL
+        )
+    if backend == "memory":
+        return MemoryConversationStore(max_chats=CONVERSATION_MAX_CHATS, ttl=CONVERSATION_TTL)
+    raise ValueError(f"unknown conversation store backend: {backend!r}")
+
+
+def get_conversation_store() -> ConversationStore:
+    """Process-wide store, created on first use (after a prefork fork)."""
+
+    global _store
+    store = _store
+    if store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_conversation_store()
+            store = _store
+    return store
@@ -0,0 +1,272 @@
+"""Background delivery of outgoing Telegram messages.
+
+The webhook handler only enqueues a reply; worker threads deliver it
+through a pooled HTTP session. Delivery honours Telegram limits:
+
+- messages of one chat are sent in order and at most one per
+  ``chat_interval`` seconds;
+- all chats together are spaced by ``1 / global_rate`` seconds;
+- ``429 Too Many Requests`` waits for ``parameters.retry_after``;
+- network errors and ``5xx`` are retried with exponential backoff.
+
+When more than ``max_queue`` messages are waiting, new ones are dropped
+(and counted) instead of blocking the webhook.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+try:  # noqa: SIM105
+    import requests
+    from requests.adapters import HTTPAdapter
+except ModuleNotFoundError:  # pragma: no cover - fallback when dependency missing
+    requests = None  # type: ignore[assignment]
+    HTTPAdapter = None  # type: ignore[assignment,misc]
+
+from omnidisp.config.settings import (
+    TELEGRAM_CHAT_INTERVAL,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_MAX_RETRIES,
+    TELEGRAM_QUEUE_SIZE,
+    TELEGRAM_SEND_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _Outgoing:
+    __slots__ = ("chat_id", "text", "attempts", "enqueued_at")
+
+    def __init__(self, chat_id: object, text: str) -> None:
+        self.chat_id = chat_id
+        self.text = text
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+
+class TelegramSender:
+    """Queue of ``sendMessage`` calls served by background threads."""
+
+    def __init__(
+        self,
+        api_base: str,
+        workers: int = TELEGRAM_SEND_WORKERS,
+        max_queue: int = TELEGRAM_QUEUE_SIZE,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+        chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: Tuple[float, float] = (3.05, 10.0),
+    ) -> None:
+        self.api_base = api_base
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self._condition = threading.Condition()
+        self._chats: Dict[object, Deque[_Outgoing]] = {}
+        self._ready: List[Tuple[float, int, object]] = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._next_global_slot = 0.0
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._session = None
+        self._counters = {
+            "enqueued": 0,
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "dropped": 0,
+        }
+
+    # public API -----------------------------------------------------------
+
+    def send_message(self, chat_id: object, text: str) -> bool:
+        """Enqueue a message; returns ``False`` if it was dropped."""
+
+        self._ensure_started()
+        with self._condition:
+            if self._stopping or self._pending >= self.max_queue:
+                self._counters["dropped"] += 1
+                return False
+
+            chat_queue = self._chats.get(chat_id)
+            if chat_queue is None:
+                chat_queue = deque()
+                self._chats[chat_id] = chat_queue
+                self._schedule(chat_id, time.monotonic())
+            chat_queue.append(_Outgoing(chat_id, text))
+            self._pending += 1
+            self._counters["enqueued"] += 1
+            self._condition.notify()
+        return True
+
+    def metrics(self) -> Dict[str, int]:
+        """Queue depth and delivery counters since start."""
+
+        with self._condition:
+            data = dict(self._counters)
+            data["queue_depth"] = self._pending
+            data["chats_waiting"] = len(self._chats)
+        return data
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Deliver what is already queued (up to ``timeout``) and stop."""
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._stopping = True
+            while self._pending and time.monotonic() < deadline:
+                self._condition.wait(0.05)
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0.0))
+        self._threads = []
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    # workers --------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._condition:
+            if self._threads or self._stopping:
+                return
+            if requests is not None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                self._session = requests.Session()
+                self._session.mount("https://", adapter)
+                self._session.mount("http://", adapter)
+            for number in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"telegram-sender-{number}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _schedule(self, chat_id: object, ready_at: float) -> None:
+        heapq.heappush(self._ready, (ready_at, next(self._sequence), chat_id))
+
+    def _take(self) -> Optional[_Outgoing]:
+        with self._condition:
+            while True:
+                if self._stopping and not self._pending:
+                    return None
+                if self._ready:
+                    ready_at, _seq, chat_id = self._ready[0]
+                    delay = ready_at - time.monotonic()
+                    if delay <= 0:
+                        heapq.heappop(self._ready)
+                        return self._chats[chat_id][0]
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait(0.5 if self._stopping else None)
+
+    def _finish(self, message: _Outgoing, retry_in: Optional[float], outcome: str) -> None:
+        with self._condition:
+            chat_queue = self._chats[message.chat_id]
+            now = time.monotonic()
+            if retry_in is not None:
+                self._counters["retried"] += 1
+                self._schedule(message.chat_id, now + retry_in)
+            else:
+                chat_queue.popleft()
+                self._pending -= 1
+                self._counters[outcome] += 1
+                if chat_queue:
+                    self._schedule(message.chat_id, now + self.chat_interval)
+                else:
+                    del self._chats[message.chat_id]
+            self._condition.notify_all()
+
+    def _wait_global_slot(self) -> None:
+        if not self.global_interval:
+            return
+        with self._condition:
+            now = time.monotonic()
+            slot = max(now, self._next_global_slot)
+            self._next_global_slot = slot + self.global_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _run(self) -> None:
+        while True:
+            message = self._take()
+            if message is None:
+                return
+            self._wait_global_slot()
+            retry_in, outcome = self._deliver(message)
+            self._finish(message, retry_in, outcome)
+
+    def _deliver(self, message: _Outgoing) -> Tuple[Optional[float], str]:
+        """Send one message; returns ``(retry delay or None, outcome)``."""
+
+        message.attempts += 1
+        if self._session is None:
+            return None, "failed"
+
+        try:
+            response = self._session.post(
+                f"{self.api_base}/sendMessage",
+                json={"chat_id": message.chat_id, "text": message.text},
+                timeout=self.timeout,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Telegram send error: %s", exc)
+            return self._retry_or_fail(message, self._backoff(message.attempts))
+
+        if response.status_code == 200:
+            return None, "sent"
+
+        if response.status_code == 429:
+            retry_after = _retry_after(response)
+            return self._retry_or_fail(
+                message, retry_after if retry_after is not None else self._backoff(message.attempts)
+            )
+
+        if response.status_code >= 500:
+            return self._retry_or_fail(message, self._backoff(message.attempts))
+
+        logger.warning(
+            "Telegram rejected message: %s %s", response.status_code, response.text[:200]
+        )
+        return None, "failed"
+
+    def _retry_or_fail(self, message: _Outgoing, delay: float) -> Tuple[Optional[float], str]:
+        if message.attempts > self.max_retries:
+            return None, "failed"
+        return delay, "retried"
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+
+def _retry_after(response: object) -> Optional[float]:
+    try:
+        value = response.json().get("parameters", {}).get("retry_after")  # type: ignore[attr-defined]
+    except Exception:  # noqa: BLE001
+        value = None
+    if value is None:
+        value = getattr(response, "headers", {}).get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
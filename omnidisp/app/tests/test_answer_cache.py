@@ -0,0 +1,67 @@
+import time
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+from omnidisp.app.llm import answer_cache
+from omnidisp.app.llm.answer_cache import AnswerCache
+
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = AnswerCache(max_size=2, ttl=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "expired": 0, "evicted": 1}
+
+
+def test_answer_cache_expires_entries():
+    cache = AnswerCache(max_size=10, ttl=0.05)
+    cache.put("a", "1")
+    time.sleep(0.06)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def _install_cache(monkeypatch):
+    cache = AnswerCache(max_size=16, ttl=60)
+    monkeypatch.setattr(
+        "omnidisp.app.dispatcher.disp_logic.get_answer_cache", lambda: cache
+    )
+    prompts = []
+
+    def fake_ask(self, prompt: str) -> str:  # noqa: ANN001
+        prompts.append(prompt)
+        return "Когда холодильник перестал морозить?"
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask", fake_ask)
+    return cache, prompts
+
+
+def test_near_identical_messages_share_cached_answer(monkeypatch):
+    cache, prompts = _install_cache(monkeypatch)
+
+    first = handle_message("Не морозит холодильник", is_first_message=True)
+    second = handle_message("не  морозит ХОЛОДИЛЬНИК!", is_first_message=True)
+    other_step = handle_message("Не морозит холодильник", is_first_message=False)
+
+    assert len(prompts) == 2
+    assert first["client_answer"] == second["client_answer"]
+    assert first["client_answer"].startswith("Здравствуйте.")
+    assert other_step["client_answer"] == "Когда холодильник перестал морозить?"
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_can_be_disabled_per_plan_type(monkeypatch):
+    cache, prompts = _install_cache(monkeypatch)
+    monkeypatch.setattr(answer_cache, "LLM_CACHE_SKIP_PLAN_TYPES", frozenset({"allowed"}))
+
+    handle_message("Не морозит холодильник")
+    handle_message("Не морозит холодильник")
+
+    assert len(prompts) == 2
+    assert cache.stats()["size"] == 0
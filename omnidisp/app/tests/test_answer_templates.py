@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from omnidisp.app.dispatcher import disp_logic
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+from omnidisp.app.knowledge import loader
+from omnidisp.app.knowledge.answer_templates import (
+    compile_templates,
+    select_answer,
+    template_errors,
+)
+from omnidisp.app.utils.metrics import get_metrics
+
+
+def test_template_errors_report_bad_entries():
+    assert template_errors({"plan_type": "allowed", "text": "Здравствуйте. {title}"}) == []
+    assert template_errors({"plan_type": "maybe", "text": "x"}) == ["unknown plan_type 'maybe'"]
+    assert template_errors({"step": "first_greeting"}) == ["text is required"]
+    assert template_errors({"text": "{price}"}) == ["unknown placeholder {price}"]
+    assert template_errors({"text": "{0}"})[0].startswith("bad text")
+    assert template_errors({"text": "от {min_price:d} руб"}) == [
+        "bad text: placeholder {min_price} must not have a format spec or conversion"
+    ]
+    assert template_errors({"text": "{title!r}"})[0].startswith("bad text")
+    assert compile_templates([{"text": "от {min_price:d} руб"}]) == ()
+
+
+def test_select_answer_skips_templates_without_values():
+    templates = compile_templates(
+        [
+            {"step": "first_greeting", "text": "Здравствуйте. {recommend_question}"},
+            {"plan_type": "allowed", "text": "{title}: опишите проблему."},
+            {"plan_type": "full_refuse", "text": "Не возьмусь."},
+            {"plan_type": "allowed", "text": "{unknown_field}"},
+        ]
+    )
+
+    assert len(templates) == 3
+    values = {"title": "Холодильник", "recommend_question": None}
+    assert select_answer(templates, "allowed", "first_greeting", values) == (
+        "Холодильник: опишите проблему."
+    )
+    assert select_answer(templates, "full_refuse", "clarification", values) == "Не возьмусь."
+    assert select_answer(templates, "partial_refuse", "clarification", values) is None
+
+
+@pytest.fixture
+def template_knowledge(tmp_path):
+    categories_dir = tmp_path / "categories"
+    categories_dir.mkdir()
+    (categories_dir / "electricity.json").write_text(
+        json.dumps(
+            {
+                "category": "electricity",
+                "title": "Электрика",
+                "keywords": ["розетка"],
+                "stop_phrases": ["люстра"],
+                "clarifying_questions": ["Сколько розеток нужно заменить?"],
+                "answer_templates": [
+                    {
+                        "plan_type": "partial_refuse",
+                        "text": "С этим не помогу: {forbidden_tasks}. {recommend_question}",
+                    },
+                    {"plan_type": "allowed", "step": "price_question", "text": "От {min_price}."},
+                ],
+            },
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+    loader.load_knowledge(categories_dir)
+    try:
+        yield
+    finally:
+        loader.load_knowledge()
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+
+    def fake_ask(self, prompt):  # noqa: ANN001
+        calls.append(prompt)
+        return "Опишите, пожалуйста, подробнее."
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask", fake_ask)
+    get_metrics().reset()
+    return calls
+
+
+def test_category_template_answers_without_model(template_knowledge, llm_calls):
+    result = handle_message("Заменить розетку, повесить люстру.", trace="none")
+
+    assert result["client_answer"] == (
+        "С этим не помогу: повесить люстру. Сколько розеток нужно заменить?"
+    )
+    assert llm_calls == []
+    assert get_metrics().value(
+        "omnidisp_template_answers_total", plan_type="partial_refuse", step="clarification"
+    ) == 1
+
+
+def test_default_template_answers_full_refusal(template_knowledge, llm_calls):
+    answer = handle_message("Повесить люстру", is_first_message=True)["client_answer"]
+
+    assert answer.startswith("Здравствуйте. К сожалению, такими работами я не занимаюсь.")
+    assert llm_calls == []
+
+
+def test_model_answers_when_no_template_applies(template_knowledge, llm_calls):
+    # У категории нет цен, поэтому шаблон с {min_price} не подходит.
+    answer = handle_message("Сколько стоит заменить розетку?", trace="none")["client_answer"]
+
+    assert answer == "Опишите, пожалуйста, подробнее."
+    assert len(llm_calls) == 1
+
+
+def test_templates_can_be_switched_off(template_knowledge, llm_calls, monkeypatch):
+    monkeypatch.setattr(disp_logic, "ANSWER_TEMPLATES_ENABLED", False)
+
+    handle_message("Заменить розетку, повесить люстру.", trace="none")
+
+    assert len(llm_calls) == 1
+
+
+def test_fridge_first_greeting_uses_knowledge_template(llm_calls):
+    answer = handle_message("Здравствуйте, холодильник не холодит", is_first_message=True)[
+        "client_answer"
+    ]
+
+    assert answer.startswith("Здравствуйте. Да, ремонтом холодильников занимаюсь.")
+    assert "перестал нормально охлаждать" in answer
+    assert llm_calls == []
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message, handle_message_async
+from omnidisp.app.llm import llm_client
+from omnidisp.app.llm.fake_server import FakeLLMServer
+
+pytest.importorskip("httpx")
+
+ANSWER = "Добрый день. Когда появилась проблема?"
+
+
+@pytest.fixture
+def slow_llm(monkeypatch):
+    with FakeLLMServer(answer=ANSWER, latency_ms=200) as server:
+        monkeypatch.setattr(llm_client, "GROQ_API_KEY", "test-key")
+        monkeypatch.setattr(llm_client, "GROQ_API_URL", server.url)
+        yield server
+
+
+def test_handle_message_async_shares_event_loop_between_conversations(slow_llm):
+    async def run_batch():
+        try:
+            return await asyncio.gather(
+                *(
+                    handle_message_async(f"Холодильник не морозит, заказ {n}")
+                    for n in range(20)
+                )
+            )
+        finally:
+            await llm_client.close_async_llm_client()
+
+    started = time.perf_counter()
+    results = asyncio.run(run_batch())
+    elapsed = time.perf_counter() - started
+
+    assert slow_llm.request_count == 20
+    assert all(result["client_answer"] == ANSWER for result in results)
+    assert all(result["internal_trace"].startswith("INTERNAL TRACE:") for result in results)
+    assert elapsed < 20 * 0.2 / 2
+
+
+def test_sync_and_async_paths_agree(slow_llm):
+    text = "Здравствуйте, холодильник не холодит"
+
+    async def run_async():
+        try:
+            return await handle_message_async(text, is_first_message=True)
+        finally:
+            await llm_client.close_async_llm_client()
+
+    assert asyncio.run(run_async()) == handle_message(text, is_first_message=True)
+
+
+def test_asgi_app_serves_dispatch(slow_llm):
+    import asgi
+
+    async def call(method, path, body=b""):
+        sent = []
+        incoming = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi.app({"type": "http", "method": method, "path": path}, receive, send)
+        return sent[0]["status"], json.loads(sent[1]["body"])
+
+    async def scenario():
+        try:
+            return (
+                await call("GET", "/"),
+                await call("POST", "/api/disp", json.dumps({"text": ""}).encode()),
+                await call(
+                    "POST",
+                    "/api/disp",
+                    json.dumps({"text": "Холодильник течёт"}).encode("utf-8"),
+                ),
+                await call("GET", "/missing"),
+            )
+        finally:
+            await llm_client.close_async_llm_client()
+
+    home, empty, dispatched, missing = asyncio.run(scenario())
+
+    assert home == (200, {"status": "ok"})
+    assert empty == (400, {"error": "empty text"})
+    assert dispatched[0] == 200
+    assert dispatched[1]["client_answer"] == ANSWER
+    assert missing[0] == 404
@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+from omnidisp.app.llm import llm_client
+from omnidisp.app.llm.backend_pool import (
+    DEFAULT_COOLDOWN,
+    Backend,
+    BackendPool,
+    load_backends,
+    parse_duration,
+)
+from omnidisp.app.llm.fake_server import FakeLLMServer
+from omnidisp.app.utils.metrics import get_metrics
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_parse_duration_reads_provider_formats():
+    assert parse_duration("7.66s") == pytest.approx(7.66)
+    assert parse_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_duration("120ms") == pytest.approx(0.12)
+    assert parse_duration("3") == 3.0
+    assert parse_duration("soon") is None
+    assert parse_duration(None) is None
+
+
+def _pool(clock, *specs):  # noqa: ANN001, ANN002
+    backends = [
+        Backend(name, f"http://{name}", "key", "model", rpm=rpm, clock=clock)
+        for name, rpm in specs
+    ]
+    return BackendPool(backends, clock=clock), backends
+
+
+def test_pool_routes_to_backend_with_most_headroom():
+    clock = _Clock()
+    pool, (first, second) = _pool(clock, ("pool-a", 0), ("pool-b", 0))
+
+    assert pool.acquire() == (first, "")
+    pool.record(
+        first,
+        "ok",
+        {
+            "x-ratelimit-limit-requests": "100",
+            "x-ratelimit-remaining-requests": "10",
+            "x-ratelimit-reset-requests": "30s",
+        },
+    )
+    assert pool.acquire() == (second, "")
+    pool.record(
+        second, "ok", {"x-ratelimit-limit-tokens": "1000", "x-ratelimit-remaining-tokens": "50"}
+    )
+    assert pool.acquire() == (first, "")
+
+    clock.now = 31  # счётчик первого бэкенда обнулился у провайдера
+    assert pool.acquire() == (first, "")
+    assert get_metrics().value("omnidisp_llm_backend_headroom", backend="pool-b") == 0.05
+
+
+def test_pool_cools_down_rate_limited_backend():
+    clock = _Clock()
+    pool, (first, second) = _pool(clock, ("cool-a", 0), ("cool-b", 0))
+
+    pool.record(first, "rate_limited", {"retry-after": "2"})
+    assert pool.acquire() == (second, "")
+    pool.record(second, "rate_limited", None)
+    assert pool.acquire() == (None, "no_capacity")
+
+    clock.now = 2
+    assert pool.acquire() == (first, "")
+    assert pool.acquire(exclude=[first]) == (None, "no_capacity")
+    clock.now = DEFAULT_COOLDOWN
+    assert pool.acquire(exclude=[first]) == (second, "")
+
+
+def test_local_token_bucket_limits_rate():
+    clock = _Clock()
+    pool, (backend,) = _pool(clock, ("bucket-a", 60))
+    backend.bucket.capacity = 2.0
+    backend.bucket._tokens = 2.0
+
+    assert pool.acquire() == (backend, "")
+    assert pool.acquire() == (backend, "")
+    assert pool.acquire() == (None, "no_capacity")
+    clock.now = 1.0
+    assert pool.acquire() == (backend, "")
+
+
+def test_load_backends_reads_keys_and_defaults(monkeypatch):
+    monkeypatch.setenv("OMNIDISP_TEST_KEY", "from-env")
+    config = json.dumps(
+        [
+            {"name": "env", "api_key_env": "OMNIDISP_TEST_KEY", "rpm": 30},
+            {"name": "big", "api_key": "inline", "model": "big-model", "url": "http://big"},
+            {"name": "nokey", "api_key_env": "OMNIDISP_MISSING_KEY"},
+        ]
+    )
+
+    backends = load_backends(config, "http://default", "", "default-model")
+
+    assert [(b.name, b.url, b.api_key, b.model) for b in backends] == [
+        ("env", "http://default", "from-env", "default-model"),
+        ("big", "http://big", "inline", "big-model"),
+    ]
+    assert backends[0].bucket.rate == 0.5
+    assert backends[1].bucket is None
+    assert [b.name for b in load_backends("", "http://default", "key", "m")] == ["http://default"]
+    assert load_backends("", "http://default", "", "m") == []
+    with pytest.raises(ValueError):
+        load_backends('[{"name": "x", "api_key": "k"}, {"name": "x", "api_key": "k"}]', "", "", "")
+    with pytest.raises(ValueError):
+        load_backends('{"name": "x"}', "", "", "")
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    pytest.importorskip("requests")
+    servers = []
+
+    def start(*server_kwargs):  # noqa: ANN002
+        config = []
+        for number, kwargs in enumerate(server_kwargs):
+            server = FakeLLMServer(answer=f"ответ {number}", **kwargs).start()
+            servers.append(server)
+            config.append(
+                {"name": f"fake-{number}-{server.url}", "url": server.url, "api_key": "k"}
+            )
+        monkeypatch.setattr(llm_client, "LLM_BACKENDS", json.dumps(config))
+        return servers
+
+    get_metrics().reset()
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_rate_limited_backend_fails_over_to_next(backends):
+    limited, spare = backends({"error_rate": 1.0, "error_status": 429}, {})
+    client = llm_client.LLMClient()
+    try:
+        answers = [client.ask("вопрос") for _ in range(3)]
+    finally:
+        client.close()
+
+    assert answers == ["ответ 1"] * 3
+    assert limited.request_count == 1  # дальше бэкенд пережидает 429
+    assert spare.request_count == 3
+    registry = get_metrics()
+    assert registry.value("omnidisp_llm_failovers_total") == 1
+    assert registry.value("omnidisp_llm_errors_total", kind="rate_limited") == 1
+    assert registry.value("omnidisp_llm_requests_total", mode="sync") == 3
+
+
+def test_provider_headers_spread_requests(backends):
+    first, second = backends({"rate_limit": 2}, {"rate_limit": 2})
+    client = llm_client.LLMClient()
+    try:
+        answers = [client.ask("вопрос") for _ in range(5)]
+    finally:
+        client.close()
+
+    assert answers[:4] == ["ответ 0", "ответ 1", "ответ 0", "ответ 1"]
+    assert answers[4] == llm_client.TECHNICAL_ERROR_MESSAGE
+    assert first.request_count == second.request_count == 2
+    assert first.rate_limited_count == second.rate_limited_count == 0
+    assert get_metrics().value("omnidisp_llm_errors_total", kind="no_capacity") == 1
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+
+import pytest
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message, handle_messages
+
+
+class _CountingLLM:
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def ask(self, _client, prompt: str) -> str:  # noqa: ANN001
+        with self._lock:
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return f"Ответ {len(prompt)}"
+
+
+@pytest.fixture
+def counting_llm(monkeypatch):
+    llm = _CountingLLM()
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask",
+        lambda self, prompt: llm.ask(self, prompt),
+    )
+    return llm
+
+
+def test_batch_keeps_input_order_and_matches_single_path(counting_llm):
+    texts = [f"Холодильник не морозит, заказ {n}" for n in range(6)]
+
+    results = list(handle_messages(texts))
+
+    assert [result["client_answer"] for result in results] == [
+        handle_message(text)["client_answer"] for text in texts
+    ]
+    assert [result["internal_trace"] for result in results] == [
+        handle_message(text)["internal_trace"] for text in texts
+    ]
+
+
+def test_batch_sends_each_unique_prompt_once(counting_llm):
+    batch = ["Холодильник не морозит"] * 5 + [
+        {"text": "Холодильник не морозит", "is_first_message": True},
+        "Холодильник течёт",
+    ]
+
+    results = list(handle_messages(batch))
+
+    assert len(results) == 7
+    assert len(counting_llm.prompts) == 3
+    assert len({result["client_answer"] for result in results[:5]}) == 1
+    assert results[5]["client_answer"].startswith("Здравствуйте.")
+
+
+def test_batch_bounds_concurrent_model_calls(counting_llm):
+    texts = [f"Холодильник не морозит, заказ {n}" for n in range(12)]
+
+    started = time.perf_counter()
+    results = list(handle_messages(texts, max_in_flight=3))
+    elapsed = time.perf_counter() - started
+
+    assert len(results) == 12
+    assert counting_llm.max_in_flight == 3
+    assert elapsed < 12 * counting_llm.delay
+
+
+def test_batch_endpoint_streams_ndjson(counting_llm):
+    flask = pytest.importorskip("flask")  # noqa: F841
+    from main import app
+
+    client = app.test_client()
+    response = client.post(
+        "/api/disp/batch",
+        json={"messages": [{"text": "Холодильник не морозит"}, {"text": "Холодильник течёт"}]},
+    )
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert [line["index"] for line in lines] == [0, 1]
+    assert all(line["client_answer"].startswith("Ответ") for line in lines)
+
+    assert client.post("/api/disp/batch", json={"messages": []}).status_code == 400
@@ -0,0 +1,54 @@
+from omnidisp.app.knowledge.loader import build_snapshot
+from omnidisp.bench.corpus import generate_corpus
+from omnidisp.bench.run import compare
+from omnidisp.bench.stages import STAGES, bench_stages
+from omnidisp.bench.synthetic_kb import write_synthetic_knowledge
+from omnidisp.scripts.compile_knowledge import validate_categories
+
+
+def test_synthetic_knowledge_matches_schema(tmp_path):
+    categories_dir = write_synthetic_knowledge(tmp_path, keywords_per_category=50, categories=4)
+
+    snapshot = build_snapshot(categories_dir, artifact_dir=None)
+
+    assert validate_categories(categories_dir) == []
+    assert len(snapshot.data) == 4
+    assert len(snapshot.keyword_to_category) == 200
+
+
+def test_corpus_is_deterministic_and_hits_the_knowledge_base(tmp_path):
+    snapshot = build_snapshot(
+        write_synthetic_knowledge(tmp_path, keywords_per_category=20, categories=3),
+        artifact_dir=None,
+    )
+
+    corpus = generate_corpus(snapshot.data, 50, seed=1)
+
+    assert corpus == generate_corpus(snapshot.data, 50, seed=1)
+    assert corpus != generate_corpus(snapshot.data, 50, seed=2)
+    hits = sum(
+        any(keyword in text.lower() for keyword in snapshot.keyword_to_category)
+        for text, _first in corpus
+    )
+    assert hits == len(corpus)
+
+
+def test_bench_stages_reports_every_stage(tmp_path):
+    snapshot = build_snapshot(
+        write_synthetic_knowledge(tmp_path, keywords_per_category=10, categories=2),
+        artifact_dir=None,
+    )
+
+    results = bench_stages(snapshot, generate_corpus(snapshot.data, 5), repeat=1)
+
+    assert list(results) == list(STAGES)
+    assert all(result["us_per_op"] > 0 for result in results.values())
+
+
+def test_compare_flags_slowdowns_over_threshold():
+    baseline = {"kw10": {"categories": {"us_per_op": 10.0}, "trace": {"us_per_op": 10.0}}}
+    current = {"kw10": {"categories": {"us_per_op": 13.0}, "trace": {"us_per_op": 10.5}}}
+
+    rows = compare(current, baseline, threshold=0.15)
+
+    assert [(row[1], row[-1]) for row in rows] == [("categories", True), ("trace", False)]
@@ -0,0 +1,198 @@
+import time
+
+import pytest
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message, handle_messages
+from omnidisp.app.dispatcher.disp_logic import FALLBACK_MESSAGE
+from omnidisp.app.llm import circuit_breaker, deadline, llm_client
+from omnidisp.app.llm.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from omnidisp.app.llm.fake_server import FakeLLMServer
+from omnidisp.app.utils.metrics import get_metrics
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_half_open():
+    clock = _Clock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # пробный запрос уже идёт
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.stats() == {"state": CLOSED, "consecutive_failures": 0, "rejected": 2}
+
+
+def test_released_probe_frees_half_open_slot():
+    clock = _Clock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+
+    assert breaker.allow()
+    breaker.release()  # 4xx или отмена: о провайдере ничего не узнали
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_request_deadline_only_shortens_budget():
+    assert deadline.remaining() is None
+    assert deadline.clamp(5.0) == 5.0
+    with deadline.request_deadline(1.0):
+        with deadline.request_deadline(30.0):
+            assert deadline.clamp(5.0) <= 1.0
+        with deadline.request_deadline(None):
+            assert 0 < deadline.remaining() <= 1.0
+    assert deadline.remaining() is None
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    pytest.importorskip("requests")
+
+    def start(**kwargs):  # noqa: ANN003
+        server = FakeLLMServer(**kwargs).start()
+        monkeypatch.setattr(llm_client, "GROQ_API_KEY", "test-key")
+        monkeypatch.setattr(llm_client, "GROQ_API_URL", server.url)
+        servers.append(server)
+        return server
+
+    servers = []
+    get_metrics().reset()
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_open_breaker_fails_fast_without_calling_provider(provider, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "LLM_CIRCUIT_FAILURE_THRESHOLD", 2)
+    server = provider(error_rate=1.0, error_status=503)
+    client = llm_client.LLMClient()
+    try:
+        answers = [client.ask("вопрос") for _ in range(4)]
+    finally:
+        client.close()
+
+    assert answers == [llm_client.TECHNICAL_ERROR_MESSAGE] * 4
+    assert server.request_count == 2
+    registry = get_metrics()
+    assert registry.value("omnidisp_llm_errors_total", kind="http_5xx") == 2
+    assert registry.value("omnidisp_llm_errors_total", kind="circuit_open") == 2
+    assert registry.value(circuit_breaker.STATE_GAUGE, endpoint=server.url) == 2
+    assert llm_client.llm_circuit_state() == OPEN
+
+    trace = handle_message("Холодильник не морозит", trace="structured")["internal_trace"]
+    assert trace["llm_circuit"] == OPEN
+
+
+def test_deadline_bounds_wait_for_slow_provider(provider):
+    server = provider(latency_ms=2000)
+
+    started = time.monotonic()
+    result = handle_message("Холодильник не морозит", trace="none", deadline=0.2)
+    elapsed = time.monotonic() - started
+
+    assert result["client_answer"] == FALLBACK_MESSAGE
+    assert elapsed < 1.5
+    assert server.request_count == 1
+    # таймаут обрезан бюджетом запроса: это не отказ провайдера
+    assert get_metrics().value("omnidisp_llm_errors_total", kind="deadline_exceeded") == 1
+    assert get_metrics().value("omnidisp_llm_errors_total", kind="timeout") == 0
+    assert circuit_breaker.get_circuit_breaker(server.url).stats()["consecutive_failures"] == 0
+
+
+def test_batch_model_calls_honour_deadline(provider):
+    provider(latency_ms=2000)
+
+    started = time.monotonic()
+    results = list(
+        handle_messages(
+            ["Холодильник не морозит", "Не работает стиральная машина"],
+            trace="none",
+            deadline=0.2,
+        )
+    )
+
+    assert time.monotonic() - started < 1.5
+    assert [result["client_answer"] for result in results] == [FALLBACK_MESSAGE] * 2
+
+
+def test_spent_deadline_skips_provider(provider):
+    server = provider()
+
+    with deadline.request_deadline(1e-9):
+        time.sleep(0.001)
+        assert llm_client.LLMClient().ask("вопрос") == llm_client.TECHNICAL_ERROR_MESSAGE
+
+    assert server.request_count == 0
+    assert get_metrics().value("omnidisp_llm_errors_total", kind="deadline_exceeded") == 1
+
+
+def test_probe_ending_in_client_error_does_not_wedge_breaker(provider, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "LLM_CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(circuit_breaker, "LLM_CIRCUIT_RESET_TIMEOUT", 0.05)
+    server = provider(error_rate=1.0, error_status=503)
+    client = llm_client.LLMClient()
+    try:
+        client.ask("вопрос")
+        assert llm_client.llm_circuit_state() == OPEN
+        time.sleep(0.06)
+        server.error_status = 400
+        client.ask("вопрос")  # пробный запрос закончился 4xx
+        server.error_rate = 0.0
+        answer = client.ask("вопрос")
+    finally:
+        client.close()
+
+    assert answer != llm_client.TECHNICAL_ERROR_MESSAGE
+    assert server.request_count == 3
+    assert llm_client.llm_circuit_state() == CLOSED
+
+
+def test_stream_read_error_is_counted_once(provider, monkeypatch):
+    import requests
+
+    monkeypatch.setattr(circuit_breaker, "LLM_CIRCUIT_FAILURE_THRESHOLD", 1)
+    server = provider()
+
+    def broken_lines(self, **kwargs):  # noqa: ANN001, ANN003
+        raise requests.ConnectionError("connection reset")
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(requests.Response, "iter_lines", broken_lines)
+    client = llm_client.LLMClient()
+    try:
+        with pytest.raises(llm_client.LLMStreamError):
+            list(client.ask_stream("вопрос"))
+    finally:
+        client.close()
+
+    # ответ уже пришёл (успех засчитан), обрыв чтения — только в счётчике ошибок
+    assert get_metrics().value("omnidisp_llm_errors_total", kind="connection") == 1
+    assert circuit_breaker.get_circuit_breaker(server.url).stats()["consecutive_failures"] == 0
+    assert llm_client.llm_circuit_state() == CLOSED
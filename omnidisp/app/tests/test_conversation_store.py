@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_chat_message
+from omnidisp.app.state.conversation_store import (
+    ConversationStore,
+    MemoryConversationStore,
+    SQLiteConversationStore,
+)
+
+
+def test_incomplete_backend_fails_at_construction():
+    class HalfStore(ConversationStore):
+        def mark_seen(self, chat_id):  # noqa: ANN001, ANN201
+            return True
+
+    with pytest.raises(TypeError):
+        HalfStore()
+
+
+def test_memory_store_is_bounded_and_expires(monkeypatch):
+    store = MemoryConversationStore(max_chats=2, ttl=60)
+
+    assert store.mark_seen(1) is True
+    assert store.mark_seen(1) is False
+    assert store.mark_seen(2) is True
+    assert store.mark_seen(3) is True
+    assert store.stats() == {"chats": 2, "evicted": 1, "expired": 0}
+    assert store.get(1) is None
+    assert store.mark_seen(1) is True
+
+    now = time.time()
+    monkeypatch.setattr("omnidisp.app.state.conversation_store.time.time", lambda: now + 61)
+    assert store.get(3) is None
+    assert store.mark_seen(3) is True
+    assert store.stats()["expired"] == 1
+
+
+def test_sqlite_store_first_message_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+    workers = [SQLiteConversationStore(path, flush_interval=60) for _ in range(4)]
+    firsts = []
+    barrier = threading.Barrier(16)
+
+    def send(store):
+        barrier.wait(5)
+        firsts.append(store.mark_seen(42))
+
+    threads = [threading.Thread(target=send, args=(workers[n % 4],)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(firsts) == [False] * 15 + [True]
+    for store in workers:
+        store.close()
+
+
+def test_sqlite_store_batches_step_updates(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+    writer = SQLiteConversationStore(path, flush_interval=60)
+    reader = SQLiteConversationStore(path, flush_interval=60)
+
+    assert writer.mark_seen("chat") is True
+    writer.record("chat", step="price_question", category="fridge")
+
+    assert writer.get("chat").last_step == "price_question"
+    assert reader.get("chat").last_step == ""
+    assert writer.stats()["pending"] == 1
+
+    writer.flush()
+    state = reader.get("chat")
+    assert (state.last_step, state.category) == ("price_question", "fridge")
+    assert reader.mark_seen("chat") is False
+
+    writer.close()
+    reader.close()
+
+
+def test_sqlite_store_restarts_and_prunes_idle_conversations(tmp_path, monkeypatch):
+    store = SQLiteConversationStore(str(tmp_path / "c.sqlite3"), ttl=60, flush_interval=60)
+    assert store.mark_seen("old") is True
+    store.flush()
+
+    now = time.time()
+    monkeypatch.setattr("omnidisp.app.state.conversation_store.time.time", lambda: now + 61)
+    assert store.mark_seen("old") is True
+    assert store.mark_seen("old") is False
+    assert store.mark_seen("other") is True
+
+    monkeypatch.setattr("omnidisp.app.state.conversation_store.time.time", lambda: now + 200)
+    store.flush()
+    assert store.stats()["chats"] == 0
+    store.close()
+
+
+def test_handle_chat_message_greets_only_first_message(monkeypatch):
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask",
+        lambda self, prompt: "Опишите, пожалуйста, проблему.",
+    )
+    store = MemoryConversationStore()
+
+    first = handle_chat_message(7, "Здравствуйте, холодильник не морозит", store=store)
+    second = handle_chat_message(7, "Холодильник не морозит", store=store)
+
+    assert first["client_answer"].startswith("Здравствуйте.")
+    assert not second["client_answer"].startswith("Здравствуйте.")
+    state = store.get(7)
+    assert state.last_step == "clarification"
+    assert state.category != ""
+
+
+@pytest.fixture
+def telegram_app(monkeypatch):
+    pytest.importorskip("flask")
+    import main
+
+    store = MemoryConversationStore()
+    monkeypatch.setattr("omnidisp.app.state.conversation_store._store", store)
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask", lambda self, prompt: "Ответ.")
+    return main.app.test_client(), store
+
+
+def test_telegram_webhook_uses_conversation_store(telegram_app):
+    client, store = telegram_app
+    update = {"message": {"text": "Холодильник течёт", "chat": {"id": 99}}}
+
+    assert client.post("/api/tg", json=update).status_code == 200
+    assert client.post("/api/tg", json=update).status_code == 200
+    assert store.stats()["chats"] == 1
+    assert store.get(99) is not None
@@ -0,0 +1,100 @@
+import pytest
+
+from omnidisp.app.dispatcher import disp_logic
+from omnidisp.app.knowledge import loader
+from omnidisp.app.knowledge.fuzzy_index import (
+    FuzzyIndex,
+    allowed_distance,
+    apply_corrections,
+    bounded_distance,
+)
+from omnidisp.app.utils import metrics
+
+
+@pytest.mark.parametrize(
+    "left, right, limit, expected",
+    [
+        ("холодильник", "халадильник", 2, 2),
+        ("отжимает", "отжымает", 2, 1),
+        ("морозилка", "морозилка", 1, 0),
+        ("телевизор", "пылесос", 2, 3),
+        ("стиралка", "стиралк", 1, 1),
+    ],
+)
+def test_bounded_distance(left, right, limit, expected):
+    assert bounded_distance(left, right, limit) == expected
+
+
+def test_allowed_distance_depends_on_word_length():
+    assert allowed_distance(4, 2) == 0
+    assert allowed_distance(6, 2) == 1
+    assert allowed_distance(11, 2) == 2
+    assert allowed_distance(11, 1) == 1
+
+
+def test_lookup_returns_closest_word_within_bound():
+    index = FuzzyIndex()
+    index.add_many(["холодильник", "не морозит", "морозилка", "ноутбук"])
+
+    assert index.lookup("халадильник", 2) == ("холодильник", 2)
+    assert index.lookup("марозит", 2) == ("морозит", 1)
+    assert index.lookup("холодильник", 2) is None
+    assert index.lookup("халадильнек", 2) is None
+    # Слова короче MIN_WORD_LENGTH не исправляются.
+    assert index.lookup("нутб", 2) is None
+
+
+def test_correct_words_respects_budget():
+    index = FuzzyIndex()
+    index.add_many(["холодильник", "посудомойка"])
+
+    corrections, completed = index.correct_words(["халадильник", "пасудомойка"], 2)
+    assert completed
+    assert apply_corrections("халадильник и пасудомойка", corrections) == (
+        "холодильник и посудомойка"
+    )
+
+    corrections, completed = index.correct_words(["халадильник"], 2, budget=-1.0)
+    assert not completed
+    assert corrections == {}
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Халадильник не марозит", "fridge"),
+        ("стиральная машына не отжимает", "washing_machine"),
+        ("Сломалась пасудомойка", "dishwasher"),
+    ],
+)
+def test_dispatcher_detects_category_despite_typos(text, expected):
+    categories = disp_logic.analyze_message(text, False).categories
+
+    assert categories["main_category"] == expected
+    assert categories["task_categories"] == [expected]
+
+
+def test_fuzzy_lookup_runs_only_without_exact_match(monkeypatch):
+    metrics.get_metrics().reset()
+    called = []
+    original = disp_logic.correct_typos
+    monkeypatch.setattr(
+        disp_logic, "correct_typos", lambda message: called.append(message) or original(message)
+    )
+
+    assert disp_logic.analyze_message("Холодильник течет", False).categories[
+        "main_category"
+    ] == "fridge"
+    assert called == []
+
+    disp_logic.analyze_message("Халадильник течет", False)
+    assert len(called) == 1
+    assert metrics.get_metrics().value("omnidisp_fuzzy_total", result="corrected") == 1
+
+
+def test_fuzzy_lookup_can_be_switched_off(monkeypatch):
+    monkeypatch.setattr(loader, "KNOWLEDGE_FUZZY", False)
+
+    categories = disp_logic.analyze_message("Халадильник не марозит", False).categories
+
+    assert categories["main_category"] == "unknown"
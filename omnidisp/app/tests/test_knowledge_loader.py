@@ -1,7 +1,9 @@
 import json
+import os
 from pathlib import Path
 
-from omnidisp.app.knowledge import loader
+from omnidisp.app.knowledge import artifact, loader
+from omnidisp.app.utils.metrics import get_metrics
 
 
 def test_load_knowledge_with_keywords_and_prices(tmp_path):
@@ -47,3 +49,181 @@ def test_load_knowledge_handles_empty_files(tmp_path):
     assert loader.get_min_price("washing_machine") is None
 
     loader.load_knowledge()
+
+
+def test_category_index_precomputes_prices_and_questions(tmp_path):
+    categories_dir = Path(tmp_path)
+    sample_category = {
+        "symptoms": [
+            {
+                "example_phrases": ["Не Морозит", "тёплая морозилка"],
+                "clarify_question": "Сколько лет холодильнику?",
+            },
+            {
+                "example_phrases": ["не морозит", "шумит"],
+                "clarify_question": "Как давно шумит?",
+            },
+        ],
+        "jobs": [
+            {"title": "Замена ТЭНа", "price_work_from": "1500", "price_parts_from": 1400},
+            {"title": "Диагностика", "price_work_from": 900},
+            {"title": "Без цены"},
+        ],
+        "clarifying_questions": ["Какой бренд?"],
+    }
+    (categories_dir / "fridge.json").write_text(
+        json.dumps(sample_category), encoding="utf-8"
+    )
+
+    loader.load_knowledge(categories_dir)
+    try:
+        index = loader.get_category_index("fridge")
+
+        assert index.min_price == 900
+        assert (
+            loader.find_recommend_question("fridge", ["не морозит"])
+            == "Сколько лет холодильнику?"
+        )
+        assert (
+            loader.find_recommend_question("fridge", ["шумит", "ТЁПЛАЯ МОРОЗИЛКА"])
+            == "Сколько лет холодильнику?"
+        )
+        assert loader.find_recommend_question("fridge", ["шумит"]) == "Как давно шумит?"
+        assert loader.find_recommend_question("fridge", ["течёт"]) == "Какой бренд?"
+        assert loader.find_recommend_question("unknown", ["шумит"]) is None
+    finally:
+        loader.load_knowledge()
+
+
+def test_reload_knowledge_swaps_snapshot_on_file_change(tmp_path):
+    categories_dir = Path(tmp_path)
+    category_path = categories_dir / "fridge.json"
+    category_path.write_text(
+        json.dumps({"jobs": [{"price_work_from": 1800}]}), encoding="utf-8"
+    )
+
+    first = loader.load_knowledge(categories_dir)
+    try:
+        assert loader.reload_knowledge() is first
+
+        with loader.pinned_snapshot() as pinned:
+            category_path.write_text(
+                json.dumps({"jobs": [{"price_work_from": 900}], "stop_phrases": ["газ"]}),
+                encoding="utf-8",
+            )
+            os.utime(category_path, ns=(0, 0))
+            second = loader.reload_knowledge()
+
+            # In-flight work keeps the snapshot it started with.
+            assert pinned is first
+            assert loader.get_snapshot() is first
+            assert loader.get_min_price("fridge") == 1800
+
+        assert second.version > first.version
+        assert loader.get_snapshot() is second
+        assert loader.get_min_price("fridge") == 900
+        assert loader.FORBIDDEN_TASKS == ("газ",)
+        assert first.forbidden_tasks == ()
+
+        assert loader.reload_knowledge(force=True).version > second.version
+    finally:
+        loader.load_knowledge()
+
+
+def test_reload_rejects_broken_files_and_keeps_current_snapshot(tmp_path):
+    source = loader.DEFAULT_CATEGORIES_DIR / "fridge.json"
+    category_path = tmp_path / "fridge.json"
+    content = source.read_text(encoding="utf-8")
+    category_path.write_text(content, encoding="utf-8")
+    get_metrics().reset()
+
+    first = loader.load_knowledge(tmp_path)
+    try:
+        # файл пойман посреди записи
+        category_path.write_text(content[: len(content) // 2], encoding="utf-8")
+        assert loader.reload_knowledge(force=True) is first
+        assert loader.reload_knowledge() is first  # те же файлы повторно не собираются
+        assert get_metrics().value("omnidisp_knowledge_reload_failures_total") == 1
+        assert loader.get_snapshot().keyword_to_category == first.keyword_to_category != {}
+
+        category_path.write_text(content, encoding="utf-8")
+        os.utime(category_path, ns=(0, 0))
+        assert loader.reload_knowledge().version > first.version
+    finally:
+        loader.load_knowledge()
+
+
+def test_reload_rejects_non_object_and_vanishing_files(tmp_path, monkeypatch):
+    category_path = tmp_path / "fridge.json"
+    category_path.write_text(json.dumps({"keywords": ["ледник"]}), encoding="utf-8")
+    get_metrics().reset()
+
+    first = loader.load_knowledge(tmp_path)
+    try:
+        category_path.write_text("[]", encoding="utf-8")
+        assert loader.reload_knowledge(force=True) is first
+
+        def vanished(categories_dir):  # noqa: ANN001, ANN202
+            raise FileNotFoundError(categories_dir / "fridge.json")
+
+        monkeypatch.setattr(loader.artifact, "content_hash", vanished)
+        assert loader.reload_knowledge(force=True) is first
+        assert get_metrics().value("omnidisp_knowledge_reload_failures_total") == 2
+    finally:
+        monkeypatch.undo()
+        loader.load_knowledge()
+
+
+def test_build_snapshot_uses_artifact_until_content_changes(tmp_path):
+    categories_dir = Path(tmp_path) / "categories"
+    artifact_dir = Path(tmp_path) / "artifacts"
+    categories_dir.mkdir()
+    category_path = categories_dir / "fridge.json"
+    category_path.write_text(
+        json.dumps({"keywords": ["Морозильник"], "jobs": [{"price_work_from": 1800}]}),
+        encoding="utf-8",
+    )
+
+    compiled = loader.build_snapshot(categories_dir, artifact_dir)
+    assert len(list(artifact_dir.glob("*.pkl"))) == 1
+
+    cached = loader.build_snapshot(categories_dir, artifact_dir)
+    assert cached.content_hash == compiled.content_hash
+    assert cached.matcher is not compiled.matcher
+    assert cached.keyword_to_category == {"морозильник": "fridge"}
+    assert cached.category_index["fridge"].min_price == 1800
+    assert cached.matcher.first("морозильник течет", "category").value == "fridge"
+
+    category_path.write_text(json.dumps({"keywords": ["ледник"]}), encoding="utf-8")
+    rebuilt = loader.build_snapshot(categories_dir, artifact_dir)
+
+    assert rebuilt.content_hash != compiled.content_hash
+    assert rebuilt.keyword_to_category == {"ледник": "fridge"}
+    assert len(list(artifact_dir.glob("*.pkl"))) == 1
+
+
+def test_artifact_key_covers_snapshot_code(tmp_path, monkeypatch):
+    (tmp_path / "fridge.json").write_text(json.dumps({"keywords": ["ледник"]}), encoding="utf-8")
+    before = artifact.content_hash(tmp_path)
+
+    assert len(artifact.code_hash()) == 64
+    # правка matcher.py, stemmer.py и т. п. без ручного ARTIFACT_FORMAT_VERSION
+    monkeypatch.setattr(artifact, "code_hash", lambda: "changed")
+
+    assert artifact.content_hash(tmp_path) != before
+
+
+def test_validate_category_data_reports_schema_errors():
+    assert loader.validate_category_data({"keywords": ["холодильник"]}) == []
+
+    errors = loader.validate_category_data(
+        {
+            "keywords": "холодильник",
+            "jobs": [{"title": "Диагностика", "price_work_from": "дорого"}],
+            "prices": [],
+        }
+    )
+
+    assert "$.keywords: expected list" in errors
+    assert "$.jobs[0].price_work_from: expected integer" in errors
+    assert "$.prices: unknown field" in errors
@@ -0,0 +1,41 @@
+import pytest
+
+from omnidisp.app.llm import llm_client
+from omnidisp.app.llm.fake_server import FakeLLMServer
+
+pytest.importorskip("requests")
+
+
+@pytest.fixture
+def echo_server(monkeypatch):
+    with FakeLLMServer(answer=None) as server:
+        monkeypatch.setattr(llm_client, "GROQ_API_KEY", "test-key")
+        monkeypatch.setattr(llm_client, "GROQ_API_URL", server.url)
+        yield server
+
+
+def test_llm_client_reuses_pooled_connection(echo_server):
+    client = llm_client.LLMClient(pool_size=2)
+    try:
+        answers = [client.ask(f"вопрос {number}") for number in range(3)]
+        stats = client.connection_stats()
+    finally:
+        client.close()
+
+    assert answers == ["вопрос 0", "вопрос 1", "вопрос 2"]
+    assert stats == {"requests": 3, "connections_opened": 1, "connections_reused": 2}
+
+
+def test_llm_client_reports_upstream_errors(monkeypatch):
+    with FakeLLMServer(error_rate=1.0) as server:
+        monkeypatch.setattr(llm_client, "GROQ_API_KEY", "test-key")
+        monkeypatch.setattr(llm_client, "GROQ_API_URL", server.url)
+        client = llm_client.LLMClient()
+        try:
+            assert client.ask("вопрос") == llm_client.TECHNICAL_ERROR_MESSAGE
+        finally:
+            client.close()
+
+
+def test_get_llm_client_returns_process_wide_instance():
+    assert llm_client.get_llm_client() is llm_client.get_llm_client()
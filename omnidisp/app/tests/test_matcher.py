@@ -0,0 +1,167 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+
+from omnidisp.app.dispatcher import disp_logic
+from omnidisp.app.knowledge import loader, patterns
+from omnidisp.app.knowledge.matcher import PhraseMatcher
+from omnidisp.app.utils.text_normalizer import normalize_text
+
+MESSAGES = [
+    "Здравствуйте, сломалась стиральная машина, не отжимает",
+    "Здравствуйте, сколько стоит ремонт люстры?",
+    "Нужно починить люстру и заменить розетку в комнате",
+    "Холодильник не морозит. Какая цена диагностики?",
+    "привет; ноут не включается и тв не показывает",
+    "Добрый день, морозилка течет, когда сможете подъехать?",
+    "Газовая плита не зажигается, а посудомойка не сливает",
+    "Подскажите адрес, куда подъехать мастеру",
+    "Старше 30 лет холодильник, шумит холодильник",
+    "Вмятины, царапины, замена ножек на холодильнике",
+    "см не сливает воду, во сколько сможете приехать",
+    "Лужа под холодильником и пахнет из холодильника",
+    "Просто разобрать, занести на кухню, собрать обратно",
+    "Ёлки, системный блок гудит, стоимость ремонта?",
+    "",
+    "и",
+]
+
+
+def _legacy_check_stop_factors(tasks: List[str]) -> Dict[str, object]:
+    stop_phrases = loader.FORBIDDEN_TASKS or patterns.FALLBACK_STOP_PHRASES
+    forbidden_tasks: List[str] = []
+    allowed_tasks: List[str] = []
+    for task in tasks:
+        normalized_task = normalize_text(task)
+        if any(stop_phrase in normalized_task for stop_phrase in stop_phrases):
+            forbidden_tasks.append(task)
+        elif normalized_task in patterns.GREETING_TASKS:
+            continue
+        else:
+            allowed_tasks.append(task)
+    return {
+        "full_refuse": bool(forbidden_tasks) and not allowed_tasks,
+        "partial_refuse": bool(forbidden_tasks) and bool(allowed_tasks),
+        "forbidden_tasks": forbidden_tasks,
+        "allowed_tasks": allowed_tasks,
+    }
+
+
+def _legacy_detect_categories(text: str, tasks: List[str]) -> Dict[str, object]:
+    def _detect(mapping: Dict[str, str]) -> Dict[str, object]:
+        normalized_text = normalize_text(text)
+        detected_main = "unknown"
+        for keyword, category in mapping.items():
+            if keyword in normalized_text:
+                detected_main = category
+                break
+
+        detected_tasks: List[str] = []
+        for task in tasks:
+            normalized_task = normalize_text(task)
+            task_category = "unknown"
+            for keyword, category in mapping.items():
+                if keyword in normalized_task:
+                    task_category = category
+                    if detected_main == "unknown":
+                        detected_main = category
+                    break
+            detected_tasks.append(task_category)
+        return {"main_category": detected_main, "task_categories": detected_tasks}
+
+    mapping = loader.KEYWORD_TO_CATEGORY
+    knowledge_detection = _detect(mapping) if mapping else None
+    has_knowledge_match = knowledge_detection and (
+        knowledge_detection["main_category"] != "unknown"
+        or any(cat != "unknown" for cat in knowledge_detection["task_categories"])
+    )
+    result = knowledge_detection if has_knowledge_match else _detect(patterns.FALLBACK_KEYWORDS)
+    if not any(cat != "unknown" for cat in result["task_categories"]):
+        result["task_categories"] = ["unknown" for _ in tasks]
+    return result
+
+
+def _legacy_detect_dialog_step(text: str, is_first_message: bool) -> str:
+    lowered_text = normalize_text(text)
+    if any(pattern in lowered_text for pattern in patterns.PRICE_QUESTION_PATTERNS):
+        return "price_question"
+    if is_first_message and any(p in lowered_text for p in patterns.GREETING_PATTERNS):
+        return "first_greeting"
+    if any(pattern in lowered_text for pattern in patterns.ADDRESS_PATTERNS):
+        return "address"
+    if any(pattern in lowered_text for pattern in patterns.VISIT_TIME_PATTERNS):
+        return "visit_time"
+    return "clarification"
+
+
+def _assert_equivalent_to_legacy() -> None:
+    for text in MESSAGES:
+        tasks = disp_logic.split_to_tasks(text)
+        assert disp_logic.check_stop_factors(tasks) == _legacy_check_stop_factors(tasks)
+        categories = disp_logic.detect_categories(text, tasks)
+        assert categories == _legacy_detect_categories(text, tasks)
+        for is_first in (True, False):
+            step = disp_logic.detect_dialog_step(
+                text=text, is_first_message=is_first, categories=categories
+            )
+            assert step == _legacy_detect_dialog_step(text, is_first)
+
+
+def test_matcher_reports_overlapping_hits_with_offsets():
+    matcher = PhraseMatcher()
+    matcher.add("he", "a")
+    matcher.add("she", "a")
+    matcher.add("his", "b")
+    matcher.add("hers", "b", "value")
+    matcher.build()
+
+    hits = {(hit.start, hit.end, hit.phrase) for hit in matcher.scan("ushers")}
+
+    assert hits == {(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")}
+    assert matcher.first("ushers", "b").value == "value"
+    assert matcher.first("ushers", "a").phrase == "he"
+    assert not matcher.contains("his", "a")
+
+
+def test_matcher_keeps_list_order_priority():
+    matcher = PhraseMatcher()
+    matcher.add("машина", "category", "washing_machine")
+    matcher.add("посудомоечная машина", "category", "dishwasher")
+    matcher.build()
+
+    hit = matcher.first("посудомоечная машина", "category")
+
+    assert hit.value == "washing_machine"
+    assert hit.order == 0
+
+
+def test_matcher_equivalent_to_legacy_scans_default_knowledge():
+    loader.load_knowledge()
+    _assert_equivalent_to_legacy()
+
+
+def test_matcher_equivalent_to_legacy_scans_fallbacks(tmp_path):
+    (Path(tmp_path) / "tv.json").write_text("{}", encoding="utf-8")
+    loader.load_knowledge(Path(tmp_path))
+    try:
+        assert not loader.FORBIDDEN_TASKS
+        _assert_equivalent_to_legacy()
+    finally:
+        loader.load_knowledge()
+
+
+def test_matcher_equivalent_to_legacy_scans_custom_knowledge(tmp_path):
+    categories_dir = Path(tmp_path)
+    (categories_dir / "a_washing_machine.json").write_text(
+        json.dumps({"keywords": ["машина", "не отжимает"], "stop_phrases": ["Люстр"]}),
+        encoding="utf-8",
+    )
+    (categories_dir / "b_dishwasher.json").write_text(
+        json.dumps({"keywords": ["посудомойка", "машина"], "stop_phrases": ["газ"]}),
+        encoding="utf-8",
+    )
+    loader.load_knowledge(categories_dir)
+    try:
+        _assert_equivalent_to_legacy()
+    finally:
+        loader.load_knowledge()
@@ -0,0 +1,61 @@
+import re
+
+import pytest
+
+from omnidisp.app.dispatcher import disp_logic
+from omnidisp.app.dispatcher.message import Message
+
+
+def _legacy_split(text):
+    parts = re.split(r";|\.|\sи\s|,", text)
+    tasks = [part.strip() for part in parts if part and part.strip()]
+    return tasks if tasks else [text]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Холодильник не морозит",
+        "  Привет,  течёт КРАН и шумит стиралка. ;",
+        "Ёлка и ёж",
+        "...",
+        "",
+        " \t ",
+        "одна задача;другая,третья.  ",
+    ],
+)
+def test_parse_matches_legacy_split_and_normalization(text):
+    message = Message.parse(text)
+
+    assert message.tasks == _legacy_split(text)
+    assert message.normalized == text.lower().replace("ё", "е")
+    assert message.normalized_tasks == [
+        task.lower().replace("ё", "е") for task in message.tasks
+    ]
+    if message.spans != ((0, len(text)),):
+        assert [text[begin:end] for begin, end in message.spans] == message.tasks
+
+
+def test_message_uses_slots():
+    message = Message.parse("Холодильник течёт")
+
+    assert not hasattr(message, "__dict__")
+    assert message.normalize("Холодильник течёт") == "холодильник течет"
+
+
+def test_stages_normalize_once(monkeypatch):
+    calls = []
+    real_normalize = disp_logic.normalize_text
+
+    def counting_normalize(text):
+        calls.append(text)
+        return real_normalize(text)
+
+    monkeypatch.setattr("omnidisp.app.dispatcher.message.normalize_text", counting_normalize)
+    monkeypatch.setattr("omnidisp.app.dispatcher.disp_logic.normalize_text", counting_normalize)
+    monkeypatch.setattr("omnidisp.app.knowledge.loader.normalize_text", counting_normalize)
+
+    analysis = disp_logic.analyze_message("Здравствуйте, холодильник не холодит и шумит", True)
+    disp_logic.draft_client_answer(**analysis.answer_kwargs())
+
+    assert calls == ["Здравствуйте, холодильник не холодит и шумит"]
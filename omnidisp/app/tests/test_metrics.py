@@ -0,0 +1,93 @@
+import pytest
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+from omnidisp.app.llm import llm_client
+from omnidisp.app.llm.fake_server import FakeLLMServer
+from omnidisp.app.utils import metrics
+from omnidisp.app.utils.metrics import STAGE_SECONDS, MetricsRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    fresh = MetricsRegistry(enabled=True)
+    monkeypatch.setattr(metrics, "_registry", fresh)
+    return fresh
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry(enabled=True, buckets=(0.1, 1.0))
+    registry.inc("omnidisp_llm_errors_total", kind="timeout")
+    registry.inc("omnidisp_llm_errors_total", kind="timeout")
+    registry.set_gauge("omnidisp_knowledge_version", 3)
+    registry.observe(STAGE_SECONDS, 0.5, stage="llm")
+
+    text = registry.render()
+
+    assert "# TYPE omnidisp_llm_errors_total counter" in text
+    assert 'omnidisp_llm_errors_total{kind="timeout"} 2' in text
+    assert "omnidisp_knowledge_version 3" in text
+    assert "# TYPE omnidisp_stage_seconds histogram" in text
+    assert 'omnidisp_stage_seconds_bucket{stage="llm",le="0.1"} 0' in text
+    assert 'omnidisp_stage_seconds_bucket{stage="llm",le="1"} 1' in text
+    assert 'omnidisp_stage_seconds_bucket{stage="llm",le="+Inf"} 1' in text
+    assert 'omnidisp_stage_seconds_count{stage="llm"} 1' in text
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+
+    with registry.stage_timer("llm"):
+        pass
+    registry.inc("omnidisp_messages_total", entry="sync")
+
+    assert registry.stage_timer("a") is registry.stage_timer("b")
+    assert registry.render() == "\n"
+
+
+def test_process_records_stages_and_decisions(registry, monkeypatch):
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask", lambda self, prompt: "Опишите проблему."
+    )
+
+    handle_message("Холодильник не морозит")
+
+    stages = [
+        "process",
+        "split_tasks",
+        "stop_factors",
+        "categories",
+        "dialog_step",
+        "trace",
+        "prompt_build",
+        "llm",
+    ]
+    for stage in stages:
+        assert registry.histogram_count(STAGE_SECONDS, stage=stage) == 1, stage
+    assert registry.value("omnidisp_messages_total", entry="sync") == 1
+    assert registry.value("omnidisp_decisions_total", plan_type="allowed") == 1
+
+
+@pytest.mark.parametrize("status, kind", [(429, "rate_limited"), (503, "http_5xx")])
+def test_llm_errors_are_counted_by_kind(registry, monkeypatch, status, kind):
+    with FakeLLMServer(error_rate=1.0, error_status=status) as server:
+        monkeypatch.setattr(llm_client, "GROQ_API_KEY", "test-key")
+        monkeypatch.setattr(llm_client, "GROQ_API_URL", server.url)
+        client = llm_client.LLMClient()
+
+        assert client.ask("привет") == llm_client.TECHNICAL_ERROR_MESSAGE
+        client.close()
+
+    assert registry.value("omnidisp_llm_requests_total", mode="sync") == 1
+    assert registry.value("omnidisp_llm_errors_total", kind=kind) == 1
+
+
+def test_metrics_endpoint(registry):
+    pytest.importorskip("flask")
+    from main import app
+
+    registry.inc("omnidisp_messages_total", entry="sync")
+    response = app.test_client().get("/metrics")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert 'omnidisp_messages_total{entry="sync"} 1' in response.get_data(as_text=True)
@@ -0,0 +1,140 @@
+import gc
+import os
+import runpy
+import signal
+from pathlib import Path
+
+import pytest
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+from omnidisp.app.knowledge import loader
+from omnidisp.app.llm import llm_client
+from omnidisp.app.utils import prefork
+
+ROOT = Path(__file__).resolve().parents[3]
+
+
+@pytest.fixture
+def unfreeze(monkeypatch):
+    # gunicorn.conf.py настраивает prefork для сервера; после теста — как было
+    monkeypatch.setattr(prefork, "_server_workers", 1)
+    monkeypatch.setattr(prefork, "_master_pid", None)
+    yield
+    gc.unfreeze()
+
+
+def test_readiness_reports_loaded_knowledge():
+    status = prefork.warm_up()
+
+    assert status["ready"] is True
+    assert status["checks"] == {"knowledge": True, "dispatcher": True, "llm_backends": True}
+    assert status["knowledge_version"] == loader.get_snapshot().version
+    assert status["categories"] > 0
+
+
+def test_readiness_fails_without_knowledge(tmp_path):
+    loader.load_knowledge(tmp_path)
+    try:
+        status = prefork.readiness()
+    finally:
+        loader.load_knowledge()
+
+    assert status["ready"] is False
+    assert status["checks"]["knowledge"] is False
+
+
+def test_malformed_backends_fail_readiness_but_not_requests(monkeypatch, caplog):
+    monkeypatch.setattr(llm_client, "LLM_BACKENDS", "{bad")
+
+    with caplog.at_level("ERROR", logger=llm_client.__name__):
+        status = prefork.readiness()
+    result = handle_message("Холодильник не морозит", trace="structured")  # без 500
+
+    assert status["ready"] is False
+    assert status["checks"]["llm_backends"] is False
+    assert status["error"].startswith("LLM_BACKENDS is malformed")
+    assert caplog.messages == [status["error"]]
+    assert result["client_answer"]
+
+
+def test_freeze_moves_loaded_objects_to_permanent_generation(unfreeze):
+    assert prefork.freeze_shared_memory() > 0
+    assert gc.get_freeze_count() > 0
+
+
+def test_ready_route():
+    pytest.importorskip("flask")
+    import main
+
+    response = main.app.test_client().get("/ready")
+
+    assert response.status_code == 200
+    assert response.get_json()["ready"] is True
+
+
+class _Log:
+    def __init__(self) -> None:
+        self.messages = []
+
+    def info(self, message, *args):  # noqa: ANN001, ANN002
+        self.messages.append(message % args)
+
+    error = exception = info
+
+
+class _Server:
+    def __init__(self) -> None:
+        self.log = _Log()
+        self.pid = os.getpid()
+
+
+def test_admin_reload_in_worker_signals_master(monkeypatch):
+    pytest.importorskip("flask")
+    import main
+
+    signals = []
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(prefork, "_master_pid", 4242)
+    monkeypatch.setattr(os, "kill", lambda pid, sig: signals.append((pid, sig)))
+    version = loader.get_snapshot().version
+
+    response = main.app.test_client().post(
+        "/admin/knowledge/reload", headers={"X-Admin-Token": "secret"}
+    )
+
+    assert response.status_code == 202
+    assert signals == [(4242, signal.SIGHUP)]
+    assert loader.get_snapshot().version == version
+
+
+def test_gunicorn_accepts_config(unfreeze):
+    gunicorn_config = pytest.importorskip("gunicorn.config")
+    config = runpy.run_path(str(ROOT / "gunicorn.conf.py"))
+    cfg = gunicorn_config.Config()
+
+    # так же, как gunicorn читает --config: каждое известное имя проходит валидацию
+    for name, value in config.items():
+        if name in cfg.settings:
+            cfg.set(name, value)
+
+    assert cfg.preload_app is True
+    assert cfg.timeout == 60
+    assert cfg.graceful_timeout == 30
+    assert callable(cfg.when_ready)
+
+
+def test_gunicorn_config_preloads_and_reloads_knowledge(unfreeze):
+    config = runpy.run_path(str(ROOT / "gunicorn.conf.py"))
+    server = _Server()
+
+    assert config["preload_app"] is True
+    config["when_ready"](server)
+    config["post_fork"](server, None)
+    version = loader.get_snapshot().version
+    config["on_reload"](server)
+
+    assert loader.get_snapshot().version > version
+    assert prefork.master_pid() == os.getpid()
+    assert prefork.server_workers() == config["workers"]
+    assert server.log.messages[0].startswith("omnidisp ready: knowledge")
+    assert server.log.messages[1] == f"omnidisp knowledge reloaded: v{version + 1}"
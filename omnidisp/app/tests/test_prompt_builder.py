@@ -0,0 +1,93 @@
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+from omnidisp.app.llm import llm_client
+from omnidisp.app.llm.prompt_builder import (
+    MIN_USER_TEXT_TOKENS,
+    SYSTEM_PROMPT,
+    SYSTEM_PROMPT_TOKENS,
+    build_disp_prompt,
+    compile_disp_prompt,
+    estimate_tokens,
+    truncate_to_tokens,
+)
+
+PLAN = {
+    "step": "clarification",
+    "plan_type": "partial_refuse",
+    "forbidden_tasks": ["повесить люстру"],
+    "allowed_tasks": ["заменить розетку"],
+    "main_category": "electricity",
+    "is_price_question": False,
+    "is_first_message": True,
+    "recommend_question": None,
+}
+
+
+def test_plan_is_compact_and_instructions_are_separate():
+    prompt = build_disp_prompt(user_text="Повесить люстру и заменить розетку", **PLAN)
+
+    assert prompt.splitlines() == [
+        "PLAN:",
+        "user_text: Повесить люстру и заменить розетку",
+        "step: clarification",
+        "type: partial_refuse",
+        "is_first_message: yes",
+        "forbidden_tasks: повесить люстру",
+        "allowed_tasks: заменить розетку",
+        "main_category: electricity",
+        "price_question: no",
+    ]
+    assert "PLAN.type == 'partial_refuse'" in SYSTEM_PROMPT
+    assert SYSTEM_PROMPT_TOKENS == estimate_tokens(SYSTEM_PROMPT)
+
+
+def test_estimate_tokens_counts_words_by_script():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("plan") == 1
+    assert estimate_tokens("холодильник") == 4
+    assert estimate_tokens("да, нет.") == 4
+    assert truncate_to_tokens("раз два три четыре", 2) == "раз два…"
+    assert truncate_to_tokens("раз два", 5) == "раз два"
+
+
+def test_budget_truncates_text_and_task_lists():
+    plan = dict(PLAN, allowed_tasks=[f"задача номер {number}" for number in range(40)])
+    long_text = "очень длинное сообщение клиента " * 100
+
+    unlimited = compile_disp_prompt(user_text=long_text, max_tokens=0, **plan)
+    compiled = compile_disp_prompt(user_text=long_text, max_tokens=150, **plan)
+
+    assert not unlimited.truncated
+    assert unlimited.tokens > 1000
+    assert compiled.truncated
+    assert compiled.tokens <= 150
+    assert "… и ещё" in compiled.text
+    assert "forbidden_tasks: повесить люстру" in compiled.text
+    user_line = compiled.text.splitlines()[1]
+    assert user_line.endswith("…")
+    assert estimate_tokens(user_line) >= MIN_USER_TEXT_TOKENS
+
+
+def test_request_payload_sends_system_message_first():
+    payload = llm_client._request_payload("PLAN:", SYSTEM_PROMPT)
+
+    assert payload["messages"] == [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": "PLAN:"},
+    ]
+    assert llm_client._request_payload("PLAN:")["messages"] == [
+        {"role": "user", "content": "PLAN:"}
+    ]
+
+
+def test_trace_reports_prompt_tokens(monkeypatch):
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask", lambda self, prompt: "Опишите проблему."
+    )
+
+    result = handle_message("Холодильник не морозит", trace="structured")
+    trace = result["internal_trace"]
+
+    assert trace["prompt_tokens"] > 0
+    assert trace["system_prompt_tokens"] == SYSTEM_PROMPT_TOKENS
+    assert trace["prompt_truncated"] is False
+    assert "Промпт: ~" in handle_message("Холодильник не морозит")["internal_trace"]
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from omnidisp.app.llm import llm_client
+from omnidisp.bench.replay import (
+    ReplayRecord,
+    diff_decisions,
+    main,
+    percentile,
+    read_records,
+    replay,
+    summarize,
+)
+
+
+@pytest.fixture
+def messages(tmp_path):
+    path = tmp_path / "messages.jsonl"
+    lines = [
+        json.dumps({"text": "Здравствуйте, холодильник не морозит", "is_first_message": True}),
+        "not json",
+        json.dumps({"title": "без текста"}),
+        json.dumps({"text": "Повесить люстру и заменить розетку"}),
+        json.dumps({"text": "Сколько стоит ремонт стиральной машины?"}),
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def test_read_records_skips_lines_without_message(messages):
+    records = list(read_records(messages))
+
+    assert [(record.index, record.is_first_message) for record in records] == [
+        (1, True),
+        (4, False),
+        (5, False),
+    ]
+    assert len(list(read_records(messages, limit=2))) == 2
+    assert list(read_records(messages, text_field="title"))[0].text == "без текста"
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(number) for number in range(1, 101)]
+
+    assert percentile(values, 0.5) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile(values, 1.0) == 100.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_replay_paces_requests_and_counts_statuses():
+    def send(record):  # noqa: ANN001, ANN202
+        if record.index == 3:
+            raise ConnectionError("refused")
+        return {"client_answer": "ок", "internal_trace": {"step": "clarification"}}
+
+    records = [ReplayRecord(index, "текст", False) for index in range(1, 6)]
+    outcomes, elapsed = replay(records, send, concurrency=2, qps=50)
+    summary = summarize(outcomes, elapsed)
+
+    assert elapsed >= 0.08  # пятый запрос запланирован на 80 мс
+    assert summary.requests == 5
+    assert summary.statuses == {"ConnectionError": 1, "ok": 4}
+    assert summary.error_rate == 0.2
+    assert summary.latency_ms["p50"] <= summary.latency_ms["p99"]
+
+
+def test_diff_decisions_reports_changed_fields():
+    golden = {1: {"plan_type": "allowed", "step": "clarification"}, 2: {"plan_type": "allowed"}}
+    current = {1: {"plan_type": "full_refuse", "step": "clarification"}, 3: {"plan_type": "x"}}
+
+    assert diff_decisions(current, golden) == [(1, "plan_type", "allowed", "full_refuse")]
+
+
+def test_replay_against_fake_llm_and_golden_run(messages, tmp_path, monkeypatch, capsys):
+    pytest.importorskip("requests")
+    monkeypatch.setattr(llm_client, "LLM_BACKENDS", llm_client.LLM_BACKENDS)
+    golden = tmp_path / "golden.jsonl"
+    common = [str(messages), "--fake-llm", "--llm-latency-ms", "5", "--llm-jitter-ms", "0"]
+
+    assert main(common + ["--save-golden", str(golden)]) == 0
+    saved = [json.loads(line) for line in golden.read_text(encoding="utf-8").splitlines()]
+    assert [entry["line"] for entry in saved] == [1, 4, 5]
+    assert saved[0]["main_category"] == "fridge"
+
+    assert main(common + ["--golden", str(golden), "--fail-on-diff"]) == 0
+    saved[0]["main_category"] = "tv"
+    golden.write_text(
+        "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in saved), encoding="utf-8"
+    )
+    assert main(common + ["--golden", str(golden), "--fail-on-diff"]) == 1
+
+    output = capsys.readouterr().out
+    assert "p99" in output
+    assert "line 1      main_category    'tv' -> 'fridge'" in output
@@ -0,0 +1,170 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from omnidisp.app.dispatcher.dispatcher_controller import (
+    handle_message,
+    handle_message_stream,
+    handle_messages,
+)
+from omnidisp.app.utils import request_log
+from omnidisp.app.utils.request_log import RequestLog
+from omnidisp.bench.replay import read_records
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_request_log_writes_records_in_background(tmp_path):
+    log = RequestLog(tmp_path)
+    assert log.emit({"entry": "sync", "text": "Не морозит холодильник"})
+    assert log.emit({"entry": "async", "text": "Повесить люстру"})
+    log.flush()
+    log.close()
+
+    assert [record["entry"] for record in _lines(log.path)] == ["sync", "async"]
+    assert log.stats() == {"written": 2, "dropped": 0, "queued": 0}
+
+
+def test_request_log_rotates_by_size_and_keeps_backups(tmp_path):
+    log = RequestLog(tmp_path, max_bytes=40, backup_count=2)
+    for number in range(5):
+        log.emit({"n": number, "pad": "x" * 20})
+    log.flush()
+    log.close()
+
+    rotated = sorted(tmp_path.glob("requests-*.*.jsonl"))
+    assert len(rotated) == 2
+    assert _lines(log.path) == [{"n": 4, "pad": "x" * 20}]
+
+
+def test_request_log_prunes_files_of_exited_workers(tmp_path):
+    dead_pid = 999999999  # больше pid_max: такого процесса нет
+    other = tmp_path / f"requests-{os.getppid()}.20260101-000000.jsonl"
+    other.write_text("{}\n", encoding="utf-8")
+    (tmp_path / f"requests-{dead_pid}.jsonl").write_text("{}\n", encoding="utf-8")
+    for day in range(1, 4):
+        path = tmp_path / f"requests-{dead_pid}.202601{day:02d}-000000.jsonl"
+        path.write_text("{}\n", encoding="utf-8")
+        os.utime(path, (day, day))
+
+    log = RequestLog(tmp_path, max_bytes=10, backup_count=2)
+    for number in range(4):
+        log.emit({"n": number})
+    log.flush()
+    log.close()
+
+    dead = list(tmp_path.glob(f"requests-{dead_pid}*.jsonl"))
+    assert len(dead) == 2
+    assert all(path.name.count(".") == 2 for path in dead)  # живой файл тоже ротирован
+    assert other.exists()  # чужие живые процессы не трогаем
+    assert len(list(tmp_path.glob(f"requests-{os.getpid()}.*.jsonl"))) == 2
+
+
+def test_queued_records_are_written_when_process_exits(tmp_path):
+    script = (
+        "from omnidisp.app.utils.request_log import get_request_log\n"
+        "log = get_request_log()\n"
+        "for number in range(500):\n"
+        "    log.emit({'n': number})\n"
+    )
+    env = dict(os.environ, REQUEST_LOG_ENABLED="1", REQUEST_LOG_DIR=str(tmp_path))
+    root = Path(__file__).resolve().parents[3]
+    subprocess.run([sys.executable, "-c", script], cwd=root, env=env, check=True)
+
+    [path] = tmp_path.glob("requests-*.jsonl")
+    assert len(_lines(path)) == 500
+
+
+def test_request_log_drops_records_when_queue_is_full(tmp_path, monkeypatch):
+    log = RequestLog(tmp_path, queue_size=1)
+    monkeypatch.setattr(log, "_ensure_writer", lambda: None)  # писатель «завис»
+
+    assert log.emit({"n": 1}) is True
+    assert log.emit({"n": 2}) is False
+    assert log.stats() == {"written": 0, "dropped": 1, "queued": 1}
+
+
+def test_dispatch_emits_replayable_record(tmp_path, monkeypatch):
+    log = RequestLog(tmp_path)
+    monkeypatch.setattr(request_log, "_request_log", log)
+    monkeypatch.setattr("omnidisp.app.dispatcher.disp_logic.get_answer_cache", lambda: None)
+
+    def fake_ask(self, prompt: str) -> str:  # noqa: ANN001
+        return "Когда холодильник перестал морозить?"
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask", fake_ask)
+
+    handle_message("Не морозит холодильник", is_first_message=True)
+    log.flush()
+    log.close()
+
+    [record] = _lines(log.path)
+    assert record["entry"] == "sync"
+    assert record["main_category"] == "fridge"
+    assert record["plan_type"] == "allowed"
+    assert record["answer"] == "model"
+    assert record["llm_status"] == "ok"
+    assert {"process", "categories", "llm"} <= set(record["stages_ms"])
+    assert record["total_ms"] >= record["stages_ms"]["process"]
+    assert [item.text for item in read_records(log.path)] == ["Не морозит холодильник"]
+
+
+def _logged(tmp_path, monkeypatch):
+    log = RequestLog(tmp_path)
+    monkeypatch.setattr(request_log, "_request_log", log)
+    monkeypatch.setattr("omnidisp.app.dispatcher.disp_logic.get_answer_cache", lambda: None)
+    return log
+
+
+def test_batch_emits_record_per_message_after_answer(tmp_path, monkeypatch):
+    log = _logged(tmp_path, monkeypatch)
+    prompts = []
+
+    def fake_ask(self, prompt: str) -> str:  # noqa: ANN001
+        prompts.append(prompt)
+        return "Когда холодильник перестал морозить?"
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask", fake_ask)
+
+    texts = ["Не морозит холодильник", "Течёт стиральная машина", "Не морозит холодильник"]
+    list(handle_messages(texts, trace="none"))
+    log.flush()
+    log.close()
+
+    records = _lines(log.path)
+    assert len(prompts) == 2  # повтор текста — один запрос к модели
+    assert [record["text"] for record in records] == texts
+    for record in records:
+        assert record["entry"] == "batch"
+        assert record["answer"] == "model"
+        assert record["llm_status"] == "ok"
+        assert "llm" in record["stages_ms"]
+    assert records[0]["main_category"] == records[2]["main_category"] == "fridge"
+
+
+def test_stream_record_closes_with_the_stream(tmp_path, monkeypatch):
+    log = _logged(tmp_path, monkeypatch)
+
+    def ask_stream(self, prompt: str):  # noqa: ANN001
+        yield "Когда "
+        yield "удобно подъехать?"
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask_stream", ask_stream)
+
+    _trace, parts = handle_message_stream("Холодильник течёт")
+    log.flush()
+    assert not log.path.exists()  # ответ ещё не прочитан — записи нет
+    list(parts)
+    log.flush()
+    log.close()
+
+    [record] = _lines(log.path)
+    assert record["entry"] == "stream"
+    assert record["main_category"] == "fridge"
+    assert record["llm_status"] == "ok"
+    assert "llm" in record["stages_ms"]
+    assert "error" not in record
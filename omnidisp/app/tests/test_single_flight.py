@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from omnidisp.app.llm.single_flight import AsyncSingleFlight, SingleFlight, SingleFlightTimeout
+
+
+def test_single_flight_shares_one_call_between_threads():
+    single_flight = SingleFlight(max_waiters=100, timeout=5)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "ответ"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("p", slow_call)))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(target=lambda: results.append(single_flight.do("p", slow_call)))
+        for _ in range(9)
+    ]
+    for thread in followers:
+        thread.start()
+    while single_flight.stats()["coalesced"] < 9:
+        time.sleep(0.005)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ["ответ"] * 10
+    assert single_flight.stats() == {
+        "leaders": 1,
+        "coalesced": 9,
+        "overflow": 0,
+        "timeouts": 0,
+        "in_flight": 0,
+    }
+
+
+def test_single_flight_bounds_waiters_and_wait_time():
+    single_flight = SingleFlight(max_waiters=1, timeout=0.05)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_call():
+        started.set()
+        release.wait(5)
+        return "медленно"
+
+    leader = threading.Thread(target=single_flight.do, args=("p", slow_call))
+    leader.start()
+    started.wait(5)
+
+    with pytest.raises(SingleFlightTimeout):
+        single_flight.do("p", slow_call)
+    # The waiter slot is still taken by the timed-out caller, so the next
+    # caller does not wait at all and runs its own call.
+    assert single_flight.do("p", lambda: "своё") == "своё"
+
+    release.set()
+    leader.join(5)
+    stats = single_flight.stats()
+    assert stats["timeouts"] == 1
+    assert stats["overflow"] == 1
+
+
+def test_single_flight_propagates_errors_to_waiters():
+    single_flight = SingleFlight()
+
+    def failing():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        single_flight.do("p", failing)
+    assert single_flight.do("p", lambda: "ok") == "ok"
+
+
+def test_async_single_flight_shares_one_call_between_tasks():
+    single_flight = AsyncSingleFlight(max_waiters=100, timeout=5)
+    calls = []
+
+    async def slow_call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ответ"
+
+    async def scenario():
+        return await asyncio.gather(
+            *(single_flight.do("p", slow_call) for _ in range(10)),
+            single_flight.do("other", slow_call),
+        )
+
+    results = asyncio.run(scenario())
+
+    assert results == ["ответ"] * 11
+    assert len(calls) == 2
+    assert single_flight.stats()["coalesced"] == 9
+    assert single_flight.stats()["in_flight"] == 0
+
+
+def test_async_single_flight_timeout_does_not_cancel_shared_call():
+    single_flight = AsyncSingleFlight(max_waiters=100, timeout=0.02)
+    finished = []
+
+    async def slow_call():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "поздно"
+
+    async def scenario():
+        first = asyncio.ensure_future(single_flight.do("p", slow_call))
+        with pytest.raises(SingleFlightTimeout):
+            await first
+        await asyncio.sleep(0.06)
+
+    asyncio.run(scenario())
+
+    assert finished == [1]
+
+
+def test_concurrent_identical_messages_reach_model_once(monkeypatch):
+    from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+
+    monkeypatch.setattr(
+        "omnidisp.app.dispatcher.disp_logic.get_single_flight",
+        lambda: coalescer,
+    )
+    coalescer = SingleFlight(max_waiters=100, timeout=5)
+    prompts = []
+
+    def slow_ask(self, prompt: str) -> str:  # noqa: ANN001
+        prompts.append(prompt)
+        time.sleep(0.2)
+        return "Когда перестал морозить?"
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask", slow_ask)
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(handle_message("Холодильник не морозит"))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(prompts) == 1
+    assert [result["client_answer"] for result in results] == ["Когда перестал морозить?"] * 5
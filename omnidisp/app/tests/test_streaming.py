@@ -0,0 +1,134 @@
+import json
+import re
+import time
+
+import pytest
+
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message_stream
+from omnidisp.app.llm import deadline, llm_client
+from omnidisp.app.llm.fake_server import FakeLLMServer
+from omnidisp.app.llm.llm_client import LLMStreamError
+from omnidisp.app.utils import metrics
+
+
+def _fake_stream(chunks, error=None):
+    def ask_stream(self, prompt: str):  # noqa: ANN001
+        yield from chunks
+        if error is not None:
+            raise error
+
+    return ask_stream
+
+
+def test_stream_sends_trace_first_and_adds_greeting(monkeypatch):
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask_stream",
+        _fake_stream(["Оп", "ишите, ", "пожалуйста, ", "проблему."]),
+    )
+
+    trace, parts = handle_message_stream("Холодильник не морозит", is_first_message=True)
+    parts = list(parts)
+
+    assert trace.startswith("INTERNAL TRACE:")
+    assert parts[0] == "Здравствуйте. Опишите, "
+    assert "".join(parts) == "Здравствуйте. Опишите, пожалуйста, проблему."
+
+
+def test_stream_buffers_price_answer_to_suppress_digits(monkeypatch):
+    monkeypatch.setattr(
+        "omnidisp.app.dispatcher.disp_logic.get_min_price", lambda category: None
+    )
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask_stream",
+        _fake_stream(["Обычно ", "выходит ", "около ", "2000."]),
+    )
+
+    _trace, parts = handle_message_stream("Сколько стоит ремонт стиральной машины?")
+    parts = list(parts)
+
+    assert len(parts) == 1
+    assert not re.search(r"\d", parts[0])
+    assert "диагност" in parts[0]
+
+
+def test_stream_falls_back_when_model_fails_before_first_part(monkeypatch):
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask_stream",
+        _fake_stream(["Опи"], error=LLMStreamError("boom")),
+    )
+
+    _trace, parts = handle_message_stream("Холодильник не морозит")
+
+    assert list(parts) == [
+        "Сейчас не получается ответить подробно, попробуйте, пожалуйста, написать ещё раз "
+        "или переформулировать запрос."
+    ]
+
+
+def test_stream_reads_model_within_request_deadline(monkeypatch):
+    budgets = []
+
+    def ask_stream(self, prompt: str):  # noqa: ANN001
+        budgets.append(deadline.remaining())
+        yield "Когда удобно подъехать?"
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask_stream", ask_stream)
+
+    _trace, parts = handle_message_stream("Холодильник течёт", deadline=5)
+    assert deadline.remaining() is None  # бюджет ставится при чтении, не при вызове
+    list(parts)
+
+    assert len(budgets) == 1 and 0 < budgets[0] <= 5
+    assert deadline.remaining() is None
+
+
+def test_stream_times_model_until_last_part(monkeypatch):
+    def ask_stream(self, prompt: str):  # noqa: ANN001
+        yield "Когда "
+        time.sleep(0.02)
+        yield "удобно подъехать?"
+
+    monkeypatch.setattr("omnidisp.app.llm.llm_client.LLMClient.ask_stream", ask_stream)
+
+    _trace, parts = handle_message_stream("Холодильник течёт")
+    with metrics.collect_stages() as stages:
+        list(parts)
+
+    assert stages["llm"] >= 0.02
+
+
+def test_llm_client_ask_stream_reads_sse_from_provider(monkeypatch):
+    pytest.importorskip("requests")
+    with FakeLLMServer(answer="Когда появилась проблема?") as server:
+        monkeypatch.setattr(llm_client, "GROQ_API_KEY", "test-key")
+        monkeypatch.setattr(llm_client, "GROQ_API_URL", server.url)
+        client = llm_client.LLMClient()
+        try:
+            parts = list(client.ask_stream("вопрос"))
+        finally:
+            client.close()
+
+    assert parts == ["Когда ", "появилась ", "проблема?"]
+
+
+def test_stream_endpoint_emits_sse_events(monkeypatch):
+    pytest.importorskip("flask")
+    import main
+
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask_stream",
+        _fake_stream(["Когда ", "удобно ", "подъехать?"]),
+    )
+
+    response = main.app.test_client().post(
+        "/api/disp/stream", json={"text": "Холодильник течёт"}
+    )
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.get_data(as_text=True).strip().split("\n\n")
+    ]
+
+    assert response.mimetype == "text/event-stream"
+    assert events[0][0] == "trace"
+    assert [name for name, _data in events[1:]] == ["answer", "answer", "answer", "done"]
+    assert events[-1][1]["client_answer"] == "Когда удобно подъехать?"
@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from omnidisp.app.telegram.sender import TelegramSender
+
+pytest.importorskip("requests")
+
+
+class _FakeTelegram:
+    """Records sendMessage calls; answers with the queued status codes first."""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.delivered = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):  # noqa: N802
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake.lock:
+                    status = fake.statuses.pop(0) if fake.statuses else 200
+                    if status == 200:
+                        fake.delivered.append((payload["chat_id"], payload["text"], time.monotonic()))
+                body = {"ok": status == 200}
+                if status == 429:
+                    body["parameters"] = {"retry_after": 1}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_base = f"http://127.0.0.1:{self.server.server_port}/botTEST"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_sender_keeps_chat_order_and_rate_limit():
+    telegram = _FakeTelegram()
+    sender = TelegramSender(telegram.api_base, workers=3, chat_interval=0.1, global_rate=0)
+    try:
+        for number in range(3):
+            assert sender.send_message(1, f"первое {number}")
+        assert sender.send_message(2, "второй чат")
+
+        assert _wait_for(lambda: sender.metrics()["sent"] == 4)
+    finally:
+        sender.stop()
+        telegram.close()
+
+    first_chat = [item for item in telegram.delivered if item[0] == 1]
+    assert [text for _chat, text, _at in first_chat] == ["первое 0", "первое 1", "первое 2"]
+    gaps = [b[2] - a[2] for a, b in zip(first_chat, first_chat[1:])]
+    assert all(gap >= 0.09 for gap in gaps)
+    assert sender.metrics()["queue_depth"] == 0
+
+
+def test_sender_honors_retry_after_and_retries_server_errors():
+    telegram = _FakeTelegram(statuses=[429, 500])
+    sender = TelegramSender(telegram.api_base, workers=1, global_rate=0, backoff_base=0.01)
+    try:
+        started = time.monotonic()
+        sender.send_message(7, "ответ")
+        assert _wait_for(lambda: sender.metrics()["sent"] == 1)
+        elapsed = time.monotonic() - started
+    finally:
+        sender.stop()
+        telegram.close()
+
+    assert elapsed >= 1.0
+    assert sender.metrics()["retried"] == 2
+    assert telegram.delivered[0][:2] == (7, "ответ")
+
+
+def test_sender_drops_on_overflow_and_permanent_errors():
+    telegram = _FakeTelegram(statuses=[400])
+    sender = TelegramSender(telegram.api_base, workers=1, max_queue=1, global_rate=0)
+    try:
+        assert sender.send_message(1, "будет отклонено")
+        assert not sender.send_message(1, "не влезло")
+        assert _wait_for(lambda: sender.metrics()["failed"] == 1)
+    finally:
+        sender.stop()
+        telegram.close()
+
+    metrics = sender.metrics()
+    assert metrics["dropped"] == 1
+    assert metrics["sent"] == 0
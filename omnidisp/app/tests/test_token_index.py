@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from omnidisp.app.dispatcher import disp_logic
+from omnidisp.app.knowledge import loader
+from omnidisp.app.knowledge.stemmer import stem
+from omnidisp.app.knowledge.token_index import TokenIndex, redundant_phrases, stem_tokens
+
+
+@pytest.mark.parametrize(
+    "words, expected",
+    [
+        (["люстра", "люстру", "люстры", "люстрами"], "люстр"),
+        (["холодильник", "холодильника", "холодильником"], "холодильник"),
+        (["розетка", "розетку", "розетки"], "розетк"),
+        (["стиральная", "стиральной", "стиральную"], "стиральн"),
+        (["краснейший"], "красн"),
+        (["каменный"], "камен"),
+    ],
+)
+def test_stemmer_reduces_inflections(words, expected):
+    assert {stem(word) for word in words} == {expected}
+
+
+def test_token_index_matches_consecutive_stems_by_order():
+    index = TokenIndex()
+    index.add("газовая колонка", "stop")
+    index.add("стиральная машина", "category", "washing_machine")
+    index.add("машина", "category", "car")
+
+    stems = stem_tokens("почините стиральную машину")
+
+    assert index.first(stems, "category").value == "washing_machine"
+    assert index.first(stem_tokens("машину и колонку"), "category").value == "car"
+    assert not index.contains(stem_tokens("газовую плиту и колонку"), "stop")
+    assert index.contains(stem_tokens("ремонт газовой колонки"), "stop")
+
+
+def test_redundant_phrases_reports_inflection_variants():
+    assert redundant_phrases(["люстра", "люстру", "потолочный светильник", "люстры"]) == [
+        ("люстру", "люстра"),
+        ("люстры", "люстра"),
+    ]
+
+
+@pytest.fixture
+def inflection_knowledge(tmp_path):
+    categories_dir = tmp_path / "categories"
+    categories_dir.mkdir()
+    (categories_dir / "electricity.json").write_text(
+        json.dumps(
+            {
+                "category": "electricity",
+                "keywords": ["розетка", "выключатель"],
+                "stop_phrases": ["люстра", "газовая колонка"],
+            },
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+    loader.load_knowledge(categories_dir)
+    try:
+        yield
+    finally:
+        loader.load_knowledge()
+
+
+def test_dispatcher_matches_inflected_keywords_and_stop_phrases(inflection_knowledge):
+    analysis = disp_logic.analyze_message("Заменить розетку, повесить люстру", False)
+
+    assert analysis.categories["main_category"] == "electricity"
+    assert analysis.stop_result["forbidden_tasks"] == ["повесить люстру"]
+    assert analysis.stop_result["allowed_tasks"] == ["Заменить розетку"]
+
+
+def test_morphology_can_be_switched_off(inflection_knowledge, monkeypatch):
+    monkeypatch.setattr(loader, "KNOWLEDGE_MORPHOLOGY", False)
+    # Иначе "розетку" найдётся как опечатка в слове "розетка".
+    monkeypatch.setattr(loader, "KNOWLEDGE_FUZZY", False)
+
+    analysis = disp_logic.analyze_message("Заменить розетку, повесить люстру", False)
+
+    assert analysis.categories["main_category"] == "unknown"
+    assert analysis.stop_result["forbidden_tasks"] == []
@@ -0,0 +1,88 @@
+import pytest
+
+from omnidisp.app.dispatcher import disp_logic
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+from omnidisp.app.state.conversation_store import MemoryConversationStore
+
+TEXT = "Холодильник не морозит, сколько стоит"
+
+
+@pytest.fixture(autouse=True)
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(
+        "omnidisp.app.llm.llm_client.LLMClient.ask",
+        lambda self, prompt: "Точную стоимость скажу после диагностики.",
+    )
+
+
+def test_trace_none_skips_collection(monkeypatch):
+    def fail(**kwargs):  # noqa: ANN003
+        raise AssertionError("trace must not be collected")
+
+    monkeypatch.setattr(disp_logic, "collect_trace", fail)
+
+    result = handle_message(TEXT, trace="none")
+
+    assert list(result) == ["client_answer"]
+    assert result["client_answer"]
+
+
+def test_structured_trace_matches_text_trace():
+    structured = handle_message(TEXT, trace="structured")["internal_trace"]
+    text = handle_message(TEXT)["internal_trace"]
+
+    assert structured["step"] == "price_question"
+    assert structured["price_question"] is True
+    assert structured["plan_type"] == "allowed"
+    assert structured["tasks_count"] == 2
+    assert disp_logic.DispatchTrace(
+        **{key: value for key, value in structured.items() if key != "price_question"}
+    ).render() == text
+    assert f"Категория: {structured['main_category']}." in text
+
+
+@pytest.fixture
+def client():
+    pytest.importorskip("flask")
+    from main import app
+
+    return app.test_client()
+
+
+def test_api_disp_trace_option(client):
+    none = client.post("/api/disp", json={"text": TEXT, "trace": "none"}).get_json()
+    structured = client.post("/api/disp", json={"text": TEXT, "trace": "structured"}).get_json()
+    default = client.post("/api/disp", json={"text": TEXT}).get_json()
+
+    assert "internal_trace" not in none
+    assert structured["internal_trace"]["step"] == "price_question"
+    assert default["internal_trace"].startswith("INTERNAL TRACE:")
+    assert client.post("/api/disp", json={"text": TEXT, "trace": "full"}).status_code == 400
+
+
+class _RecordingSender:
+    def __init__(self) -> None:
+        self.sent = []
+
+    def send_message(self, chat_id, text):  # noqa: ANN001
+        self.sent.append((chat_id, text))
+        return True
+
+
+@pytest.mark.parametrize("send_trace", [True, False])
+def test_telegram_trace_switch(client, monkeypatch, send_trace):
+    import main
+
+    sender = _RecordingSender()
+    monkeypatch.setattr(main, "telegram_sender", sender)
+    monkeypatch.setattr(main, "TELEGRAM_SEND_TRACE", send_trace)
+    monkeypatch.setattr(
+        "omnidisp.app.state.conversation_store._store", MemoryConversationStore()
+    )
+
+    client.post("/api/tg", json={"message": {"text": TEXT, "chat": {"id": 5}}})
+
+    [(chat_id, text)] = sender.sent
+    assert chat_id == 5
+    assert ("INTERNAL TRACE:" in text) is send_trace
+    assert text.endswith("Точную стоимость скажу после диагностики.")
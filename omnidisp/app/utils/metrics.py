@@ -0,0 +1,259 @@
+"""In-process counters and latency histograms in Prometheus text format.
+
+The dispatcher records how long each stage of ``process()`` takes and
+counts outcomes (refusals, cache hits, model errors). ``main.py`` serves
+:func:`render` at ``/metrics``.
+
+When ``METRICS_ENABLED`` is off every recording call returns right away
+and :func:`stage_timer` hands out one shared no-op context manager, so
+instrumented code pays only for a function call.
+
+Inside :func:`collect_stages` stage durations are also summed into a
+per-request dict (used by the request log), whether or not metrics are on.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from omnidisp.config.settings import METRICS_ENABLED
+
+LabelSet = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, LabelSet, float]
+
+STAGE_SECONDS = "omnidisp_stage_seconds"
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)  # fmt: skip
+
+_DESCRIPTIONS: Dict[str, Tuple[str, str]] = {
+    STAGE_SECONDS: ("histogram", "Time spent in a dispatcher stage."),
+    "omnidisp_messages_total": ("counter", "Messages processed, by entry point."),
+    "omnidisp_decisions_total": ("counter", "Stop-factor decisions, by plan type."),
+    "omnidisp_answer_cache_total": ("counter", "Answer cache lookups, by result."),
+    "omnidisp_llm_requests_total": ("counter", "Requests sent to the model API."),
+    "omnidisp_llm_errors_total": ("counter", "Failed model requests, by kind."),
+    "omnidisp_llm_failovers_total": ("counter", "Model requests retried on another backend."),
+    "omnidisp_llm_backend_requests_total": ("counter", "Model calls, by backend and outcome."),
+    "omnidisp_llm_backend_headroom": ("gauge", "Share of a backend's rate limit still available."),
+    "omnidisp_knowledge_version": ("gauge", "Version of the published knowledge snapshot."),
+    "omnidisp_knowledge_reload_failures_total": ("counter", "Rejected knowledge reloads."),
+    "omnidisp_request_log_total": ("counter", "Request log records, written or dropped."),
+}
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.total = 0.0
+        self.count = 0
+
+
+# Per-request dict that stage timers also add their durations to (see collect_stages).
+_STAGE_SINK: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "omnidisp_stage_sink", default=None
+)
+
+
+class _StageTimer:
+    __slots__ = ("registry", "labels", "started")
+
+    def __init__(self, registry: "MetricsRegistry", labels: LabelSet) -> None:
+        self.registry = registry
+        self.labels = labels
+
+    def __enter__(self) -> "_StageTimer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        elapsed = time.perf_counter() - self.started
+        if self.registry.enabled:
+            self.registry._observe(STAGE_SECONDS, self.labels, elapsed)
+        sink = _STAGE_SINK.get()
+        if sink is not None:
+            stage = self.labels[0][1]
+            sink[stage] = sink.get(stage, 0.0) + elapsed
+
+
+_NULL_TIMER = nullcontext()
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters, gauges and histograms."""
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+        self._gauges: Dict[Tuple[str, LabelSet], float] = {}
+        self._histograms: Dict[Tuple[str, LabelSet], _Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def stage_timer(self, stage: str):  # noqa: ANN201
+        """Context manager adding the elapsed time to ``omnidisp_stage_seconds``."""
+
+        if not self.enabled and _STAGE_SINK.get() is None:
+            return _NULL_TIMER
+        return _StageTimer(self, (("stage", stage),))
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if self.enabled:
+            self._observe(name, _label_set(labels), value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, _label_set(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, _label_set(labels))] = value
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Register a callback producing gauge samples at scrape time."""
+
+        with self._lock:
+            self._collectors.append(collector)
+
+    def value(self, name: str, **labels: str) -> float:
+        """Current counter or gauge value (0 if never recorded)."""
+
+        key = (name, _label_set(labels))
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            return self._gauges.get(key, 0.0)
+
+    def histogram_count(self, name: str, **labels: str) -> int:
+        with self._lock:
+            histogram = self._histograms.get((name, _label_set(labels)))
+            return histogram.count if histogram else 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {
+                key: (list(h.counts), h.total, h.count) for key, h in self._histograms.items()
+            }
+            collectors = list(self._collectors)
+        for collector in collectors:
+            for name, labels, value in collector():
+                gauges[(name, labels)] = value
+
+        families: Dict[str, List[str]] = {}
+        for (name, labels), value in counters.items():
+            families.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_num(float(value))}")
+        for (name, labels), value in gauges.items():
+            families.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_num(float(value))}")
+        for (name, labels), (counts, total, count) in histograms.items():
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (("le", _num(float(bound))),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_num(float(total))}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        output: List[str] = []
+        for name in sorted(families):
+            kind, help_text = _DESCRIPTIONS.get(
+                name, ("gauge" if any(name == key[0] for key in gauges) else "counter", name)
+            )
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(sorted(families[name]))
+        return "\n".join(output) + "\n"
+
+    def _observe(self, name: str, labels: LabelSet, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = _Histogram(len(self.buckets))
+                self._histograms[(name, labels)] = histogram
+            if index < len(self.buckets):
+                histogram.counts[index] += 1
+            histogram.total += value
+            histogram.count += 1
+
+
+def _label_set(labels: Dict[str, str]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _num(value: float) -> str:
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+_registry = MetricsRegistry(enabled=METRICS_ENABLED)
+
+
+def get_metrics() -> MetricsRegistry:
+    """Process-wide registry."""
+
+    return _registry
+
+
+def stage_timer(stage: str):  # noqa: ANN201
+    return _registry.stage_timer(stage)
+
+
+@contextmanager
+def collect_stages(stages: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """Seconds spent in each stage inside the block, summed per stage name.
+
+    Pass ``stages`` to keep adding to the totals of an earlier block.
+    """
+
+    if stages is None:
+        stages = {}
+    token = _STAGE_SINK.set(stages)
+    try:
+        yield stages
+    finally:
+        _STAGE_SINK.reset(token)
+
+
+def inc(name: str, amount: float = 1.0, **labels: str) -> None:
+    _registry.inc(name, amount, **labels)
+
+
+def render() -> str:
+    return _registry.render()
@@ -0,0 +1,148 @@
+"""Process setup for prefork servers (gunicorn with ``preload_app``).
+
+The master process imports the application, builds the knowledge snapshot
+with all its indexes and runs a probe message through the deterministic
+dispatcher before it forks the workers (:func:`warm_up`).
+:func:`freeze_shared_memory` then moves every object allocated so far into
+the garbage collector's permanent generation. Workers never write to the GC
+headers of those objects, so the pages stay shared copy-on-write instead of
+being copied into each worker by its first full collection.
+
+Knowledge changes reach the workers through the master: on ``SIGHUP``
+gunicorn calls :func:`reload_shared_knowledge` and then replaces the workers
+gracefully. Workers recycled after ``max_requests`` also start from the
+master's snapshot, so per-worker hot reload (``KNOWLEDGE_RELOAD_INTERVAL``)
+should stay off under a prefork server.
+
+``gunicorn.conf.py`` at the repository root wires these functions to the
+server hooks; the ``/ready`` route reports :func:`readiness`. It also calls
+:func:`configure_server` with the worker count, so limits meant for the
+whole server (the Telegram send rate) can be split between workers, and
+:func:`mark_worker` after each fork, so ``/admin/knowledge/reload`` in a
+worker asks the master to reload (:func:`request_master_reload`) instead of
+reloading only itself.
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+import signal
+from typing import Dict, Optional
+
+from omnidisp.app.dispatcher.disp_logic import analyze_message
+from omnidisp.app.knowledge.loader import get_snapshot, reload_knowledge
+from omnidisp.app.llm.llm_client import backend_pool_error
+
+PROBE_TEXT = "Здравствуйте, холодильник не морозит, сколько стоит ремонт?"
+
+_probe_passed = False
+_server_workers = 1
+_master_pid: Optional[int] = None
+
+
+def configure_server(workers: int) -> None:
+    """Remember how many worker processes the server runs."""
+
+    global _server_workers
+    _server_workers = max(int(workers), 1)
+
+
+def server_workers() -> int:
+    """Worker processes sharing this host's limits (1 outside a prefork server)."""
+
+    return _server_workers
+
+
+def mark_worker(master_pid: int) -> None:
+    """Called in a freshly forked worker with the pid of its master."""
+
+    global _master_pid
+    _master_pid = master_pid
+
+
+def master_pid() -> Optional[int]:
+    """Pid of the prefork master, or ``None`` when this is not a worker."""
+
+    return _master_pid
+
+
+def request_master_reload() -> bool:
+    """Ask the master to reload knowledge and replace all workers.
+
+    Returns ``False`` outside a prefork worker: the caller reloads itself.
+    """
+
+    if _master_pid is None:
+        return False
+    os.kill(_master_pid, signal.SIGHUP)
+    return True
+
+
+def run_probe() -> bool:
+    """Analyse :data:`PROBE_TEXT`; ``False`` if the dispatcher fails on it."""
+
+    global _probe_passed
+    try:
+        analyze_message(PROBE_TEXT, is_first_message=True)
+    except Exception as exc:  # noqa: BLE001
+        print(f"Readiness probe error: {exc}")
+        return False
+    _probe_passed = True
+    return True
+
+
+def readiness() -> Dict[str, object]:
+    """Can this process serve requests: knowledge, dispatcher probe, ``LLM_BACKENDS``.
+
+    The probe runs once per process; afterwards only the knowledge is
+    checked, so the call is cheap enough for a load balancer to poll.
+    """
+
+    snapshot = get_snapshot()
+    backends_error = backend_pool_error()
+    checks = {
+        "knowledge": bool(snapshot.data),
+        "dispatcher": _probe_passed or run_probe(),
+        "llm_backends": backends_error is None,
+    }
+    status: Dict[str, object] = {
+        "ready": all(checks.values()),
+        "checks": checks,
+        "knowledge_version": snapshot.version,
+        "categories": len(snapshot.data),
+        "pid": os.getpid(),
+    }
+    if backends_error is not None:
+        status["error"] = backends_error
+    return status
+
+
+def warm_up() -> Dict[str, object]:
+    """Build everything workers should share and return :func:`readiness`."""
+
+    get_snapshot()
+    run_probe()
+    return readiness()
+
+
+def freeze_shared_memory() -> int:
+    """Collect garbage and freeze the survivors; returns the frozen object count.
+
+    Objects frozen by a previous call are collected again first, so a
+    knowledge snapshot replaced since then does not stay in memory.
+    """
+
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def reload_shared_knowledge() -> Dict[str, object]:
+    """Rebuild the knowledge in the master before workers are replaced."""
+
+    reload_knowledge(force=True)
+    status = warm_up()
+    freeze_shared_memory()
+    return status
@@ -0,0 +1,401 @@
+"""Structured log of processed messages, one JSON line per dispatch.
+
+The dispatcher opens a record with :func:`request_record` (or, when the
+answer outlives one block, :func:`start_record`) and adds fields with
+:func:`note` as it goes (decisions, cache outcome, model status); stage
+durations come from :func:`metrics.collect_stages`. When the record
+closes it is handed to :class:`RequestLog`, which only puts it into a
+bounded queue: a background thread serializes and writes the lines. When
+the queue is full the record is dropped and counted
+(``omnidisp_request_log_total{result="dropped"}``), so a slow disk never
+adds latency to a request.
+
+Every process writes its own file, ``requests-<pid>.jsonl``, so prefork
+workers never rotate each other's files. The file is rotated to
+``requests-<pid>.<YYYYmmdd-HHMMSS>.jsonl`` when it would exceed
+``max_bytes`` or is older than ``rotate_interval`` seconds, and each process
+keeps its newest ``backup_count`` rotated files. Files of processes that no
+longer run (workers recycled by gunicorn) are rotated and pruned whenever a
+process opens a new file: of those, too, only the newest ``backup_count``
+are kept. The writer is a daemon thread, so the module
+registers :meth:`RequestLog.close` with :mod:`atexit` to write what is still
+queued when a worker exits.
+
+Records carry ``text`` and ``is_first_message``, so a log file can be fed
+straight to ``python -m omnidisp.bench.replay``.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from omnidisp.app.utils import metrics
+from omnidisp.config.settings import (
+    REQUEST_LOG_BACKUP_COUNT,
+    REQUEST_LOG_DIR,
+    REQUEST_LOG_ENABLED,
+    REQUEST_LOG_INCLUDE_TEXT,
+    REQUEST_LOG_MAX_BYTES,
+    REQUEST_LOG_QUEUE_SIZE,
+    REQUEST_LOG_ROTATE_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+Record = Dict[str, object]
+
+# Records written per batch before the file is flushed.
+_WRITE_BATCH = 256
+
+
+class RequestLog:
+    """Queue in front of a rotating JSONL file written by a daemon thread."""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = 50 * 1024 * 1024,
+        rotate_interval: float = 24 * 3600,
+        backup_count: int = 20,
+        queue_size: int = 10000,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.queue_size = queue_size
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Record]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self._file = None
+        self._path: Optional[Path] = None
+        self._opened_at = 0.0
+        self._size = 0
+
+    @property
+    def path(self) -> Path:
+        """File the current process appends to."""
+
+        return self.directory / f"requests-{os.getpid()}.jsonl"
+
+    def emit(self, record: Record) -> bool:
+        """Queue ``record`` for writing; ``False`` if it was dropped."""
+
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            metrics.inc("omnidisp_request_log_total", result="dropped")
+            return False
+        return True
+
+    def flush(self) -> None:
+        """Block until everything queued so far is written."""
+
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write what is queued (up to ``timeout`` seconds) and stop the writer."""
+
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "queued": self._queue.qsize(),
+            }
+
+    # writer ---------------------------------------------------------------
+
+    def _ensure_writer(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked: the parent's thread, queue and file are not ours
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._thread = None
+                self._file = None
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="request-log", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < _WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            try:
+                for record in batch:
+                    if record is None:
+                        stop = True
+                        continue
+                    self._write(json.dumps(record, ensure_ascii=False) + "\n")
+                if self._file is not None:
+                    self._file.flush()
+            except (OSError, TypeError, ValueError) as exc:
+                logger.warning("Request log write error: %s", exc)
+            finally:
+                for _record in batch:
+                    self._queue.task_done()
+            if stop:
+                self._close_file()
+                return
+
+    def _write(self, line: str) -> None:
+        data = line.encode("utf-8")
+        now = time.time()
+        if self._file is not None and self._size > 0 and (
+            self._size + len(data) > self.max_bytes
+            or now - self._opened_at >= self.rotate_interval
+        ):
+            self._rotate(now)
+        if self._file is None:
+            self._open(now)
+        self._file.write(data)  # type: ignore[union-attr]
+        self._size += len(data)
+        with self._lock:
+            self.written += 1
+        metrics.inc("omnidisp_request_log_total", result="written")
+
+    def _open(self, now: float) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._prune_dead()
+        self._path = self.path
+        self._file = open(self._path, "ab")  # noqa: SIM115
+        self._size = self._file.tell()
+        self._opened_at = now
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self, now: float) -> None:
+        self._close_file()
+        path = self._path
+        if path is None or not path.exists():
+            return
+        _rotate_file(path, now)
+        self._keep_newest(list(self.directory.glob(f"{path.stem}.*.jsonl")))
+
+    def _prune_dead(self) -> None:
+        """Rotate live files of exited processes and trim their rotated files."""
+
+        dead: List[Path] = []
+        for path in self.directory.glob("requests-*.jsonl"):
+            pid = _file_pid(path)
+            if pid is None or pid == os.getpid() or _pid_alive(pid):
+                continue
+            if path.name.count(".") == 1:
+                try:
+                    path = _rotate_file(path, path.stat().st_mtime)
+                except OSError:
+                    continue
+            dead.append(path)
+        self._keep_newest(dead)
+
+    def _keep_newest(self, paths: List[Path]) -> None:
+        def mtime(path: Path) -> float:
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                return 0.0
+
+        paths.sort(key=mtime)
+        for old in paths[: max(len(paths) - self.backup_count, 0)]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+def _rotate_file(path: Path, when: float) -> Path:
+    """Rename a live file to ``<stem>.<YYYYmmdd-HHMMSS>.jsonl``; returns the new path."""
+
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(when))
+    target = path.with_name(f"{path.stem}.{stamp}.jsonl")
+    number = 1
+    while target.exists():
+        target = path.with_name(f"{path.stem}.{stamp}-{number}.jsonl")
+        number += 1
+    os.replace(path, target)
+    return target
+
+
+def _file_pid(path: Path) -> Optional[int]:
+    """Pid in ``requests-<pid>.jsonl`` or ``requests-<pid>.<stamp>.jsonl``."""
+
+    head = path.name.split(".", 1)[0]
+    try:
+        return int(head[len("requests-") :])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # a live process of another user
+    return True
+
+
+_request_log: Optional[RequestLog] = (
+    RequestLog(
+        Path(REQUEST_LOG_DIR),
+        max_bytes=REQUEST_LOG_MAX_BYTES,
+        rotate_interval=REQUEST_LOG_ROTATE_INTERVAL,
+        backup_count=REQUEST_LOG_BACKUP_COUNT,
+        queue_size=REQUEST_LOG_QUEUE_SIZE,
+    )
+    if REQUEST_LOG_ENABLED
+    else None
+)
+if _request_log is not None:
+    atexit.register(_request_log.close)
+
+
+def get_request_log() -> Optional[RequestLog]:
+    """Process-wide request log, or ``None`` when it is disabled."""
+
+    return _request_log
+
+
+_CURRENT: ContextVar[Optional[Record]] = ContextVar("omnidisp_request_record", default=None)
+
+
+class PendingRecord:
+    """Record of one dispatch that is still being collected.
+
+    Work done inside :meth:`active` adds its notes and stage times to the
+    record; :meth:`emit` hands it to the log. Entry points whose answer
+    outlives a single block (the streamed answer, a batch answered out of
+    order) keep the record pending until the answer is done. A part
+    (:meth:`part`) collects notes of work shared by several records, e.g.
+    one model call answering repeated texts of a batch, and is merged into
+    each of them with :meth:`merge`. Without a log every method is a no-op.
+    """
+
+    def __init__(self, log: Optional[RequestLog], fields: Record) -> None:
+        self.log = log
+        self.fields = fields
+        self.stages: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def active(self) -> Iterator[Record]:
+        """Make this the current record inside the block."""
+
+        if self.log is None:
+            yield self.fields
+            return
+        token = _CURRENT.set(self.fields)
+        try:
+            with metrics.collect_stages(self.stages):
+                yield self.fields
+        except BaseException as exc:
+            self.fields["error"] = type(exc).__name__
+            raise
+        finally:
+            _CURRENT.reset(token)
+
+    def part(self) -> "PendingRecord":
+        """Empty record for shared work, to be merged into the ones it served."""
+
+        return PendingRecord(self.log, {})
+
+    def merge(self, other: "PendingRecord") -> None:
+        """Add the notes and stage times of ``other`` to this record."""
+
+        if self.log is None:
+            return
+        self.fields.update(other.fields)
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def emit(self) -> None:
+        if self.log is None:
+            return
+        self.fields["total_ms"] = round((time.perf_counter() - self.started) * 1000, 3)
+        self.fields["stages_ms"] = {
+            name: round(value * 1000, 3) for name, value in self.stages.items()
+        }
+        self.log.emit(self.fields)
+
+
+def start_record(entry: str, text: str, is_first_message: bool) -> PendingRecord:
+    """Open the record of one dispatch; it is written by :meth:`PendingRecord.emit`."""
+
+    log = get_request_log()
+    if log is None:
+        return PendingRecord(None, {})
+    return PendingRecord(
+        log,
+        {
+            "ts": round(time.time(), 3),
+            "entry": entry,
+            "text": text if REQUEST_LOG_INCLUDE_TEXT else None,
+            "is_first_message": is_first_message,
+        },
+    )
+
+
+@contextmanager
+def request_record(entry: str, text: str, is_first_message: bool) -> Iterator[Optional[Record]]:
+    """Collect one dispatch record; it is emitted when the block exits.
+
+    Yields ``None`` (and costs almost nothing) when the log is disabled.
+    """
+
+    record = start_record(entry, text, is_first_message)
+    if record.log is None:
+        yield None
+        return
+    try:
+        with record.active() as fields:
+            yield fields
+    finally:
+        record.emit()
+
+
+def note(**fields: object) -> None:
+    """Add fields to the record of the current dispatch, if one is open."""
+
+    record = _CURRENT.get()
+    if record is not None:
+        record.update(fields)
@@ -0,0 +1,88 @@
+"""Generated corpus of customer messages for benchmarks.
+
+Messages are assembled from phrasing typical for the repair dispatcher
+(greetings, symptoms, price and visit-time questions, several tasks in one
+message, out-of-scope requests) around keywords and stop phrases of the
+knowledge base under test, so the category and stop-factor stages do real
+work. The same ``seed`` always yields the same corpus.
+"""
+
+from __future__ import annotations
+
+import random
+from typing import List, Mapping, Sequence, Tuple
+
+CorpusItem = Tuple[str, bool]
+
+_PROBLEMS = [
+    "у меня {kw}",
+    "{kw}, что делать",
+    "сломался {kw}",
+    "со вчерашнего дня {kw}",
+    "подскажите, {kw} — это ремонтируется",
+    "нужен мастер, {kw}",
+]
+_TAILS = [
+    "",
+    ", срочно",
+    ". Можно сегодня?",
+    ", модель старая, лет пять",
+    ". Дома есть маленький ребёнок",
+]
+_GREETINGS = ["Здравствуйте", "Добрый день", "Привет", "Доброе утро", "Добрый вечер"]
+_PRICE_QUESTIONS = ["сколько стоит ремонт", "какая цена", "стоимость работы подскажите"]
+_ADDRESSES = ["адрес Ленина, 5", "адрес ул. Мира 12, кв 40", "куда подъехать — скину в личку"]
+_VISIT_TIMES = ["когда сможете приехать", "сегодня сможете", "завтра сможете после обеда"]
+_NOISE = [
+    "спасибо",
+    "жду ответа",
+    "буду дома после шести",
+    "домофон не работает, позвоните",
+]
+
+
+def generate_corpus(
+    data: Mapping[str, Mapping[str, object]], count: int, seed: int = 0
+) -> List[CorpusItem]:
+    """``count`` pairs ``(text, is_first_message)`` built around ``data``.
+
+    ``data`` is a mapping of category code to ``CategoryData`` (for example
+    ``snapshot.data``).
+    """
+
+    rng = random.Random(seed)
+    keywords: List[str] = []
+    stop_phrases: List[str] = []
+    for category in data.values():
+        keywords.extend(category.get("keywords") or [])  # type: ignore[arg-type]
+        stop_phrases.extend(category.get("stop_phrases") or [])  # type: ignore[arg-type]
+    if not keywords:
+        keywords = ["холодильник не морозит", "течёт кран", "не включается телевизор"]
+
+    messages: List[CorpusItem] = []
+    for _ in range(count):
+        parts = [_problem(rng, keywords)]
+        roll = rng.random()
+        if roll < 0.15:
+            parts.append(rng.choice(_PRICE_QUESTIONS))
+        elif roll < 0.25:
+            parts.append(rng.choice(_ADDRESSES))
+        elif roll < 0.35:
+            parts.append(rng.choice(_VISIT_TIMES))
+        elif roll < 0.5:
+            parts.append(_problem(rng, keywords))
+        elif roll < 0.6 and stop_phrases:
+            parts.append(rng.choice(stop_phrases).lower())
+        if rng.random() < 0.1:
+            parts.append(rng.choice(_NOISE))
+
+        is_first = rng.random() < 0.3
+        text = ", ".join(parts) + rng.choice(_TAILS)
+        if is_first:
+            text = f"{rng.choice(_GREETINGS)}! {text}"
+        messages.append((text[0].upper() + text[1:], is_first))
+    return messages
+
+
+def _problem(rng: random.Random, keywords: Sequence[str]) -> str:
+    return rng.choice(_PROBLEMS).format(kw=rng.choice(keywords))
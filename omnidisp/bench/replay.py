@@ -0,0 +1,368 @@
+"""Replay recorded messages through the dispatcher and report latency and decisions.
+
+Usage::
+
+    python -m omnidisp.bench.replay MESSAGES.jsonl [--text-field text]
+        [--target local|http://HOST:PORT] [--concurrency 8] [--qps 50]
+        [--limit N] [--fake-llm] [--llm-latency-ms 300] [--llm-jitter-ms 100]
+        [--llm-error-rate 0.02] [--llm-error-status 429] [--llm-rate-limit 0]
+        [--save-golden FILE] [--golden FILE] [--fail-on-diff]
+
+Every line of the input is a JSON object; the message is taken from
+``--text-field`` (``text`` by default, ``body`` replays ``requests.jsonl``)
+and ``is_first_message`` is used when present. Lines without a message are
+skipped.
+
+``--target local`` calls :func:`handle_message` in this process from
+``--concurrency`` threads; a URL posts to its ``/api/disp``. With ``--qps``
+requests are sent on a fixed schedule (open loop) and latency is measured
+from the scheduled send time, so queueing in an overloaded server is part of
+the numbers; without it every thread sends its next message as soon as the
+previous answer arrives.
+
+``--fake-llm`` starts :class:`FakeLLMServer` and points the local model
+client at it; for an HTTP target it only prints the URL to put into the
+server's ``LLM_BACKENDS``.
+
+Besides p50/p95/p99 latency, throughput and error rates the tool collects
+the dispatcher decisions of every message (step, category, plan type,
+tasks). ``--save-golden`` stores them; ``--golden`` prints the messages
+whose decisions changed since.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:  # noqa: SIM105
+    import requests
+except ModuleNotFoundError:  # pragma: no cover - fallback when dependency missing
+    requests = None  # type: ignore[assignment]
+
+from omnidisp.app.dispatcher.disp_logic import FALLBACK_MESSAGE
+from omnidisp.app.dispatcher.dispatcher_controller import handle_message
+from omnidisp.app.llm import llm_client
+from omnidisp.app.llm.fake_server import FakeLLMServer
+
+DECISION_FIELDS = (
+    "step",
+    "main_category",
+    "plan_type",
+    "tasks_count",
+    "forbidden_tasks",
+    "allowed_tasks",
+)
+
+Decision = Dict[str, object]
+Sender = Callable[["ReplayRecord"], Dict[str, object]]
+
+
+class ReplayRecord(NamedTuple):
+    index: int
+    text: str
+    is_first_message: bool
+
+
+class Outcome(NamedTuple):
+    index: int
+    latency: float
+    status: str
+    decision: Optional[Decision]
+
+
+def read_records(
+    path: Path, text_field: str = "text", limit: Optional[int] = None
+) -> Iterator[ReplayRecord]:
+    """Messages of a JSONL file; ``index`` is the line number, starting at 1."""
+
+    count = 0
+    with path.open(encoding="utf-8") as lines:
+        for number, line in enumerate(lines, start=1):
+            if limit is not None and count >= limit:
+                return
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            text = data.get(text_field) if isinstance(data, dict) else None
+            if not isinstance(text, str) or not text.strip():
+                continue
+            count += 1
+            yield ReplayRecord(number, text, bool(data.get("is_first_message", False)))
+
+
+def local_sender(deadline: Optional[float] = None) -> Sender:
+    def send(record: ReplayRecord) -> Dict[str, object]:
+        return handle_message(
+            record.text,
+            is_first_message=record.is_first_message,
+            trace="structured",
+            deadline=deadline,
+        )
+
+    return send
+
+
+class HTTPStatusError(RuntimeError):
+    def __init__(self, status: int) -> None:
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def http_sender(base_url: str, timeout: float = 30.0) -> Sender:
+    if requests is None:
+        raise RuntimeError("requests is not installed")
+    session = requests.Session()
+    url = base_url.rstrip("/") + "/api/disp"
+
+    def send(record: ReplayRecord) -> Dict[str, object]:
+        response = session.post(
+            url,
+            json={
+                "text": record.text,
+                "is_first_message": record.is_first_message,
+                "trace": "structured",
+            },
+            timeout=timeout,
+        )
+        if response.status_code != 200:
+            raise HTTPStatusError(response.status_code)
+        return response.json()
+
+    return send
+
+
+def replay(
+    records: Iterable[ReplayRecord],
+    send: Sender,
+    concurrency: int = 8,
+    qps: Optional[float] = None,
+) -> Tuple[List[Outcome], float]:
+    """Send every record; returns the outcomes (in completion order) and wall time."""
+
+    source = iter(records)
+    source_lock = threading.Lock()
+    outcomes: List[Outcome] = []
+    outcomes_lock = threading.Lock()
+    sequence = itertools.count()
+    started = time.perf_counter()
+
+    def next_record() -> Optional[Tuple[ReplayRecord, Optional[float]]]:
+        with source_lock:
+            record = next(source, None)
+            if record is None:
+                return None
+            return record, (started + next(sequence) / qps) if qps else None
+
+    def worker() -> None:
+        while True:
+            item = next_record()
+            if item is None:
+                return
+            record, scheduled = item
+            if scheduled is None:
+                sent = time.perf_counter()
+            else:
+                time.sleep(max(scheduled - time.perf_counter(), 0.0))
+                sent = scheduled
+            outcome = _send_one(record, send, sent)
+            with outcomes_lock:
+                outcomes.append(outcome)
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        for future in [pool.submit(worker) for _ in range(max(concurrency, 1))]:
+            future.result()
+    return outcomes, time.perf_counter() - started
+
+
+def _send_one(record: ReplayRecord, send: Sender, sent: float) -> Outcome:
+    try:
+        result = send(record)
+    except HTTPStatusError as exc:
+        return Outcome(record.index, time.perf_counter() - sent, f"http_{exc.status}", None)
+    except Exception as exc:  # noqa: BLE001
+        return Outcome(record.index, time.perf_counter() - sent, type(exc).__name__, None)
+    latency = time.perf_counter() - sent
+    status = "degraded" if result.get("client_answer") == FALLBACK_MESSAGE else "ok"
+    return Outcome(record.index, latency, status, decision_of(result))
+
+
+def decision_of(result: Dict[str, object]) -> Optional[Decision]:
+    trace = result.get("internal_trace")
+    if not isinstance(trace, dict):
+        return None
+    return {field: trace.get(field) for field in DECISION_FIELDS}
+
+
+def percentile(sorted_values: List[float], share: float) -> float:
+    """Nearest-rank percentile of already sorted values (0 for an empty list)."""
+
+    if not sorted_values:
+        return 0.0
+    rank = min(max(math.ceil(share * len(sorted_values)), 1), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+class Summary(NamedTuple):
+    requests: int
+    elapsed: float
+    throughput: float
+    latency_ms: Dict[str, float]
+    statuses: Dict[str, int]
+    error_rate: float
+
+
+def summarize(outcomes: List[Outcome], elapsed: float) -> Summary:
+    """Percentiles (p50, p95, p99, max), requests per second and statuses."""
+
+    latencies = sorted(outcome.latency for outcome in outcomes)
+    statuses: Dict[str, int] = {}
+    for outcome in outcomes:
+        statuses[outcome.status] = statuses.get(outcome.status, 0) + 1
+    total = len(outcomes)
+    return Summary(
+        requests=total,
+        elapsed=elapsed,
+        throughput=total / elapsed if elapsed > 0 else 0.0,
+        latency_ms={
+            name: percentile(latencies, share) * 1000
+            for name, share in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+        },
+        statuses=dict(sorted(statuses.items())),
+        error_rate=(total - statuses.get("ok", 0)) / total if total else 0.0,
+    )
+
+
+def format_report(summary: Summary) -> str:
+    latency = "  ".join(f"{name} {value:.1f}ms" for name, value in summary.latency_ms.items())
+    lines = [
+        f"requests    {summary.requests} in {summary.elapsed:.2f} s"
+        f" ({summary.throughput:.1f} req/s)",
+        f"latency     {latency}",
+        f"not ok      {summary.error_rate:.2%}",
+    ]
+    for status, count in summary.statuses.items():
+        lines.append(f"  {status:<10} {count}")
+    return "\n".join(lines)
+
+
+def decisions_by_index(outcomes: Iterable[Outcome]) -> Dict[int, Decision]:
+    return {
+        outcome.index: outcome.decision for outcome in outcomes if outcome.decision is not None
+    }
+
+
+def diff_decisions(
+    current: Dict[int, Decision], golden: Dict[int, Decision]
+) -> List[Tuple[int, str, object, object]]:
+    """Rows ``(line, field, golden value, current value)`` for changed decisions.
+
+    Messages missing from either run (errors, ``--limit``) are not compared.
+    """
+
+    rows = []
+    for index in sorted(current.keys() & golden.keys()):
+        before, after = golden[index], current[index]
+        for field in DECISION_FIELDS:
+            if before.get(field) != after.get(field):
+                rows.append((index, field, before.get(field), after.get(field)))
+    return rows
+
+
+def save_golden(path: Path, decisions: Dict[int, Decision]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as output:
+        for index in sorted(decisions):
+            output.write(json.dumps({"line": index, **decisions[index]}, ensure_ascii=False))
+            output.write("\n")
+
+
+def load_golden(path: Path) -> Dict[int, Decision]:
+    decisions: Dict[int, Decision] = {}
+    with path.open(encoding="utf-8") as lines:
+        for line in lines:
+            data = json.loads(line)
+            decisions[int(data.pop("line"))] = data
+    return decisions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("messages", type=Path, help="JSONL file with recorded messages")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--target", default="local", help="'local' or a base URL")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--qps", type=float, default=None, help="send on a fixed schedule")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--deadline", type=float, default=None, help="local request budget, s")
+    parser.add_argument("--fake-llm", action="store_true", help="answer from a local fake model")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-status", type=int, default=500)
+    parser.add_argument("--llm-rate-limit", type=int, default=0, help="fake requests per minute")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-golden", type=Path, help="write the decisions to this file")
+    parser.add_argument("--golden", type=Path, help="compare the decisions with this file")
+    parser.add_argument("--fail-on-diff", action="store_true")
+    args = parser.parse_args(argv)
+
+    fake: Optional[FakeLLMServer] = None
+    if args.fake_llm:
+        fake = FakeLLMServer(
+            latency_ms=args.llm_latency_ms,
+            jitter_ms=args.llm_jitter_ms,
+            error_rate=args.llm_error_rate,
+            error_status=args.llm_error_status,
+            rate_limit=args.llm_rate_limit,
+            seed=args.seed,
+        ).start()
+        backends = json.dumps([{"name": "fake", "url": fake.url, "api_key": "replay"}])
+        if args.target == "local":
+            # get_backend_pool() rebuilds the pool when this setting changes
+            llm_client.LLM_BACKENDS = backends
+        else:
+            print(f"fake LLM at {fake.url}; start the server with LLM_BACKENDS='{backends}'")
+
+    if args.target == "local":
+        send = local_sender(args.deadline)
+    else:
+        send = http_sender(args.target)
+
+    try:
+        records = read_records(args.messages, args.text_field, args.limit)
+        outcomes, elapsed = replay(records, send, args.concurrency, args.qps)
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    print(format_report(summarize(outcomes, elapsed)))
+    if fake is not None:
+        print(f"fake LLM    {fake.request_count} answered, {fake.rate_limited_count} rate limited")
+
+    decisions = decisions_by_index(outcomes)
+    if args.save_golden:
+        save_golden(args.save_golden, decisions)
+        print(f"golden decisions saved to {args.save_golden}")
+
+    if args.golden:
+        rows = diff_decisions(decisions, load_golden(args.golden))
+        print(f"\ncompared with {args.golden}: {len(rows)} changed decision(s)")
+        for index, field, before, after in rows:
+            print(f"  line {index:<6} {field:<16} {before!r} -> {after!r}")
+        if rows and args.fail_on_diff:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Run the dispatcher benchmarks and compare them with a saved baseline.
+
+Usage::
+
+    python -m omnidisp.bench.run [--sizes 10,100,1000,10000] [--messages 1000]
+        [--repeat 5] [--save-baseline FILE] [--baseline FILE]
+        [--threshold 0.15] [--fail-on-regression]
+
+``real`` is the bundled knowledge base; every size N adds a synthetic base
+of 16 categories with N keywords each. Baselines are JSON files and are
+only comparable on the same machine and Python version.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from omnidisp.app.knowledge.loader import DEFAULT_CATEGORIES_DIR
+from omnidisp.bench.stages import StageResult, run_suite, stage_names
+from omnidisp.bench.synthetic_kb import write_synthetic_knowledge
+
+Suite = Dict[str, Dict[str, StageResult]]
+
+
+def compare(
+    current: Suite, baseline: Suite, threshold: float
+) -> List[Tuple[str, str, float, float, float, bool]]:
+    """Rows ``(kb, stage, baseline µs, current µs, change, regressed)``."""
+
+    rows = []
+    for kb, results in current.items():
+        for stage, result in results.items():
+            previous = baseline.get(kb, {}).get(stage)
+            if previous is None:
+                continue
+            before, after = previous["us_per_op"], result["us_per_op"]
+            change = (after - before) / before if before else 0.0
+            rows.append((kb, stage, before, after, change, change > threshold))
+    return rows
+
+
+def format_table(suite: Suite) -> str:
+    stages = stage_names(suite)
+    header = ["kb".ljust(10)] + [stage.rjust(13) for stage in stages]
+    lines = ["".join(header), "-" * len("".join(header))]
+    for kb, results in suite.items():
+        cells = [kb.ljust(10)]
+        for stage in stages:
+            result = results.get(stage)
+            cells.append(f"{result['us_per_op']:11.1f}µs" if result else " " * 13)
+        lines.append("".join(cells))
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[Tuple[str, str, float, float, float, bool]]) -> str:
+    lines = []
+    for kb, stage, before, after, change, regressed in rows:
+        mark = "  REGRESSION" if regressed else ""
+        lines.append(
+            f"{kb:<10} {stage:<13} {before:11.1f}µs -> {after:11.1f}µs  {change:+7.1%}{mark}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--no-real", action="store_true", help="skip the bundled knowledge base")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, help="compare with this baseline file")
+    parser.add_argument("--save-baseline", type=Path, help="write the results to this file")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown share")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    with tempfile.TemporaryDirectory(prefix="omnidisp-bench-") as workdir:
+        knowledge_dirs: Dict[str, Path] = {}
+        if not args.no_real:
+            # a copy, so the bundled base is not served from its artifact
+            real_dir = Path(workdir) / "real"
+            real_dir.mkdir()
+            for path in DEFAULT_CATEGORIES_DIR.glob("*.json"):
+                shutil.copy(path, real_dir / path.name)
+            knowledge_dirs["real"] = real_dir
+        for size in sizes:
+            knowledge_dirs[f"kw{size}"] = write_synthetic_knowledge(
+                Path(workdir) / f"kw{size}", size, seed=args.seed
+            )
+        started = time.perf_counter()
+        suite = run_suite(
+            knowledge_dirs, messages=args.messages, repeat=args.repeat, seed=args.seed
+        )
+        elapsed = time.perf_counter() - started
+
+    print(format_table(suite))
+    print(f"\n{args.messages} messages x {args.repeat} runs, {elapsed:.1f} s total")
+
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "meta": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "messages": args.messages,
+                "seed": args.seed,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": suite,
+        }
+        args.save_baseline.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        rows = compare(suite, baseline["results"], args.threshold)
+        print(f"\ncompared with {args.baseline} ({baseline['meta'].get('created', '?')}):")
+        print(format_comparison(rows))
+        regressions = sum(1 for row in rows if row[-1])
+        if regressions:
+            print(f"{regressions} stage(s) slower than +{args.threshold:.0%}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Microbenchmarks of the deterministic dispatch stages.
+
+Each stage is timed on its own over the whole corpus, with the inputs of
+earlier stages prepared in advance, so a number moves only when that
+stage changes. ``pipeline`` is ``process()`` end to end with the model
+call replaced by a fixed answer.
+"""
+
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from omnidisp.app.dispatcher import disp_logic
+from omnidisp.app.dispatcher.message import Message
+from omnidisp.app.knowledge.loader import KnowledgeSnapshot, build_snapshot, pinned_snapshot
+from omnidisp.bench.corpus import CorpusItem, generate_corpus
+
+STAGES = (
+    "split_tasks",
+    "stop_factors",
+    "categories",
+    "dialog_step",
+    "trace",
+    "prompt_build",
+    "pipeline",
+)
+STUB_ANSWER = "Понял вас. Подскажите, пожалуйста, модель и как давно появилась проблема?"
+
+StageResult = Dict[str, float]
+
+
+def time_per_call(fn: Callable[[], None], calls: int, repeat: int) -> float:
+    """Best of ``repeat`` runs of ``fn`` (which makes ``calls`` calls), in µs per call."""
+
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        fn()
+        best = min(best, time.perf_counter_ns() - started)
+    return best / 1000 / max(calls, 1)
+
+
+def bench_stages(
+    snapshot: KnowledgeSnapshot,
+    corpus: Sequence[CorpusItem],
+    repeat: int = 5,
+    stages: Sequence[str] = STAGES,
+) -> Dict[str, StageResult]:
+    """µs per message and messages per second of every stage on ``snapshot``."""
+
+    results: Dict[str, StageResult] = {}
+    with pinned_snapshot(snapshot):
+        texts = [text for text, _first in corpus]
+        analyses = [
+            disp_logic.analyze_message(text=text, is_first_message=first)
+            for text, first in corpus
+        ]
+
+        def split_tasks() -> None:
+            for text in texts:
+                Message.parse(text)
+
+        def stop_factors() -> None:
+            for analysis in analyses:
+                disp_logic.check_stop_factors(analysis.message)
+
+        def categories() -> None:
+            for analysis in analyses:
+                disp_logic.detect_categories(analysis.message)
+
+        def dialog_step() -> None:
+            for analysis in analyses:
+                disp_logic.detect_dialog_step(
+                    text=analysis.message,
+                    is_first_message=analysis.is_first_message,
+                    categories=analysis.categories,
+                )
+
+        def trace() -> None:
+            for analysis in analyses:
+                disp_logic.build_trace(**analysis.trace_kwargs())
+
+        def prompt_build() -> None:
+            for analysis in analyses:
+                disp_logic.draft_client_answer(**analysis.answer_kwargs())
+
+        def pipeline() -> None:
+            for text, first in corpus:
+                analysis = disp_logic.analyze_message(text=text, is_first_message=first)
+                disp_logic.build_trace(**analysis.trace_kwargs())
+                draft = disp_logic.draft_client_answer(**analysis.answer_kwargs())
+                disp_logic.finish_client_answer(draft, STUB_ANSWER)
+
+        runners = {name: fn for name, fn in locals().items() if name in STAGES}
+        for name in stages:
+            micros = time_per_call(runners[name], len(corpus), repeat)
+            results[name] = {"us_per_op": micros, "ops_per_s": 1e6 / micros if micros else 0.0}
+    return results
+
+
+def bench_load(categories_dir: Path, repeat: int = 3) -> Tuple[KnowledgeSnapshot, StageResult]:
+    """Build a snapshot from the JSON files (no artifact) and time it, in µs.
+
+    Large bases take seconds to compile, so extra runs are made only while
+    a single build stays under a second.
+    """
+
+    snapshot = None
+    best = float("inf")
+    for attempt in range(max(repeat, 1)):
+        started = time.perf_counter_ns()
+        snapshot = build_snapshot(categories_dir, artifact_dir=None)
+        elapsed = time.perf_counter_ns() - started
+        best = min(best, elapsed)
+        if elapsed > 1e9:
+            break
+    micros = best / 1000
+    return snapshot, {"us_per_op": micros, "ops_per_s": 1e6 / micros if micros else 0.0}
+
+
+def run_suite(
+    knowledge_dirs: Dict[str, Path],
+    messages: int = 1000,
+    repeat: int = 5,
+    seed: int = 0,
+    stages: Optional[Sequence[str]] = None,
+) -> Dict[str, Dict[str, StageResult]]:
+    """Benchmark every knowledge base: ``{kb_name: {stage: result}}``.
+
+    The directories are compiled from JSON, never from an artifact.
+    """
+
+    suite: Dict[str, Dict[str, StageResult]] = {}
+    for name, categories_dir in knowledge_dirs.items():
+        snapshot, load = bench_load(categories_dir, repeat=min(repeat, 3))
+        corpus = generate_corpus(snapshot.data, messages, seed=seed)
+        results = bench_stages(snapshot, corpus, repeat=repeat, stages=stages or STAGES)
+        results["load"] = load
+        suite[name] = results
+    return suite
+
+
+def stage_names(suite: Dict[str, Dict[str, StageResult]]) -> List[str]:
+    names: List[str] = []
+    for results in suite.values():
+        names.extend(name for name in results if name not in names)
+    return names
@@ -0,0 +1,92 @@
+"""Synthetic knowledge bases of a chosen size for benchmarks.
+
+Every generated category file follows the ``CategoryData`` schema of
+:mod:`omnidisp.app.knowledge.loader`; keywords are pronounceable
+pseudo-Russian phrases, so the matcher sees realistic alphabet, word
+lengths and shared prefixes without copying the real catalogue.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+from pathlib import Path
+from typing import Dict, List, Set
+
+_ONSETS = "б в г д ж з к л м н п р с т ф х ц ч ш щ бр вл гр др кл кр пл пр ст тр".split()
+_VOWELS = "а е и о у ы я ю э".split()
+_CODAS = ["", "", "", "н", "р", "л", "к", "т", "с", "й"]
+_ENDINGS = ["", "а", "ы", "ок", "ка", "ник", "ость", "ение"]
+
+
+def _word(rng: random.Random) -> str:
+    syllables = rng.randint(2, 4)
+    word = "".join(
+        rng.choice(_ONSETS) + rng.choice(_VOWELS) + rng.choice(_CODAS) for _ in range(syllables)
+    )
+    return word + rng.choice(_ENDINGS)
+
+
+def _phrase(rng: random.Random, max_words: int = 3) -> str:
+    return " ".join(_word(rng) for _ in range(rng.randint(1, max_words)))
+
+
+def synthetic_category(
+    code: str, keywords: int, rng: random.Random, taken: Set[str]
+) -> Dict[str, object]:
+    """One ``CategoryData`` dict with ``keywords`` unique keyword phrases."""
+
+    keyword_list: List[str] = []
+    while len(keyword_list) < keywords:
+        phrase = _phrase(rng)
+        if phrase not in taken:
+            taken.add(phrase)
+            keyword_list.append(phrase)
+
+    stop_phrases = [_phrase(rng, 4).capitalize() for _ in range(max(keywords // 20, 3))]
+    symptoms = [
+        {
+            "symptom": f"{code}_symptom_{number}",
+            "example_phrases": rng.sample(keyword_list, min(3, len(keyword_list))),
+            "clarify_question": f"{_phrase(rng).capitalize()}?",
+        }
+        for number in range(max(keywords // 50, 2))
+    ]
+    jobs = [
+        {
+            "id": f"{code}_job_{number}",
+            "title": _phrase(rng).capitalize(),
+            "price_work_from": rng.randrange(500, 10000, 100),
+            "price_parts_from": rng.randrange(0, 5000, 100),
+        }
+        for number in range(max(keywords // 100, 2))
+    ]
+    return {
+        "category": code,
+        "title": _phrase(rng, 2).capitalize(),
+        "keywords": keyword_list,
+        "stop_phrases": stop_phrases,
+        "symptoms": symptoms,
+        "clarifying_questions": [f"{_phrase(rng).capitalize()}?" for _ in range(3)],
+        "jobs": jobs,
+    }
+
+
+def write_synthetic_knowledge(
+    target_dir: Path, keywords_per_category: int, categories: int = 16, seed: int = 0
+) -> Path:
+    """Write ``categories`` JSON files into ``target_dir`` and return it."""
+
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for stale in target_dir.glob("*.json"):
+        stale.unlink()
+
+    rng = random.Random(f"{seed}:{keywords_per_category}:{categories}")
+    taken: Set[str] = set()
+    for number in range(categories):
+        code = f"synthetic_{number:02d}"
+        data = synthetic_category(code, keywords_per_category, rng, taken)
+        (target_dir / f"{code}.json").write_text(
+            json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8"
+        )
+    return target_dir
@@ -5,6 +5,127 @@ GROQ_API_URL: str = "https://api.groq.com/openai/v1/chat/completions"
 GROQ_MODEL: str = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant")
 GROQ_API_KEY: str = os.environ.get("GROQ_API_KEY", "")
 GROQ_TIMEOUT: int = int(os.environ.get("GROQ_TIMEOUT", "20"))
+# Пул keep-alive соединений к API: размер и отдельные таймауты соединения и чтения.
+GROQ_POOL_SIZE: int = int(os.environ.get("GROQ_POOL_SIZE", "10"))
+GROQ_CONNECT_TIMEOUT: float = float(os.environ.get("GROQ_CONNECT_TIMEOUT", "3.05"))
+GROQ_READ_TIMEOUT: float = float(os.environ.get("GROQ_READ_TIMEOUT", str(GROQ_TIMEOUT)))
+# Не больше стольких запросов в минуту к GROQ_API_URL (свой счётчик клиента); 0 — без ограничения.
+GROQ_RPM: float = float(os.environ.get("GROQ_RPM", "0"))
+
+# Пул бэкендов модели (ключи, модели, адреса) — JSON-список, формат в llm/backend_pool.py.
+# Запрос уходит бэкенду с наибольшим запасом по лимитам, при 429 — следующему.
+# Пустая строка — один бэкенд из GROQ_API_URL, GROQ_API_KEY и GROQ_MODEL.
+LLM_BACKENDS: str = os.environ.get("LLM_BACKENDS", "")
+
+# Бюджет (приблизительно, в токенах) на PLAN в сообщении модели; 0 — без ограничения.
+LLM_PROMPT_MAX_TOKENS: int = int(os.environ.get("LLM_PROMPT_MAX_TOKENS", "400"))
+
+# Кэш ответов модели по нормализованному плану ответа (по умолчанию выключен).
+LLM_CACHE_ENABLED: bool = os.environ.get("LLM_CACHE_ENABLED", "0") == "1"
+LLM_CACHE_MAX_SIZE: int = int(os.environ.get("LLM_CACHE_MAX_SIZE", "2048"))
+LLM_CACHE_TTL: float = float(os.environ.get("LLM_CACHE_TTL", "600"))
+# Типы плана (full_refuse, partial_refuse, allowed) через запятую, которые не кэшируем.
+LLM_CACHE_SKIP_PLAN_TYPES: frozenset = frozenset(
+    item.strip()
+    for item in os.environ.get("LLM_CACHE_SKIP_PLAN_TYPES", "").split(",")
+    if item.strip()
+)
+
+# Бюджет времени (секунд) на обработку одного HTTP-запроса: ожидание модели обрезается
+# до оставшегося времени, просроченный запрос к модели не отправляется; 0 — без бюджета.
+DISP_REQUEST_DEADLINE: float = float(os.environ.get("DISP_REQUEST_DEADLINE", "10"))
+
+# Предохранитель: после N ошибок модели подряд запросы к ней сразу отклоняются,
+# через RESET_TIMEOUT секунд пропускается пробный запрос (HALF_OPEN_PROBES штук).
+LLM_CIRCUIT_ENABLED: bool = os.environ.get("LLM_CIRCUIT_ENABLED", "1") == "1"
+LLM_CIRCUIT_FAILURE_THRESHOLD: int = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RESET_TIMEOUT: float = float(os.environ.get("LLM_CIRCUIT_RESET_TIMEOUT", "30"))
+LLM_CIRCUIT_HALF_OPEN_PROBES: int = int(os.environ.get("LLM_CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+# Отвечать по шаблонам из базы знаний (answer_templates), не обращаясь к модели, когда шаблон есть.
+ANSWER_TEMPLATES_ENABLED: bool = os.environ.get("ANSWER_TEMPLATES_ENABLED", "1") == "1"
+
+# Склейка одинаковых одновременных запросов к модели в один.
+LLM_SINGLE_FLIGHT_ENABLED: bool = os.environ.get("LLM_SINGLE_FLIGHT_ENABLED", "1") == "1"
+LLM_SINGLE_FLIGHT_MAX_WAITERS: int = int(os.environ.get("LLM_SINGLE_FLIGHT_MAX_WAITERS", "100"))
+LLM_SINGLE_FLIGHT_TIMEOUT: float = float(
+    os.environ.get("LLM_SINGLE_FLIGHT_TIMEOUT", str(GROQ_TIMEOUT + 5))
+)
+
+# Пакетная обработка (/api/disp/batch): одновременных запросов к модели и максимум сообщений.
+LLM_BATCH_CONCURRENCY: int = int(os.environ.get("LLM_BATCH_CONCURRENCY", "8"))
+DISP_BATCH_MAX_MESSAGES: int = int(os.environ.get("DISP_BATCH_MAX_MESSAGES", "10000"))
+
+# Метрики этапов обработки и ошибок модели (/metrics); 0 — не собирать.
+METRICS_ENABLED: bool = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+# Настройки базы знаний
+# Как часто (в секундах) проверять изменение JSON-файлов категорий; 0 — не проверять.
+KNOWLEDGE_RELOAD_INTERVAL: float = float(os.environ.get("KNOWLEDGE_RELOAD_INTERVAL", "5"))
+
+# Искать ключевые слова и стоп-фразы и в других словоформах (по основам слов); 0 — только точно.
+KNOWLEDGE_MORPHOLOGY: bool = os.environ.get("KNOWLEDGE_MORPHOLOGY", "1") == "1"
+
+# Исправлять опечатки в словах ключевых фраз, если категория не нашлась ни точно, ни по основам.
+KNOWLEDGE_FUZZY: bool = os.environ.get("KNOWLEDGE_FUZZY", "1") == "1"
+# Наибольшее число правок в слове (для слов короче 8 букв — не больше одной).
+KNOWLEDGE_FUZZY_MAX_DISTANCE: int = int(os.environ.get("KNOWLEDGE_FUZZY_MAX_DISTANCE", "2"))
+# Сколько миллисекунд на сообщение можно потратить на поиск исправлений.
+KNOWLEDGE_FUZZY_BUDGET_MS: float = float(os.environ.get("KNOWLEDGE_FUZZY_BUDGET_MS", "5"))
+
+# Каталог для скомпилированного артефакта базы знаний; пустая строка — не использовать.
+KNOWLEDGE_ARTIFACT_DIR: str = os.environ.get(
+    "KNOWLEDGE_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "var", "knowledge"),
+)
+
+# Состояние диалогов: memory (в процессе) или sqlite (общий файл для всех воркеров хоста).
+CONVERSATION_STORE: str = os.environ.get("CONVERSATION_STORE", "memory")
+CONVERSATION_DB_PATH: str = os.environ.get(
+    "CONVERSATION_DB_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "var", "conversations.sqlite3"
+    ),
+)
+# Диалог без сообщений дольше TTL (секунд) считается новым и забывается.
+CONVERSATION_TTL: float = float(os.environ.get("CONVERSATION_TTL", str(7 * 24 * 3600)))
+CONVERSATION_MAX_CHATS: int = int(os.environ.get("CONVERSATION_MAX_CHATS", "100000"))
+# Как часто (в секундах) sqlite-хранилище записывает накопленные шаг и категорию.
+CONVERSATION_FLUSH_INTERVAL: float = float(os.environ.get("CONVERSATION_FLUSH_INTERVAL", "1.0"))
+
+# Журнал обработанных сообщений (JSONL, по записи на сообщение); в run_prod.sh включён.
+REQUEST_LOG_ENABLED: bool = os.environ.get("REQUEST_LOG_ENABLED", "0") == "1"
+REQUEST_LOG_DIR: str = os.environ.get(
+    "REQUEST_LOG_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs"),
+)
+# Ротация файла журнала: по размеру (байт) и по возрасту (секунд); сколько старых файлов хранить.
+REQUEST_LOG_MAX_BYTES: int = int(os.environ.get("REQUEST_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+REQUEST_LOG_ROTATE_INTERVAL: float = float(
+    os.environ.get("REQUEST_LOG_ROTATE_INTERVAL", str(24 * 3600))
+)
+REQUEST_LOG_BACKUP_COUNT: int = int(os.environ.get("REQUEST_LOG_BACKUP_COUNT", "20"))
+# Сколько записей может ждать записи на диск; лишние отбрасываются, а не задерживают ответ.
+REQUEST_LOG_QUEUE_SIZE: int = int(os.environ.get("REQUEST_LOG_QUEUE_SIZE", "10000"))
+# Писать ли в журнал текст сообщения (без него журнал нельзя проиграть через bench.replay).
+REQUEST_LOG_INCLUDE_TEXT: bool = os.environ.get("REQUEST_LOG_INCLUDE_TEXT", "1") == "1"
+
+# Продовый сервер (gunicorn.conf.py): адрес, число процессов-воркеров и потоков в каждом.
+SERVER_BIND: str = os.environ.get("SERVER_BIND", "0.0.0.0:8000")
+SERVER_WORKERS: int = int(os.environ.get("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_THREADS: int = int(os.environ.get("SERVER_THREADS", "8"))
+# gthread — для main:app; для asgi:app — uvicorn.workers.UvicornWorker.
+SERVER_WORKER_CLASS: str = os.environ.get("SERVER_WORKER_CLASS", "gthread")
+# Воркер перезапускается после стольких запросов (плюс случайно до JITTER); 0 — никогда.
+SERVER_MAX_REQUESTS: int = int(os.environ.get("SERVER_MAX_REQUESTS", "5000"))
+SERVER_MAX_REQUESTS_JITTER: int = int(os.environ.get("SERVER_MAX_REQUESTS_JITTER", "500"))
+# Сколько секунд воркер может не отвечать master до перезапуска и сколько секунд
+# при остановке или перезагрузке даётся на завершение начатых запросов.
+SERVER_TIMEOUT: int = int(os.environ.get("SERVER_TIMEOUT", "60"))
+SERVER_GRACEFUL_TIMEOUT: int = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30"))
+
+# Токен для служебных эндпоинтов (/admin/...); пустой — эндпоинты выключены.
+ADMIN_TOKEN: str = os.environ.get("OMNIDISP_ADMIN_TOKEN", "")
 
 # Настройки телеграм-бота
 # Берём токен из любой из переменных окружения, какая есть.
@@ -15,3 +136,14 @@ TELEGRAM_BOT_TOKEN: str = (
 
 # Для совместимости, если где-то в коде будет старое имя:
 TELEGRAM_BOT_API_KEY: str = TELEGRAM_BOT_TOKEN
+
+# Отправлять ли в чат INTERNAL TRACE вместе с ответом (для отладки); 0 — только ответ клиенту.
+TELEGRAM_SEND_TRACE: bool = os.environ.get("TELEGRAM_SEND_TRACE", "1") == "1"
+
+# Очередь исходящих сообщений в Telegram
+TELEGRAM_SEND_WORKERS: int = int(os.environ.get("TELEGRAM_SEND_WORKERS", "2"))
+TELEGRAM_QUEUE_SIZE: int = int(os.environ.get("TELEGRAM_QUEUE_SIZE", "1000"))
+TELEGRAM_MAX_RETRIES: int = int(os.environ.get("TELEGRAM_MAX_RETRIES", "5"))
+# Не чаще одного сообщения в чат за столько секунд и не больше N сообщений в секунду всего.
+TELEGRAM_CHAT_INTERVAL: float = float(os.environ.get("TELEGRAM_CHAT_INTERVAL", "1.0"))
+TELEGRAM_GLOBAL_RATE: float = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30"))
@@ -0,0 +1,129 @@
+"""Validate category JSON files and compile the knowledge artifact.
+
+Usage::
+
+    python -m omnidisp.scripts.compile_knowledge [--categories-dir DIR]
+        [--artifact-dir DIR] [--check] [--report-redundant]
+
+Exits with code 1 if any category file does not match the ``CategoryData``
+schema. Workers build the same artifact automatically at startup; running
+this step in CI or before a deploy catches broken files early and lets new
+workers start from a ready artifact.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from omnidisp.app.knowledge import artifact
+from omnidisp.app.knowledge.loader import (
+    DEFAULT_CATEGORIES_DIR,
+    build_snapshot,
+    validate_category_data,
+)
+from omnidisp.app.knowledge.token_index import redundant_phrases
+from omnidisp.app.utils.text_normalizer import normalize_text
+from omnidisp.config.settings import KNOWLEDGE_ARTIFACT_DIR
+
+
+def validate_categories(categories_dir: Path) -> List[str]:
+    """Return schema problems of every ``*.json`` file in ``categories_dir``."""
+
+    problems: List[str] = []
+    for path in sorted(categories_dir.glob("*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as exc:
+            problems.append(f"{path.name}: cannot read JSON ({exc})")
+            continue
+
+        problems.extend(f"{path.name}: {error}" for error in validate_category_data(data))
+        declared = data.get("category") if isinstance(data, dict) else None
+        if isinstance(declared, str) and declared != path.stem:
+            problems.append(
+                f"{path.name}: category '{declared}' does not match file name"
+            )
+    return problems
+
+
+def report_redundant(categories_dir: Path) -> List[str]:
+    """Keywords and stop phrases that only repeat an earlier one in another word form.
+
+    With morphology enabled such entries never change the result and can be
+    removed from the JSON files.
+    """
+
+    lines: List[str] = []
+    for path in sorted(categories_dir.glob("*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+            continue
+        if not isinstance(data, dict):
+            continue
+        for field in ("keywords", "stop_phrases"):
+            phrases = [
+                normalize_text(phrase)
+                for phrase in data.get(field) or []
+                if isinstance(phrase, str) and phrase.strip()
+            ]
+            for phrase, earlier in redundant_phrases(phrases):
+                lines.append(f"{path.name}: {field}: '{phrase}' repeats '{earlier}'")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--categories-dir", type=Path, default=DEFAULT_CATEGORIES_DIR)
+    parser.add_argument(
+        "--artifact-dir",
+        type=Path,
+        default=Path(KNOWLEDGE_ARTIFACT_DIR) if KNOWLEDGE_ARTIFACT_DIR else None,
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="only validate, do not write the artifact"
+    )
+    parser.add_argument(
+        "--report-redundant",
+        action="store_true",
+        help="list phrases that differ from an earlier one only by inflection",
+    )
+    args = parser.parse_args(argv)
+
+    problems = validate_categories(args.categories_dir)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if problems:
+        print(f"{len(problems)} problem(s) found", file=sys.stderr)
+        return 1
+    if args.report_redundant:
+        for line in report_redundant(args.categories_dir):
+            print(line)
+    if args.check:
+        print("knowledge base is valid")
+        return 0
+    if args.artifact_dir is None:
+        print("KNOWLEDGE_ARTIFACT_DIR is empty, nothing to write", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    snapshot = build_snapshot(args.categories_dir, args.artifact_dir)
+    path = artifact.artifact_path(
+        args.artifact_dir, args.categories_dir, snapshot.content_hash
+    )
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(
+        f"compiled {len(snapshot.data)} categories, "
+        f"{len(snapshot.keyword_to_category)} keywords, "
+        f"{len(snapshot.forbidden_tasks)} stop phrases -> {path} ({elapsed_ms:.1f} ms)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,28 @@
 #!/usr/bin/env bash
+# Продовый запуск: gunicorn, несколько процессов-воркеров с потоками (настройки
+# SERVER_* в omnidisp/config/settings.py, хуки — в gunicorn.conf.py).
+# Перезагрузка без простоя: kill -HUP <pid master>; остановка: kill -TERM.
+# ASGI-вариант: SERVER_WORKER_CLASS=uvicorn.workers.UvicornWorker OMNIDISP_APP=asgi:app
 
 # export GROQ_API_KEY="YOUR_GROQ_API_KEY_HERE"
 # export TELEGRAM_BOT_TOKEN="YOUR_TELEGRAM_BOT_TOKEN_HERE"
+
+set -euo pipefail
+
+cd "$(dirname "$0")/../.."
+
+# Базу знаний перечитывает master по SIGHUP; свои копии в воркерах не нужны.
+# POST /admin/knowledge/reload в воркере тоже просто шлёт SIGHUP master.
+export KNOWLEDGE_RELOAD_INTERVAL="${KNOWLEDGE_RELOAD_INTERVAL:-0}"
+# Сообщения одного чата попадают в разные воркеры: состояние диалогов — в общем sqlite.
+export CONVERSATION_STORE="${CONVERSATION_STORE:-sqlite}"
+# TELEGRAM_GLOBAL_RATE задаётся на весь бот и делится между SERVER_WORKERS воркерами.
+# /metrics отдаёт счётчики только того воркера, который ответил на запрос (у каждого
+# свои, после перезапуска воркера — с нуля); общих по серверу счётчиков нет.
+# Журнал обработанных сообщений: omnidisp/logs/requests-<pid воркера>.jsonl.
+export REQUEST_LOG_ENABLED="${REQUEST_LOG_ENABLED:-1}"
+
+# Битые файлы категорий остановят деплой здесь, а воркеры стартуют с готового артефакта.
+python -m omnidisp.scripts.compile_knowledge
+
+exec gunicorn --config gunicorn.conf.py "${OMNIDISP_APP:-main:app}"